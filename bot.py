@@ -2,27 +2,54 @@ import os
 import sys
 import asyncio
 import logging
-import subprocess
-import zipfile
+import multiprocessing
+import shutil
 import re
-import sqlite3
+import time
 from pathlib import Path
-from datetime import datetime
-from typing import List, Dict
-import aiofiles
+from datetime import datetime, timezone
+from typing import Dict
+from concurrent.futures import ProcessPoolExecutor
 from telegram import (
     Update, InlineKeyboardButton, InlineKeyboardMarkup,
-    KeyboardButton, ReplyKeyboardMarkup, ParseMode
+    KeyboardButton, ReplyKeyboardMarkup
 )
+from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
     ContextTypes, ConversationHandler, filters
 )
+from database import Database, AsyncDatabase
+from supervisor import ProcessSupervisor, make_runtime
+from log_reader import fit_message, DEFAULT_TAIL_LINES, MAX_TAIL_LINES
+from log_store import BotLogStore
+from log_follow import LogFollower, FollowRegistry
+from metrics import MetricsCollector, Sample
+from timeseries import sparkline
+from broadcast import BroadcastEngine
+from webhook import WEBHOOK_URL, allowed_updates, serve_webhook
+from dispatch import OrderedUpdateProcessor
+from cluster import ClusterManager
+from scheduler import Migration, Scheduler
+from deps import DependencyCache, InstallQueue, InstallError
+from imports import resolve_requirements, IMPORT_TO_DIST
+from validator import SyntaxValidator, ValidationCache, NodeSyntaxChecker, VALIDATION_WORKERS
+from ingest import UploadRejected, MAX_SOURCE_BYTES, check_declared_size, download, extract_archive, find_entry_point
 
 # ----------------- CONFIG -----------------
 BOT_TOKEN = os.getenv("BOT_TOKEN", "8214091166:AAEi8sAp-K7gMzix7ralzsVFpn8hJPjJK5U")
 ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "8525952693").split(",")]
 DB_PATH = "bot_hosting.db"
+# Point at a local Bot API server (or a fake one in tests) instead of api.telegram.org
+BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org").rstrip("/")
+# "process" runs bots as child processes, "docker" gives each bot its own container
+BOT_RUNTIME = os.getenv("BOT_RUNTIME", "process")
+# Seconds without CPU or outbound traffic before a bot is hibernated; 0 keeps every bot up
+HIBERNATE_AFTER = int(os.getenv("HIBERNATE_AFTER", str(6 * 3600)))
+# Premium bots stay up however idle they are, unless this is set
+HIBERNATE_PREMIUM = os.getenv("HIBERNATE_PREMIUM", "0") == "1"
+HIBERNATE_CHECK_INTERVAL = 60
 
 # ----------------- LOGGING -----------------
 logging.basicConfig(
@@ -30,83 +57,235 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ----------------- DATABASE WRAPPER -----------------
-class Database:
-    def __init__(self, path):
-        self.conn = sqlite3.connect(path, check_same_thread=False)
-        self.conn.execute('''CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY, username TEXT, name TEXT,
-            joined TEXT, banned INTEGER DEFAULT 0, total_bots INTEGER DEFAULT 0,
-            premium INTEGER DEFAULT 0
-        )''')
-        self.conn.execute('''CREATE TABLE IF NOT EXISTS bots (
-            bot_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, name TEXT,
-            bot_type TEXT, file_path TEXT, container_id TEXT, status TEXT
-        )''')
-        self.conn.commit()
-
-    def add_user(self, user_id, username, name):
-        joined = str(datetime.now())
-        self.conn.execute('INSERT OR IGNORE INTO users(user_id, username, name, joined) VALUES (?,?,?,?)',
-                          (user_id, username, name, joined))
-        self.conn.commit()
-
-    def get_user(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE user_id=?', (user_id,))
-        return cursor.fetchone()
-
-    def add_bot(self, user_id, name, bot_type, file_path):
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO bots(user_id,name,bot_type,file_path,status) VALUES (?,?,?,?,?)',
-                       (user_id, name, bot_type, file_path, "stopped"))
-        bot_id = cursor.lastrowid
-        self.conn.commit()
-        return bot_id
-
-    def get_bot(self, bot_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM bots WHERE bot_id=?', (bot_id,))
-        return cursor.fetchone()
-
-    def get_user_bots(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM bots WHERE user_id=?', (user_id,))
-        return cursor.fetchall()
-
-db = Database(DB_PATH)
+# ----------------- DATABASE -----------------
+db = AsyncDatabase(Database(DB_PATH))
 
 # ----------------- BOT MANAGER -----------------
+def parse_wake_times(text:str):
+    # "08:00,20:30" -> the same, normalised; None if any time is malformed
+    times = []
+    for spec in text.split(","):
+        match = re.fullmatch(r'(\d{1,2}):(\d{2})', spec.strip())
+        if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+            return None
+        times.append(f"{int(match.group(1)):02d}:{match.group(2)}")
+    return ",".join(sorted(set(times)))
+
+def wake_due(wake_at:str, since:datetime, now:datetime) -> bool:
+    # Whether one of the HH:MM (UTC) times falls in (since, now]
+    for spec in wake_at.split(","):
+        hour, minute = map(int, spec.split(":"))
+        for day in {since.date(), now.date()}:
+            at = datetime(day.year, day.month, day.day, hour, minute, tzinfo=timezone.utc)
+            if since < at <= now:
+                return True
+    return False
+
 class BotManager:
+    """Starts and stops hosted bots: here, or on the worker node the scheduler picks when clustered."""
+
     def __init__(self):
         self.bots_dir = Path("hosted_bots")
         self.bots_dir.mkdir(exist_ok=True)
+        self.supervisor = ProcessSupervisor(on_status=self._on_status, runtime=make_runtime(BOT_RUNTIME))
+        self.log_stores: Dict[int, BotLogStore] = {}
+        self.cluster = ClusterManager(db, on_status=self._on_status, on_metrics=self._on_metrics)
+        self.cluster.on_change = self.rebalance
+        self.scheduler = Scheduler(self.cluster, history=self._history)
+        self.scheduler.on_migrate = self.migrate
+        self._rebalance_lock = asyncio.Lock()
+        self._hibernator = None
 
     async def create_bot_environment(self, user_id:int, bot_id:int, bot_type:str):
         bot_dir = self.bots_dir / f"user_{user_id}" / f"bot_{bot_id}"
         bot_dir.mkdir(parents=True, exist_ok=True)
         return bot_dir
 
-    async def start_bot(self, bot_id:int):
-        bot = db.get_bot(bot_id)
+    def log_store(self, bot, premium:bool=None) -> BotLogStore:
+        store = self.log_stores.get(bot[0])
+        if store is None:
+            store = self.log_stores[bot[0]] = BotLogStore(Path(bot[4]).parent)
+        if premium is not None:
+            store.premium = premium
+        if bot[12] and not self.supervisor.is_running(bot[0]):
+            # Written by a worker node; pick up segments it rotated since the last read
+            store.refresh()
+        return store
+
+    async def _on_status(self, bot_id:int, status:str):
+        if status not in ("running", "restarting"):
+            self.scheduler.release(bot_id)
+        await db.update_bot_status(bot_id, status)
+
+    def _on_metrics(self, bot_id:int, cpu:float, memory:float, uptime:int, net:int=None):
+        metrics.ingest(bot_id, Sample(time.time(), cpu, memory, uptime, net))
+
+    def _history(self, bot_id:int, since:float):
+        return metrics.timeseries.query(bot_id, since)
+
+    async def _premium(self, bot) -> bool:
+        owner = await db.get_user(bot[1])
+        return bool(owner and owner[6])
+
+    async def start_bot(self, bot_id:int, node_id:str=None):
+        bot = await db.get_bot(bot_id)
         if not bot: return {"success": False, "message":"Bot not found"}
-        db.conn.execute('UPDATE bots SET status=? WHERE bot_id=?', ("running", bot_id))
-        db.conn.commit()
-        return {"success": True, "message": "Bot started"}
-
-    async def stop_bot(self, bot_id:int):
-        bot = db.get_bot(bot_id)
+        premium = await self._premium(bot)
+        node = self.scheduler.place(bot, premium, node_id)
+        if node:
+            # Placement is recorded first so the node's next heartbeat already counts it as ours
+            await db.set_bot_node(bot_id, node.node_id)
+            result = await self.cluster.start_bot(node, bot_id, bot[3], bot[4], premium)
+            if result["success"]:
+                metrics.reset_idle(bot_id)
+                await db.update_bot_status(bot_id, "running")
+            else:
+                self.scheduler.release(bot_id)
+            return result
+        if bot[12]:
+            await db.set_bot_node(bot_id, None)
+        store = self.log_store(bot, premium=premium)
+        result = await self.supervisor.start(bot_id, bot[3], bot[4], log_store=store, premium=premium)
+        if result["success"]:
+            metrics.reset_idle(bot_id)
+            proc = self.supervisor.processes.get(bot_id)
+            await db.update_bot_status(bot_id, "running", proc.container_id if proc else None)
+        return result
+
+    async def stop_bot(self, bot_id:int, status:str="stopped"):
+        bot = await db.get_bot(bot_id)
         if not bot: return {"success": False, "message":"Bot not found"}
-        db.conn.execute('UPDATE bots SET status=? WHERE bot_id=?', ("stopped", bot_id))
-        db.conn.commit()
-        return {"success": True, "message": "Bot stopped"}
+        if bot[12]:
+            result = await self.cluster.stop_bot(bot[12], bot_id)
+            if not result["success"]:
+                return result
+        else:
+            result = await self.supervisor.stop(bot_id)
+        self.scheduler.release(bot_id)
+        await db.update_bot_status(bot_id, status)
+        return result
+
+    async def rebalance(self):
+        # Only the bots whose node went away or lost them, plus (when hashing) those whose owner changed
+        async with self._rebalance_lock:
+            bots = await db.get_bots_by_status("running", "restarting")
+            moves = [bot for bot in bots if self.scheduler.needs_move(bot)]
+            if not moves:
+                return
+            logger.info(f"Rebalancing {len(moves)} of {len(bots)} running bots")
+            await asyncio.gather(*(self._move(bot) for bot in moves))
+
+    async def _move(self, bot):
+        bot_id, node_id = bot[0], bot[12]
+        if node_id and not self.cluster.lost(bot):
+            await self.cluster.stop_bot(node_id, bot_id)
+        elif not node_id:
+            await self.supervisor.stop(bot_id)
+        result = await self.start_bot(bot_id)
+        if not result["success"]:
+            logger.error(f"Moving bot {bot_id} failed: {result['message']}")
+            await db.update_bot_status(bot_id, "crashed")
+
+    async def migrate(self, migration:Migration):
+        # Bots hold no state the platform could carry over, so a migration is a restart elsewhere
+        async with self._rebalance_lock:
+            bot = await db.get_bot(migration.bot_id)
+            if not bot or bot[6] != "running" or bot[12] != migration.source:
+                return
+            logger.info(f"Migrating bot {bot[0]} from {migration.source} to {migration.target}")
+            result = await self.cluster.stop_bot(migration.source, bot[0])
+            if result["success"]:
+                result = await self.start_bot(bot[0], migration.target)
+            if not result["success"]:
+                logger.error(f"Migrating bot {bot[0]} failed: {result['message']}")
+                await db.update_bot_status(bot[0], "crashed")
+
+    def forget_bot(self, bot_id:int):
+        store = self.log_stores.pop(bot_id, None)
+        if store:
+            store.close()
+
+    async def restart_bot(self, bot_id:int):
+        # stop_bot only returns once the old process has exited, so no fixed delay is needed
+        stop_result = await self.stop_bot(bot_id)
+        if not stop_result["success"]:
+            return stop_result
+        return await self.start_bot(bot_id)
+
+    # ----------------- HIBERNATION -----------------
+    async def hibernate_idle(self):
+        # Files, installed modules and the node placement stay, so waking is a plain start
+        if not HIBERNATE_AFTER:
+            return
+        for bot in await db.get_bots_by_status("running"):
+            idle = metrics.idle_for(bot[0])
+            if idle is None or idle < HIBERNATE_AFTER:
+                continue
+            if not HIBERNATE_PREMIUM and await self._premium(bot):
+                continue
+            result = await self.stop_bot(bot[0], status="hibernated")
+            if result["success"]:
+                logger.info(f"Bot {bot[0]} hibernated after {idle / 3600:.1f}h idle")
+
+    async def wake_scheduled(self, since:datetime, now:datetime):
+        for bot in await db.get_bots_by_status("hibernated"):
+            if bot[13] and wake_due(bot[13], since, now):
+                result = await self.start_bot(bot[0])
+                if result["success"]:
+                    logger.info(f"Bot {bot[0]} woken on schedule")
+                else:
+                    logger.error(f"Waking bot {bot[0]} failed: {result['message']}")
+
+    async def _hibernation_loop(self):
+        checked = datetime.now(timezone.utc)
+        while True:
+            await asyncio.sleep(HIBERNATE_CHECK_INTERVAL)
+            now = datetime.now(timezone.utc)
+            try:
+                await self.wake_scheduled(checked, now)
+                await self.hibernate_idle()
+            except Exception as e:
+                logger.error(f"Hibernation pass failed: {e}")
+            checked = now
+
+    async def startup(self):
+        await self.supervisor.startup()
+        await self.cluster.start()
+        self._hibernator = asyncio.create_task(self._hibernation_loop())
+        if self.scheduler.active:
+            # Bots already on workers hold their share of capacity from the start
+            for bot in await db.get_bots_by_status("running", "restarting"):
+                if bot[12]:
+                    self.scheduler.reserve(bot[0], bot[12], self.scheduler.demand(bot), await self._premium(bot))
+            self.scheduler.start()
+
+    async def resume_bots(self):
+        # Relaunch everything that was running when the platform went down. Bots on
+        # worker nodes kept running there; a node that doesn't come back times out and
+        # its bots are moved then.
+        bots = await db.get_bots_by_status("running", "restarting")
+        await asyncio.gather(*(self.start_bot(bot[0]) for bot in bots
+                               if not (bot[12] and self.cluster.enabled)))
+
+    async def shutdown(self):
+        if self._hibernator:
+            self._hibernator.cancel()
+            await asyncio.gather(self._hibernator, return_exceptions=True)
+        await self.scheduler.stop()
+        await self.cluster.stop()
+        await self.supervisor.shutdown()
 
 bot_manager = BotManager()
+metrics = MetricsCollector(bot_manager.supervisor, db)
+dependency_cache = DependencyCache()
+install_queue = InstallQueue(dependency_cache)
+broadcasts = BroadcastEngine(db)
+update_processor = OrderedUpdateProcessor()
 
 # ----------------- TELEGRAM COMMANDS -----------------
 async def start(update:Update, context:ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.add_user(user.id, user.username, user.first_name)
+    await db.add_user(user.id, user.username, user.first_name)
     keyboard = [
         [KeyboardButton("🚀 Upload Bot"), KeyboardButton("📊 My Bots")],
         [KeyboardButton("📱 Help"), KeyboardButton("💎 Premium")],
@@ -125,74 +304,20 @@ async def menu(update:Update, context:ContextTypes.DEFAULT_TYPE):
 ▶️ /start_bot <id>
 ⏸ /stop_bot <id>
 🔄 /restart_bot <id>
-📝 /logs <id>
-📈 /stats <id>
+📝 /logs <id> [lines] [period] [filter]
+📡 /follow <id>
+📈 /stats <id> [period]
+⏰ /wake_at <id> HH:MM
 🔧 /install <id> <module>
+🛑 /cancel_install <id>
 💎 /premium
 👤 /profile
 📩 /support
 """
     await update.message.reply_text(text)
 # ----------------- SYNTAX VALIDATOR -----------------
-import ast
-
-class SyntaxValidator:
-    @staticmethod
-    def validate_python(code: str) -> Dict[str, any]:
-        try:
-            ast.parse(code)
-            return {"valid": True, "errors": []}
-        except SyntaxError as e:
-            return {
-                "valid": False,
-                "errors": [{
-                    "line": e.lineno,
-                    "offset": e.offset,
-                    "message": e.msg,
-                    "text": e.text
-                }]
-            }
-
-    @staticmethod
-    def validate_javascript(code: str) -> Dict[str, any]:
-        try:
-            temp_file = "temp_validation.js"
-            with open(temp_file, 'w') as f:
-                f.write(code)
-            result = subprocess.run(
-                ['node', '--check', temp_file],
-                capture_output=True, text=True, timeout=5
-            )
-            os.remove(temp_file)
-            if result.returncode == 0:
-                return {"valid": True, "errors": []}
-            else:
-                return {"valid": False, "errors": [{"message": result.stderr}]}
-        except Exception as e:
-            return {"valid": False, "errors": [{"message": str(e)}]}
-
-    @staticmethod
-    def extract_requirements(code: str, language: str) -> List[str]:
-        requirements = []
-        if language == "python":
-            import_pattern = r'^(?:from\s+(\S+)|import\s+(\S+))'
-            for line in code.split('\n'):
-                line = line.strip()
-                match = re.match(import_pattern, line)
-                if match:
-                    module = match.group(1) or match.group(2)
-                    module = module.split('.')[0]
-                    if module not in ['sys','os','time','datetime','re']:
-                        requirements.append(module)
-        elif language == "javascript":
-            require_pattern = r'require\([\'"](.+?)[\'"]\)'
-            import_pattern = r'import\s+.+\s+from\s+[\'"](.+?)[\'"]'
-            for pattern in [require_pattern, import_pattern]:
-                matches = re.findall(pattern, code)
-                requirements.extend(matches)
-        return list(set(requirements))
-
-validator = SyntaxValidator()
+validator = SyntaxValidator(NodeSyntaxChecker())
+validation_cache = ValidationCache(db, validator)
 
 # ----------------- UPLOAD HANDLER -----------------
 UPLOAD_BOT = 1
@@ -221,68 +346,103 @@ async def handle_bot_upload(update:Update, context:ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Unsupported file type!")
         return ConversationHandler.END
 
-    bot_id = db.add_bot(user_id, file_name, bot_type, "")
-    bot_dir = await bot_manager.create_bot_environment(user_id, bot_id, bot_type)
-    file_path = bot_dir / file_name
-
-    await context.bot.get_file(document.file_id).download_to_drive(file_path)
-
-    # Extract if zip
-    if bot_type == "archive":
-        with zipfile.ZipFile(file_path, 'r') as zip_ref:
-            zip_ref.extractall(bot_dir)
-        main_files = list(bot_dir.glob("*.py")) + list(bot_dir.glob("*.js"))
-        if not main_files:
-            await update.message.reply_text("❌ No .py or .js file found in archive!")
-            return ConversationHandler.END
-        main_file = main_files[0]
-        bot_type = "python" if main_file.suffix == ".py" else "javascript"
-    else:
-        main_file = file_path
+    try:
+        check_declared_size(document.file_size)
+    except UploadRejected as e:
+        await update.message.reply_text(f"❌ {e}")
+        return ConversationHandler.END
 
-    # Read code
-    async with aiofiles.open(main_file, 'r', encoding='utf-8') as f:
-        code = await f.read()
+    bot_id = await db.add_bot(user_id, file_name, bot_type, "")
+    bot_dir = await bot_manager.create_bot_environment(user_id, bot_id, bot_type)
+    file_path = bot_dir / Path(file_name).name
 
-    # Validate
-    if bot_type == "python":
-        validation = validator.validate_python(code)
-    else:
-        validation = validator.validate_javascript(code)
+    try:
+        tg_file = await context.bot.get_file(document.file_id)
+        uploaded = await download(tg_file, file_path, document.file_size or 0)
+
+        # Extract if zip, member by member under size caps
+        if bot_type == "archive":
+            files = await asyncio.to_thread(extract_archive, file_path, bot_dir)
+            file_path.unlink()
+            main_file = await asyncio.to_thread(find_entry_point, bot_dir, files)
+            if not main_file:
+                raise UploadRejected("No .py or .js file found in archive!")
+            bot_type = "python" if main_file.suffix == ".py" else "javascript"
+        else:
+            main_file = uploaded.path
+        if main_file.stat().st_size > MAX_SOURCE_BYTES:
+            raise UploadRejected(f"{main_file.name} is larger than {MAX_SOURCE_BYTES // 1024} KB")
 
-    requirements = validator.extract_requirements(code, bot_type)
+        # Validate off the event loop; a repeat upload of the same source is answered from the cache
+        if file_path.suffix == ".zip":
+            validation, imports = await validation_cache.validate_archive(files, bot_dir, bot_type)
+        else:
+            validation, main_imports = await validation_cache.validate_file(main_file, bot_type, uploaded.sha256)
+            imports = {main_file: main_imports}
+        # Follow the bot's own modules from the entry point; what is left gets installed
+        requirements = await asyncio.to_thread(resolve_requirements, main_file, bot_dir, imports, bot_type)
 
-    # Update bot path & type
-    db.conn.execute('UPDATE bots SET file_path=?, bot_type=? WHERE bot_id=?',
-                    (str(main_file), bot_type, bot_id))
-    db.conn.commit()
+        # Update bot path & type
+        await db.update_bot_file(bot_id, str(main_file), bot_type)
+    except Exception as e:
+        # No half-ingested bot is left behind, whatever went wrong
+        await db.delete_bot(bot_id)
+        await asyncio.to_thread(shutil.rmtree, bot_dir, True)
+        if not isinstance(e, UploadRejected):
+            logger.error(f"Upload of {file_name} for bot {bot_id} failed: {e}")
+            e = "Upload failed, please try again."
+        await update.message.reply_text(f"❌ {e}")
+        return ConversationHandler.END
 
     if validation["valid"]:
-        response = f"✅ Bot uploaded! ID: {bot_id}\nType: {bot_type.upper()}\nModules: {', '.join(requirements) if requirements else 'None'}"
+        owner = await db.get_user(user_id)
+        premium = bool(owner and owner[6])
+        results = await asyncio.gather(
+            *(install_dependency(bot_id, main_file.parent, bot_type, module, premium) for module in requirements),
+            return_exceptions=True
+        )
+        installed = [f"{r[0]}=={r[1]}" for r in results if not isinstance(r, BaseException)]
+        failed = [m for m, r in zip(requirements, results) if isinstance(r, BaseException)]
+        response = f"✅ Bot uploaded! ID: {bot_id}\nType: {bot_type.upper()}\nEntry: {main_file.relative_to(bot_dir)}\nModules: {', '.join(installed) if installed else 'None'}"
+        if failed:
+            response += f"\n⚠️ Not installed: {', '.join(failed)}"
     else:
         errors = validation["errors"]
-        error_details = "\n".join([f"Line {e.get('line','N/A')}: {e.get('message','Error')}" for e in errors])
+        error_details = "\n".join([f"{e['file'] + ' ' if 'file' in e else ''}Line {e.get('line','N/A')}: {e.get('message','Error')}" for e in errors[:20]])
         response = f"❌ Syntax errors detected:\n{error_details}"
 
     await update.message.reply_text(response)
     return ConversationHandler.END
 
 # ----------------- MY BOTS -----------------
+STATUS_LABELS = {
+    "running": "🟢 Running",
+    "restarting": "🟡 Restarting",
+    "crashed": "💥 Crashed",
+    "hibernated": "💤 Hibernated",
+    "stopped": "🔴 Stopped",
+}
+
+def status_label(status:str) -> str:
+    return STATUS_LABELS.get(status, "🔴 Stopped")
+
 async def my_bots(update:Update, context:ContextTypes.DEFAULT_TYPE):
-    bots = db.get_user_bots(update.effective_user.id)
+    bots = await db.get_user_bots(update.effective_user.id)
     if not bots:
         await update.message.reply_text("📭 No bots found! Use /upload")
         return
     text = f"🤖 **YOUR BOTS** ({len(bots)})\n\n"
     for bot in bots:
-        status = "🟢 Running" if bot[6]=="running" else "🔴 Stopped"
-        text += f"Bot #{bot[0]}: {bot[2]} ({bot[3].upper()}) - {status}\n"
+        text += f"Bot #{bot[0]}: {bot[2]} ({bot[3].upper()}) - {status_label(bot[6])}\n"
+    if any(bot[6] == "hibernated" for bot in bots):
+        text += "\n💤 Idle bots are paused; /start\\_bot <id> wakes one, /wake\\_at <id> HH:MM schedules it."
     await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
 
 # ----------------- CONVERSATION HANDLER -----------------
 def register_upload_handler(app):
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('upload', upload_bot_start)],
+        entry_points=[CommandHandler('upload', upload_bot_start),
+                      MessageHandler(filters.Text(["🚀 Upload Bot"]), upload_bot_start)],
         states={UPLOAD_BOT: [MessageHandler(filters.Document.ALL, handle_bot_upload)]},
         fallbacks=[]
     )
@@ -295,18 +455,19 @@ async def start_bot_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Usage: /start_bot <bot_id>")
         return
 
-    bot = db.get_bot(bot_id)
+    bot = await db.get_bot(bot_id)
     if not bot or bot[1] != update.effective_user.id:
         await update.message.reply_text("❌ Bot not found!")
         return
 
-    if bot[6] == "running":
+    if bot[6] in ("running", "restarting"):
         await update.message.reply_text("⚠️ Bot already running!")
         return
 
     result = await bot_manager.start_bot(bot_id)
     if result["success"]:
-        await update.message.reply_text(f"✅ Bot {bot_id} started! Use /logs {bot_id} to see logs.")
+        verb = "woke up" if bot[6] == "hibernated" else "started"
+        await update.message.reply_text(f"✅ Bot {bot_id} {verb}! Use /logs {bot_id} to see logs.")
     else:
         await update.message.reply_text(f"❌ Failed to start bot: {result['message']}")
 
@@ -317,7 +478,7 @@ async def stop_bot_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Usage: /stop_bot <bot_id>")
         return
 
-    bot = db.get_bot(bot_id)
+    bot = await db.get_bot(bot_id)
     if not bot or bot[1] != update.effective_user.id:
         await update.message.reply_text("❌ Bot not found!")
         return
@@ -335,74 +496,185 @@ async def restart_bot_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("❌ Usage: /restart_bot <bot_id>")
         return
 
-    bot = db.get_bot(bot_id)
+    bot = await db.get_bot(bot_id)
     if not bot or bot[1] != update.effective_user.id:
         await update.message.reply_text("❌ Bot not found!")
         return
 
-    stop_result = await bot_manager.stop_bot(bot_id)
-    if stop_result["success"]:
-        await asyncio.sleep(1)
-        start_result = await bot_manager.start_bot(bot_id)
-        if start_result["success"]:
-            await update.message.reply_text(f"🔄 Bot {bot_id} restarted successfully!")
-        else:
-            await update.message.reply_text(f"❌ Failed to restart: {start_result['message']}")
+    result = await bot_manager.restart_bot(bot_id)
+    if result["success"]:
+        await update.message.reply_text(f"🔄 Bot {bot_id} restarted successfully!")
     else:
-        await update.message.reply_text(f"❌ Failed to stop bot: {stop_result['message']}")
+        await update.message.reply_text(f"❌ Failed to restart: {result['message']}")
+
+async def wake_at_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    usage = "❌ Usage: /wake_at <bot_id> HH:MM[,HH:MM...] (UTC) or /wake_at <bot_id> off"
+    try:
+        bot_id = int(context.args[0])
+        spec = context.args[1]
+    except:
+        await update.message.reply_text(usage)
+        return
+
+    bot = await db.get_bot(bot_id)
+    if not bot or bot[1] != update.effective_user.id:
+        await update.message.reply_text("❌ Bot not found!")
+        return
+
+    wake_at = None if spec == "off" else parse_wake_times(spec)
+    if wake_at is None and spec != "off":
+        await update.message.reply_text(usage)
+        return
+    await db.set_wake_times(bot_id, wake_at)
+    if wake_at:
+        await update.message.reply_text(f"⏰ Bot {bot_id} will be woken at {wake_at} UTC if it is hibernated.")
+    else:
+        await update.message.reply_text(f"⏰ Wake schedule for bot {bot_id} cleared.")
 
 # ----------------- BOT LOGS -----------------
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_duration(token:str):
+    match = re.fullmatch(r'(\d+)([smhd])', token)
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)] if match else None
+
 async def logs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         bot_id = int(context.args[0])
     except:
-        await update.message.reply_text("❌ Usage: /logs <bot_id>")
+        await update.message.reply_text("❌ Usage: /logs <bot_id> [lines] [period] [filter]")
         return
 
-    bot = db.get_bot(bot_id)
+    # /logs <id> [lines] [period] [filter...] - e.g. /logs 3 100 2h error
+    rest = context.args[1:]
+    lines = DEFAULT_TAIL_LINES
+    if rest and rest[0].isdigit():
+        lines = min(int(rest[0]), MAX_TAIL_LINES)
+        rest = rest[1:]
+    period = parse_duration(rest[0]) if rest else None
+    if period:
+        rest = rest[1:]
+    pattern = " ".join(rest) or None
+
+    bot = await db.get_bot(bot_id)
     if not bot or bot[1] != update.effective_user.id:
         await update.message.reply_text("❌ Bot not found!")
         return
 
-    log_file = Path(bot[4]).parent / "bot.log"
-    if log_file.exists():
-        async with aiofiles.open(log_file, 'r', encoding='utf-8') as f:
-            logs = await f.read()
-        if len(logs) > 4000:
-            logs = logs[-4000:]
+    store = bot_manager.log_store(bot)
+    if store.active_path.exists() or store.index:
+        # Reads touch only the file tail or the segments overlapping the period, off the event loop
+        if period:
+            now = time.time()
+            tail = await asyncio.to_thread(store.read_range, now - period, now, lines, pattern)
+        else:
+            tail = await asyncio.to_thread(store.tail, lines, pattern)
+        if not tail:
+            await update.message.reply_text("📄 No matching log lines." if pattern else "📄 Log is empty.")
+            return
+        logs = fit_message(tail)
         await update.message.reply_text(f"📝 **LOGS (Bot {bot_id})**\n\n```\n{logs}\n```",
                                         parse_mode=ParseMode.MARKDOWN)
     else:
         await update.message.reply_text("📄 No logs available for this bot.")
 
+# ----------------- LIVE LOGS -----------------
+follows = FollowRegistry()
+
+async def follow_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        bot_id = int(context.args[0])
+    except:
+        await update.message.reply_text("❌ Usage: /follow <bot_id>")
+        return
+
+    bot = await db.get_bot(bot_id)
+    if not bot or bot[1] != update.effective_user.id:
+        await update.message.reply_text("❌ Bot not found!")
+        return
+
+    if bot[12]:
+        await update.message.reply_text(f"⚠️ Bot {bot_id} runs on worker {bot[12]}; live follow is only "
+                                        f"available for bots on this host. Use /logs {bot_id}.")
+        return
+
+    msg = await update.message.reply_text(f"📡 Following logs of bot {bot_id}... /unfollow {bot_id} to stop")
+    follows.start(update.effective_chat.id, LogFollower(bot_id, bot_manager.log_store(bot), msg))
+
+async def unfollow_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        bot_id = int(context.args[0])
+    except:
+        await update.message.reply_text("❌ Usage: /unfollow <bot_id>")
+        return
+
+    if follows.stop(update.effective_chat.id, bot_id):
+        await update.message.reply_text(f"⏹ Stopped following bot {bot_id}")
+    else:
+        await update.message.reply_text("⚠️ Not following that bot.")
+
 # ----------------- BOT STATS -----------------
+def format_uptime(seconds:int) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h {rest // 60}m"
+
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         bot_id = int(context.args[0])
     except:
-        await update.message.reply_text("❌ Usage: /stats <bot_id>")
+        await update.message.reply_text("❌ Usage: /stats <bot_id> [period]")
         return
+    period = parse_duration(context.args[1]) if len(context.args) > 1 else None
 
-    bot = db.get_bot(bot_id)
+    bot = await db.get_bot(bot_id)
     if not bot or bot[1] != update.effective_user.id:
         await update.message.reply_text("❌ Bot not found!")
         return
 
-    # Mock stats (replace with real container stats if using Docker)
-    stats = {
-        "cpu_percent": round(5 + bot_id % 10, 2),
-        "memory_mb": round(50 + bot_id * 2, 2)
-    }
+    if period:
+        await stats_history(update, bot_id, context.args[1], period)
+        return
+
+    # Served from the collector's in-memory samples; the process table is never touched here
+    sample = metrics.latest(bot_id)
+    if not sample:
+        await update.message.reply_text(f"📊 No stats yet for bot {bot_id}. Is it running?")
+        return
+    avg = metrics.average(bot_id)
+    await update.message.reply_text(
+        f"📊 **Bot {bot_id} Stats**\n"
+        f"CPU Usage: {sample.cpu_percent}% (avg {avg.cpu_percent:.1f}%)\n"
+        f"Memory Usage: {sample.memory_mb} MB (avg {avg.memory_mb:.1f} MB)\n"
+        f"Uptime: {format_uptime(sample.uptime)}",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def stats_history(update: Update, bot_id:int, label:str, period:int):
+    buckets = metrics.timeseries.query(bot_id, time.time() - period)
+    if not buckets:
+        await update.message.reply_text(f"📊 No history for bot {bot_id} in the last {label}.")
+        return
+    cpu_avg = [b[2] for b in buckets]
+    mem_avg = [b[5] for b in buckets]
     await update.message.reply_text(
-        f"📊 **Bot {bot_id} Stats**\nCPU Usage: {stats['cpu_percent']}%\nMemory Usage: {stats['memory_mb']} MB",
+        f"📈 **Bot {bot_id} - last {label}**\n\n"
+        f"CPU `{sparkline(cpu_avg)}`\n"
+        f"min {min(b[1] for b in buckets):.1f}% / avg {sum(cpu_avg) / len(cpu_avg):.1f}% / max {max(b[3] for b in buckets):.1f}%\n\n"
+        f"RAM `{sparkline(mem_avg)}`\n"
+        f"min {min(b[4] for b in buckets):.1f} / avg {sum(mem_avg) / len(mem_avg):.1f} / max {max(b[6] for b in buckets):.1f} MB",
         parse_mode=ParseMode.MARKDOWN
     )
 
 # ----------------- INLINE BUTTONS -----------------
 async def bot_controls(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    bot_id = int(context.callback_query.data.split("_")[1])
+    bot_id = int(update.callback_query.data.split("_")[1])
     action = update.callback_query.data.split("_")[0]
 
+    bot = await db.get_bot(bot_id)
+    if not bot or bot[1] != update.effective_user.id:
+        await update.callback_query.answer("❌ Bot not found!")
+        return
+
     if action == "start":
         result = await bot_manager.start_bot(bot_id)
         await update.callback_query.answer(result["message"])
@@ -410,15 +682,13 @@ async def bot_controls(update: Update, context: ContextTypes.DEFAULT_TYPE):
         result = await bot_manager.stop_bot(bot_id)
         await update.callback_query.answer(result["message"])
     elif action == "restart":
-        stop_result = await bot_manager.stop_bot(bot_id)
-        await asyncio.sleep(1)
-        start_result = await bot_manager.start_bot(bot_id)
-        await update.callback_query.answer("Bot restarted successfully!")
+        result = await bot_manager.restart_bot(bot_id)
+        await update.callback_query.answer("Bot restarted successfully!" if result["success"] else result["message"])
 
 async def my_bots_inline(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    bots = db.get_user_bots(update.effective_user.id)
+    bots = await db.get_user_bots(update.effective_user.id)
     for bot in bots:
-        status = "🟢 Running" if bot[6]=="running" else "🔴 Stopped"
+        status = status_label(bot[6])
         keyboard = InlineKeyboardMarkup([
             [
                 InlineKeyboardButton("▶️ Start", callback_data=f"start_{bot[0]}"),
@@ -428,7 +698,12 @@ async def my_bots_inline(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ])
         await update.message.reply_text(f"Bot #{bot[0]}: {bot[2]} ({bot[3].upper()}) - {status}",
                                         reply_markup=keyboard)
-        # ----------------- INSTALL MODULE -----------------
+# ----------------- INSTALL MODULE -----------------
+async def install_dependency(bot_id:int, bot_dir:Path, bot_type:str, spec:str, premium:bool=False, progress=None):
+    name, version = await install_queue.submit(bot_id, bot_dir, bot_type, spec, premium, progress)
+    await db.add_module(bot_id, name, version)
+    return name, version
+
 async def install_module_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         bot_id = int(context.args[0])
@@ -437,20 +712,50 @@ async def install_module_command(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("❌ Usage: /install <bot_id> <module>")
         return
 
-    bot = db.get_bot(bot_id)
+    bot = await db.get_bot(bot_id)
     if not bot or bot[1] != update.effective_user.id:
         await update.message.reply_text("❌ Bot not found!")
         return
 
+    if bot[3] == "python":
+        # People type the import name; install the distribution that provides it
+        module_name = IMPORT_TO_DIST.get(module_name, module_name)
+    owner = await db.get_user(update.effective_user.id)
     msg = await update.message.reply_text(f"📦 Installing {module_name}...")
-    # Mock installation (replace with Docker or subprocess logic)
-    await asyncio.sleep(1)
-    await msg.edit_text(f"✅ Module {module_name} installed!\nUse /restart_bot {bot_id} to restart.")
+
+    async def progress(text:str):
+        await msg.edit_text(f"📦 Installing {module_name}: {text}\n/cancel_install {bot_id} to abort")
+
+    try:
+        name, version = await install_dependency(bot_id, Path(bot[4]).parent, bot[3], module_name,
+                                                 bool(owner and owner[6]), progress)
+    except InstallError as e:
+        await msg.edit_text(f"❌ Installing {module_name} failed: {e}")
+        return
+    await msg.edit_text(f"✅ Module {name}=={version} installed!\nUse /restart_bot {bot_id} to restart.")
+
+async def cancel_install_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        bot_id = int(context.args[0])
+    except:
+        await update.message.reply_text("❌ Usage: /cancel_install <bot_id> [module]")
+        return
+
+    bot = await db.get_bot(bot_id)
+    if not bot or bot[1] != update.effective_user.id:
+        await update.message.reply_text("❌ Bot not found!")
+        return
+
+    cancelled = install_queue.cancel(bot_id, context.args[1] if len(context.args) > 1 else None)
+    if cancelled:
+        await update.message.reply_text(f"🛑 Cancelled {cancelled} install(s) for bot {bot_id}")
+    else:
+        await update.message.reply_text(f"ℹ️ No pending installs for bot {bot_id}")
 
 # ----------------- USER PROFILE -----------------
 async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = db.get_user(update.effective_user.id)
-    bots = db.get_user_bots(update.effective_user.id)
+    user = await db.get_user(update.effective_user.id)
+    bots = await db.get_user_bots(update.effective_user.id)
     running = sum(1 for b in bots if b[6]=="running")
     text = f"""
 👤 **YOUR PROFILE**
@@ -475,36 +780,40 @@ async def delete_bot_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ Usage: /delete_bot <bot_id>")
         return
 
-    bot = db.get_bot(bot_id)
+    bot = await db.get_bot(bot_id)
     if not bot or bot[1] != update.effective_user.id:
         await update.message.reply_text("❌ Bot not found!")
         return
 
-    # Stop bot if running
-    if bot[6]=="running":
-        await bot_manager.stop_bot(bot_id)
+    # Stop bot if running, or waiting to be restarted after a crash
+    if bot[6] in ("running", "restarting") or bot_manager.supervisor.is_supervised(bot_id):
+        result = await bot_manager.stop_bot(bot_id)
+        if not result["success"]:
+            await update.message.reply_text(f"❌ Failed to stop bot: {result['message']}")
+            return
 
     # Remove files
-    import shutil
+    bot_manager.forget_bot(bot_id)
+    metrics.timeseries.forget(bot_id)
     bot_dir = Path(bot[4]).parent
     if bot_dir.exists():
         shutil.rmtree(bot_dir)
 
     # Delete from database
-    db.conn.execute('DELETE FROM bots WHERE bot_id=?', (bot_id,))
-    db.conn.commit()
+    await db.delete_bot(bot_id)
 
     await update.message.reply_text(f"✅ Bot {bot_id} deleted!")
 
 # ----------------- PREMIUM SYSTEM -----------------
 async def premium_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = db.get_user(update.effective_user.id)
+    user = await db.get_user(update.effective_user.id)
     if user[6]:
         await update.message.reply_text("💎 You are already a premium user!")
     else:
         await update.message.reply_text(
             "💎 **PREMIUM FEATURES**\n\n"
-            "✨ Unlimited bots\n⚡ Faster processing\n🛡 Priority support\n📊 Advanced analytics\n🚀 Auto-scaling\n\n"
+            "✨ Unlimited bots\n⚡ Faster processing\n🛡 Priority support\n📊 Advanced analytics\n🚀 Auto-scaling\n"
+            "💤 Bots never hibernate\n\n"
             "Contact admin to upgrade!"
         )
 
@@ -537,52 +846,106 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Admin only!")
         return
 
-    users = db.get_all_users()
-    bots = db.get_all_bots()
-    running = sum(1 for b in bots if b[6]=="running")
+    users, premium, banned = await db.count_users()
+    by_status = await db.count_bots_by_status()
+    total_bots = sum(by_status.values())
+    running = by_status.get("running", 0)
+    hibernated = by_status.get("hibernated", 0)
+    cache = validation_cache.stats()
+    state = db.cache_stats()
+    updates = update_processor.stats()
+    nodes = ""
+    if bot_manager.cluster.enabled:
+        placed = await db.count_bots_by_node()
+        nodes = f"🖥 This host: {placed.get(None, 0)} bots\n" + "".join(
+            f"🖥 {escape_markdown(n['node_id'])}: {placed.get(n['node_id'], 0)} bots, seen {n['last_seen']:.0f}s ago\n"
+            for n in bot_manager.cluster.describe())
     text = f"""
 ⚡ **ADMIN PANEL**
 
-👥 Users: {len(users)}
-🤖 Bots: {len(bots)}
+👥 Users: {users} (💎 {premium}, 🚫 {banned})
+🤖 Bots: {total_bots}
 🟢 Running: {running}
-🔴 Stopped: {len(bots)-running}
-
+💤 Hibernated: {hibernated}
+🔴 Stopped: {total_bots-running-hibernated}
+🗂 Validation cache: {cache['hits']} hits / {cache['misses']} misses ({cache['hit_rate']}%)
+🧠 State cache: users {state['users']['hit_rate']}%, bots {state['bots']['hit_rate']}% hits
+⚙️ Updates: {updates['running']} running, {updates['queued']} queued, wait p95 {updates['wait_p95'] * 1000:.0f} ms
+{nodes}
 **Commands:**
 /users /allbots
 /ban /unban
 /broadcast
+/placement
 """
     await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
 
+# Rows per page; with names clipped this stays well under Telegram's 4096 characters
+ADMIN_PAGE_SIZE = 20
+
+def page_buttons(kind:str, rows, has_prev:bool, has_next:bool):
+    # Buttons carry the keyset cursor: first id for "prev", last id for "next"
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"{kind}:prev:{rows[0][0]}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"{kind}:next:{rows[-1][0]}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def users_page(cursor:int=0, forward:bool=True):
+    rows, more = await db.get_users_page(cursor, forward, ADMIN_PAGE_SIZE)
+    total = (await db.count_users())[0]
+    text = f"👥 ALL USERS ({total})\n\n"
+    for user in rows:
+        text += f"{str(user[2])[:40]} ({user[0]})\nBots: {user[5]}\nPremium: {'YES' if user[6] else 'NO'}\n\n"
+    if not rows:
+        text += "No users here."
+    has_prev, has_next = (cursor > 0, more) if forward else (more, True)
+    return text, page_buttons("users", rows, has_prev and bool(rows), has_next and bool(rows))
+
+async def bots_page(cursor:int=0, forward:bool=True):
+    rows, more = await db.get_bots_page(cursor, forward, ADMIN_PAGE_SIZE)
+    total = sum((await db.count_bots_by_status()).values())
+    text = f"🤖 ALL BOTS ({total})\n\n"
+    for bot in rows:
+        status = status_label(bot[6])
+        text += f"{status} Bot #{bot[0]} - User {bot[1]} - {str(bot[2])[:40]} ({bot[3].upper()})\n"
+    if not rows:
+        text += "No bots here."
+    has_prev, has_next = (cursor > 0, more) if forward else (more, True)
+    return text, page_buttons("bots", rows, has_prev and bool(rows), has_next and bool(rows))
+
 async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS:
         return
 
-    users = db.get_all_users()
-    text = f"👥 **ALL USERS** ({len(users)})\n\n"
-    for user in users[:50]:
-        text += f"{user[2]} ({user[0]})\nBots: {user[5]}\nPremium: {'YES' if user[6] else 'NO'}\n\n"
-    await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+    text, keyboard = await users_page()
+    await update.message.reply_text(text, reply_markup=keyboard)
 
 async def list_all_bots(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS:
         return
 
-    bots = db.get_all_bots()
-    text = f"🤖 **ALL BOTS** ({len(bots)})\n\n"
-    for bot in bots[:50]:
-        status = "🟢 Running" if bot[6]=="running" else "🔴 Stopped"
-        text += f"{status} Bot #{bot[0]} - User {bot[1]} - {bot[2]} ({bot[3].upper()})\n"
-    await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+    text, keyboard = await bots_page()
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+async def admin_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if update.effective_user.id not in ADMIN_IDS:
+        await query.answer("❌ Admin only!")
+        return
+    kind, direction, cursor = query.data.split(":")
+    render = users_page if kind == "users" else bots_page
+    text, keyboard = await render(int(cursor), direction == "next")
+    await query.answer()
+    await query.edit_message_text(text, reply_markup=keyboard)
 
 async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS:
         return
     try:
         user_id = int(context.args[0])
-        db.conn.execute('UPDATE users SET banned=1 WHERE user_id=?', (user_id,))
-        db.conn.commit()
+        await db.ban_user(user_id)
         await update.message.reply_text(f"✅ User {user_id} banned!")
     except:
         await update.message.reply_text("❌ Usage: /ban <user_id>")
@@ -592,12 +955,37 @@ async def unban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     try:
         user_id = int(context.args[0])
-        db.conn.execute('UPDATE users SET banned=0 WHERE user_id=?', (user_id,))
-        db.conn.commit()
+        await db.unban_user(user_id)
         await update.message.reply_text(f"✅ User {user_id} unbanned!")
     except:
         await update.message.reply_text("❌ Usage: /unban <user_id>")
 
+async def placement_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    scheduler = bot_manager.scheduler
+    if not scheduler.active:
+        await update.message.reply_text("ℹ️ Load-aware placement is off (needs CLUSTER_PORT and SCHEDULER=binpack).")
+        return
+    if context.args and context.args[0] == "apply":
+        if not scheduler.suggestions:
+            await scheduler.run_once()
+        done = await scheduler.apply()
+        await update.message.reply_text(f"✅ {done} migrations performed.")
+        return
+
+    await scheduler.run_once()
+    text = "🧮 PLACEMENT\n\n"
+    for node in scheduler.describe():
+        text += f"🖥 {node['node_id']}: {node['bots']} bots, CPU {node['cpu']:.0%}, RAM {node['memory']:.0%}\n"
+    if scheduler.suggestions:
+        text += "\nSuggested migrations:\n" + "".join(
+            f"• Bot #{m.bot_id}: {m.source} → {m.target}\n" for m in scheduler.suggestions)
+        text += "\n/placement apply to perform them"
+    else:
+        text += "\nNo node is running hot."
+    await update.message.reply_text(text)
+
 async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS:
         return
@@ -607,17 +995,40 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     message = " ".join(context.args)
-    users = db.get_all_users()
-    msg = await update.message.reply_text(f"📢 Broadcasting to {len(users)} users...")
-    success = 0
-    for user in users:
-        try:
-            await context.bot.send_message(user[0], f"📢 **BROADCAST**\n\n{message}", parse_mode=ParseMode.MARKDOWN)
-            success += 1
-            await asyncio.sleep(0.05)
-        except:
-            pass
-    await msg.edit_text(f"✅ Sent to {success} users!")
+    msg = await update.message.reply_text("📢 Starting broadcast...")
+    # Runs in the background; progress is edited into msg and survives restarts
+    await broadcasts.create(msg.chat_id, msg.message_id, f"📢 **BROADCAST**\n\n{message}")
+
+async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    try:
+        broadcast_id = int(context.args[0])
+    except:
+        await update.message.reply_text("❌ Usage: /cancel_broadcast <id>")
+        return
+    if broadcasts.cancel(broadcast_id):
+        await update.message.reply_text(f"🛑 Cancelling broadcast #{broadcast_id}")
+    else:
+        await update.message.reply_text(f"❌ Broadcast #{broadcast_id} is not running")
+
+# ----------------- KEYBOARD BUTTONS -----------------
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Reply keyboard from /start; "🚀 Upload Bot" is an entry point of the upload conversation
+    buttons = {
+        "📊 My Bots": my_bots,
+        "📱 Help": help_command,
+        "💎 Premium": premium_command,
+        "👤 Profile": profile_command,
+        "📩 Support": support_command,
+    }
+    if not update.message:
+        return
+    command = buttons.get(update.message.text)
+    if command:
+        await command(update, context)
+    else:
+        await update.message.reply_text("🤔 Unknown command. Use /menu to see what I can do.")
 
 # ----------------- ERROR HANDLER -----------------
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -625,55 +1036,14 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update and update.effective_message:
         await update.effective_message.reply_text("❌ An unexpected error occurred!")
 
-# ----------------- BOT STARTUP -----------------
-def main():
-    print("🚀 Starting Advanced Bot Hosting...")
-    application = Application.builder().token(BOT_TOKEN).build()
-
-    # Upload handler
-    register_upload_handler(application)
-
-    # Core commands
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("menu", menu))
-    application.add_handler(CommandHandler("mybots", my_bots))
-    application.add_handler(CommandHandler("start_bot", start_bot_command))
-    application.add_handler(CommandHandler("stop_bot", stop_bot_command))
-    application.add_handler(CommandHandler("restart_bot", restart_bot_command))
-    application.add_handler(CommandHandler("logs", logs_command))
-    application.add_handler(CommandHandler("stats", stats_command))
-    application.add_handler(CommandHandler("install", install_module_command))
-    application.add_handler(CommandHandler("profile", profile_command))
-    application.add_handler(CommandHandler("delete_bot", delete_bot_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("premium", premium_command))
-    application.add_handler(CommandHandler("support", support_command))
-
-    # Admin handlers
-    application.add_handler(CommandHandler("admin", admin_panel))
-    application.add_handler(CommandHandler("users", list_users))
-    application.add_handler(CommandHandler("allbots", list_all_bots))
-    application.add_handler(CommandHandler("ban", ban_user))
-    application.add_handler(CommandHandler("unban", unban_user))
-    application.add_handler(CommandHandler("broadcast", broadcast))
-
-    # Inline callback buttons
-    application.add_handler(CallbackQueryHandler(bot_controls))
-
-    # Fallback text messages
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-
-    # Global error handler
-    application.add_error_handler(error_handler)
 # =================== PART 6: ADVANCED FEATURES / GITHUB / PREMIUM ===================
 import requests
 from pathlib import Path
-import zipfile
 
 # ----------------- PREMIUM CHECK DECORATOR -----------------
 def premium_only(func):
     async def wrapper(update, context):
-        user = cursor.execute("SELECT * FROM users WHERE user_id=?", (update.effective_user.id,)).fetchone()
+        user = await db.get_user(update.effective_user.id)
         if not user or not user[6]:
             await update.message.reply_text("❌ This feature is only for Premium users!")
             return
@@ -696,14 +1066,13 @@ async def connect_github(update, context):
 async def save_github_token(update, context):
     token = update.message.text.strip()
     user_id = update.effective_user.id
-    cursor.execute("UPDATE users SET github_token=? WHERE user_id=?", (token, user_id))
-    conn.commit()
+    await db.set_github_token(user_id, token)
     await update.message.reply_text("✅ GitHub token saved successfully!")
 
 # ----------------- DEPLOY FROM GITHUB -----------------
 @premium_only
 async def deploy_github_repo(update, context):
-    user = cursor.execute("SELECT * FROM users WHERE user_id=?", (update.effective_user.id,)).fetchone()
+    user = await db.get_user(update.effective_user.id)
     token = user[7]  # github_token
     if not token:
         await update.message.reply_text("❌ GitHub not connected. Use /connect_github first.")
@@ -727,8 +1096,7 @@ async def deploy_github_repo(update, context):
             f.write(r.content)
 
         # Extract repository
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(user_dir)
+        await asyncio.to_thread(extract_archive, zip_path, user_dir)
         zip_path.unlink()
 
         await update.message.reply_text("✅ Repo deployed successfully! Use /start_bot <bot_id> to start your bot.")
@@ -738,10 +1106,14 @@ async def deploy_github_repo(update, context):
 # ----------------- REAL-TIME STATS -----------------
 @premium_only
 async def realtime_stats(update, context):
-    bots = cursor.execute("SELECT * FROM bots WHERE user_id=?", (update.effective_user.id,)).fetchall()
+    bots = await db.get_user_bots(update.effective_user.id)
     text = "📊 **Real-Time Bot Stats**\n\n"
     for bot in bots:
-        text += f"Bot #{bot[0]}: Status {bot[6]}\n"
+        sample = metrics.latest(bot[0])
+        if sample:
+            text += f"Bot #{bot[0]}: {bot[6]} - CPU {sample.cpu_percent}% - RAM {sample.memory_mb} MB\n"
+        else:
+            text += f"Bot #{bot[0]}: Status {bot[6]}\n"
     await update.message.reply_text(text)
 
 # ----------------- ADMIN PREMIUM MANAGEMENT -----------------
@@ -750,8 +1122,7 @@ async def grant_premium(update, context):
         return
     try:
         user_id = int(context.args[0])
-        cursor.execute("UPDATE users SET premium=1 WHERE user_id=?", (user_id,))
-        conn.commit()
+        await db.set_premium(user_id, True)
         await update.message.reply_text(f"💎 User {user_id} granted Premium!")
     except:
         await update.message.reply_text("❌ Usage: /grant_premium <user_id>")
@@ -761,8 +1132,7 @@ async def revoke_premium(update, context):
         return
     try:
         user_id = int(context.args[0])
-        cursor.execute("UPDATE users SET premium=0 WHERE user_id=?", (user_id,))
-        conn.commit()
+        await db.set_premium(user_id, False)
         await update.message.reply_text(f"❌ Premium revoked for User {user_id}")
     except:
         await update.message.reply_text("❌ Usage: /revoke_premium <user_id>")
@@ -778,15 +1148,89 @@ def add_advanced_handlers(application):
     application.add_handler(CommandHandler("grant_premium", grant_premium))
     application.add_handler(CommandHandler("revoke_premium", revoke_premium))
 
+async def on_startup(application):
+    # Forkserver children start clean instead of inheriting the bot's threads and sockets
+    validation_cache.pool = ProcessPoolExecutor(
+        VALIDATION_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+    install_queue.start()
+    await metrics.load_history()
+    await bot_manager.startup()
+    await bot_manager.resume_bots()
+    metrics.start()
+    await broadcasts.start(application.bot)
+
+async def on_shutdown(application):
+    await broadcasts.stop()
+    await install_queue.stop()
+    await metrics.stop()
+    await asyncio.to_thread(validator.js_checker.close)
+    if validation_cache.pool is not None:
+        validation_cache.pool.shutdown(cancel_futures=True)
+    await bot_manager.shutdown()
+    db.close()
+
+# ----------------- BOT STARTUP -----------------
 def main():
-    print("🚀 Starting Bot Hosting Platform...")
+    print("🚀 Starting Advanced Bot Hosting...")
+    application = (
+        Application.builder().token(BOT_TOKEN)
+        .base_url(f"{BOT_API_URL}/bot").base_file_url(f"{BOT_API_URL}/file/bot")
+        .concurrent_updates(update_processor)
+        .post_init(on_startup).post_shutdown(on_shutdown)
+        .build()
+    )
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Upload handler
+    register_upload_handler(application)
 
-    # Add handlers here...
+    # Core commands
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("menu", menu))
-    # ...other handlers
+    application.add_handler(CommandHandler("mybots", my_bots))
+    application.add_handler(CommandHandler("start_bot", start_bot_command))
+    application.add_handler(CommandHandler("stop_bot", stop_bot_command))
+    application.add_handler(CommandHandler("restart_bot", restart_bot_command))
+    application.add_handler(CommandHandler("wake_at", wake_at_command))
+    application.add_handler(CommandHandler("logs", logs_command))
+    application.add_handler(CommandHandler("follow", follow_command))
+    application.add_handler(CommandHandler("unfollow", unfollow_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("install", install_module_command))
+    application.add_handler(CommandHandler("cancel_install", cancel_install_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("delete_bot", delete_bot_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("premium", premium_command))
+    application.add_handler(CommandHandler("support", support_command))
+
+    # Admin handlers
+    application.add_handler(CommandHandler("admin", admin_panel))
+    application.add_handler(CommandHandler("users", list_users))
+    application.add_handler(CommandHandler("allbots", list_all_bots))
+    application.add_handler(CommandHandler("ban", ban_user))
+    application.add_handler(CommandHandler("unban", unban_user))
+    application.add_handler(CommandHandler("broadcast", broadcast))
+    application.add_handler(CommandHandler("cancel_broadcast", cancel_broadcast))
+    application.add_handler(CommandHandler("placement", placement_command))
+
+    # Inline callback buttons
+    application.add_handler(CallbackQueryHandler(admin_page_callback, pattern=r"^(users|bots):(next|prev):\d+$"))
+    application.add_handler(CallbackQueryHandler(bot_controls, pattern=r"^(start|stop|restart)_\d+$"))
+
+    # Fallback text messages
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+
+    # Global error handler
+    application.add_error_handler(error_handler)
+
+    # Premium / GitHub features
+    add_advanced_handlers(application)
 
     print("✅ Bot started!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)  # <-- NO extra indentation
+    if WEBHOOK_URL:
+        asyncio.run(serve_webhook(application))
+    else:
+        application.run_polling(allowed_updates=allowed_updates(application))
+
+if __name__ == "__main__":
+    main()
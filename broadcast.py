@@ -0,0 +1,235 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Optional, Set, Tuple
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+# Telegram allows a bot about 30 messages a second overall and one a second per chat
+GLOBAL_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+GLOBAL_BURST = 25
+PER_CHAT_INTERVAL = 1.0
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "16"))
+PAGE_SIZE = 500
+MAX_ATTEMPTS = 5
+PROGRESS_INTERVAL = 5.0
+
+
+# ----------------- RATE LIMITS -----------------
+class TokenBucket:
+    """Async token bucket; pause() holds every caller back after a flood wait."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ChatLimiter:
+    """Spaces out messages to the same chat, e.g. retries or overlapping broadcasts."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next_at: Dict[int, float] = {}
+
+    async def acquire(self, chat_id: int):
+        now = time.monotonic()
+        at = self.next_at.get(chat_id, 0.0)
+        self.next_at[chat_id] = max(now, at) + self.interval
+        if len(self.next_at) > 10000:
+            self.next_at = {c: t for c, t in self.next_at.items() if t > now}
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+# ----------------- BROADCAST JOB -----------------
+class BroadcastJob:
+    def __init__(self, row):
+        (self.broadcast_id, self.chat_id, self.message_id, self.text, self.status,
+         self.cursor, self.total, self.sent, self.failed, self.blocked) = row[:10]
+        # Recipients handed to a worker but not finished yet
+        self.in_flight: Set[int] = set()
+        # Counts as of the saved cursor, and outcomes of recipients finished past it
+        self.saved = {"sent": self.sent, "failed": self.failed, "blocked": self.blocked}
+        self.unsaved: Dict[int, str] = {}
+        self.dispatched = self.cursor
+        self.task: Optional[asyncio.Task] = None
+        self.started_at = time.monotonic()
+        self.done_at_start = self.done
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+    def record(self, user_id: int, outcome: str):
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        self.in_flight.discard(user_id)
+        self.unsaved[user_id] = outcome
+
+    def checkpoint(self) -> Tuple[int, Dict[str, int]]:
+        # Recipients go out in user_id order, so everything below the oldest unfinished one is done.
+        # Sends past that cursor are repeated on resume, so they are only counted once it moves past them.
+        cursor = min(self.in_flight) - 1 if self.in_flight else self.dispatched
+        for user_id in [u for u in self.unsaved if u <= cursor]:
+            self.saved[self.unsaved.pop(user_id)] += 1
+        return cursor, dict(self.saved)
+
+    def render(self) -> str:
+        elapsed = time.monotonic() - self.started_at
+        rate = (self.done - self.done_at_start) / elapsed if elapsed > 0 else 0
+        counts = f"✅ {self.sent}  ❌ {self.failed}  🚫 {self.blocked}"
+        if self.status == "done":
+            return f"✅ Broadcast #{self.broadcast_id} finished\n{counts}"
+        if self.status == "cancelled":
+            return f"🛑 Broadcast #{self.broadcast_id} cancelled\n{counts}"
+        remaining = max(self.total - self.done, 0)
+        eta = f"{int(remaining / rate) // 60}m{int(remaining / rate) % 60:02d}s" if rate else "?"
+        return (f"📢 Broadcast #{self.broadcast_id}: {self.done}/{self.total}\n{counts}\n"
+                f"⚡ {rate:.1f} msg/s, ETA {eta}\n/cancel_broadcast {self.broadcast_id}")
+
+
+# ----------------- BROADCAST ENGINE -----------------
+class BroadcastEngine:
+    """Sends broadcasts through shared rate limits with bounded concurrency.
+
+    Progress is checkpointed to the broadcasts table, and any broadcast still marked
+    running is picked up again by start(). A crash can repeat the sends past the saved
+    cursor, but the saved counts only cover recipients up to it, so none is counted twice.
+    """
+
+    def __init__(self, database, concurrency: int = BROADCAST_CONCURRENCY):
+        self.db = database
+        self.concurrency = concurrency
+        self.bot = None
+        self.bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.chats = ChatLimiter(PER_CHAT_INTERVAL)
+        self.jobs: Dict[int, BroadcastJob] = {}
+
+    async def start(self, bot):
+        self.bot = bot
+        for row in await self.db.get_broadcasts_by_status("running"):
+            logger.info(f"Resuming broadcast {row[0]} after user {row[5]}")
+            self._launch(BroadcastJob(row))
+
+    async def stop(self):
+        # Jobs stay "running" in the database so the next start resumes them
+        jobs = list(self.jobs.values())
+        for job in jobs:
+            job.task.cancel()
+        await asyncio.gather(*(job.task for job in jobs), return_exceptions=True)
+
+    async def create(self, chat_id: int, message_id: int, text: str) -> BroadcastJob:
+        total = await self.db.count_active_users()
+        broadcast_id = await self.db.create_broadcast(chat_id, message_id, text, total)
+        job = BroadcastJob((broadcast_id, chat_id, message_id, text, "running", 0, total, 0, 0, 0))
+        self._launch(job)
+        return job
+
+    def cancel(self, broadcast_id: int) -> bool:
+        job = self.jobs.get(broadcast_id)
+        if not job:
+            return False
+        job.status = "cancelled"
+        job.task.cancel()
+        return True
+
+    def _launch(self, job: BroadcastJob):
+        self.jobs[job.broadcast_id] = job
+        job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: BroadcastJob):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(job, queue)) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(self._report(job))
+        try:
+            cursor = job.cursor
+            while ids := await self.db.get_user_ids_after(cursor, PAGE_SIZE):
+                for user_id in ids:
+                    job.in_flight.add(user_id)
+                    job.dispatched = user_id
+                    await queue.put(user_id)
+                cursor = ids[-1]
+            await queue.join()
+            job.status = "done"
+        finally:
+            reporter.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(reporter, *workers, return_exceptions=True)
+            self.jobs.pop(job.broadcast_id, None)
+            await self._checkpoint(job)
+            if job.status != "running":
+                await self._edit(job)
+
+    async def _worker(self, job: BroadcastJob, queue: asyncio.Queue):
+        while True:
+            user_id = await queue.get()
+            try:
+                job.record(user_id, await self._send(job, user_id))
+            finally:
+                queue.task_done()
+
+    async def _send(self, job: BroadcastJob, chat_id: int) -> str:
+        for attempt in range(MAX_ATTEMPTS):
+            await self.chats.acquire(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, job.text, parse_mode=ParseMode.MARKDOWN)
+                return "sent"
+            except RetryAfter as e:
+                # Flood waits apply to the whole bot, so every worker backs off
+                self.bucket.pause(e.retry_after)
+            except Forbidden:
+                return "blocked"
+            except BadRequest:
+                return "failed"
+            except NetworkError:
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                logger.warning(f"Broadcast {job.broadcast_id} to {chat_id} failed: {e}")
+                return "failed"
+        return "failed"
+
+    async def _checkpoint(self, job: BroadcastJob):
+        cursor, counts = job.checkpoint()
+        await self.db.save_broadcast(job.broadcast_id, job.status, cursor,
+                                     counts["sent"], counts["failed"], counts["blocked"])
+
+    async def _edit(self, job: BroadcastJob):
+        try:
+            await self.bot.edit_message_text(job.render(), chat_id=job.chat_id, message_id=job.message_id)
+        except TelegramError as e:
+            # Skipped edits are fine; the next round carries the newer numbers
+            logger.debug(f"Broadcast {job.broadcast_id} progress edit failed: {e}")
+
+    async def _report(self, job: BroadcastJob):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            await self._checkpoint(job)
+            await self._edit(job)
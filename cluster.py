@@ -0,0 +1,309 @@
+import os
+import hmac
+import time
+import bisect
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+# Port the control plane takes worker heartbeats on; 0 keeps every bot on this host
+CLUSTER_PORT = int(os.getenv("CLUSTER_PORT", "0"))
+CLUSTER_LISTEN = os.getenv("CLUSTER_LISTEN", "127.0.0.1")
+# Shared by the control plane and every worker; sent with each request both ways
+CLUSTER_SECRET = os.getenv("CLUSTER_SECRET", "")
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "5"))
+# A node that misses this many seconds of heartbeats is treated as gone
+NODE_TIMEOUT = float(os.getenv("NODE_TIMEOUT", str(HEARTBEAT_INTERVAL * 3)))
+# Points per node on the ring; more points spread bots more evenly
+VIRTUAL_NODES = 128
+RPC_TIMEOUT = 30
+TOKEN_HEADER = "X-Cluster-Token"
+# Statuses of bots meant to be up; a node reporting on any other bot may be telling
+# of a run that was stopped after its report was sent
+ACTIVE_STATUSES = ("running", "restarting")
+
+
+def authorized(request: web.Request, secret: str) -> bool:
+    return hmac.compare_digest(request.headers.get(TOKEN_HEADER, ""), secret)
+
+
+# ----------------- HASH RING -----------------
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Adding or removing a node only moves the keys that node gains or loses, about 1/N
+    of them. Every other key keeps its owner.
+    """
+
+    def __init__(self, vnodes: int = VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.nodes: Set[str] = set()
+        self._points: List[int] = []
+        self._owners: List[str] = []
+
+    def add(self, node_id: str):
+        if node_id not in self.nodes:
+            self.nodes.add(node_id)
+            self._rebuild()
+
+    def remove(self, node_id: str):
+        if node_id in self.nodes:
+            self.nodes.discard(node_id)
+            self._rebuild()
+
+    def _rebuild(self):
+        points = sorted((_ring_hash(f"{node_id}#{i}"), node_id)
+                        for node_id in self.nodes for i in range(self.vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node_id for _, node_id in points]
+
+    def owner(self, key) -> Optional[str]:
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _ring_hash(str(key))) % len(self._points)
+        return self._owners[i]
+
+
+# ----------------- WORKER NODES -----------------
+class WorkerNode:
+    def __init__(self, node_id: str, url: str):
+        self.node_id = node_id
+        self.url = url.rstrip("/")
+        self.boot: Optional[str] = None
+        self.last_seen = time.monotonic()
+        # bot_id -> status, as of the last heartbeat; None until the first one
+        self.reported: Optional[Dict[int, str]] = None
+        # (cpu percent, memory MB) the node offers to bots; None if it doesn't say
+        self.capacity: Optional[Tuple[float, float]] = None
+
+
+StatusCallback = Callable[[int, str], Awaitable[None]]
+MetricsCallback = Callable[[int, float, float, int, Optional[int]], None]
+
+
+class ClusterManager:
+    """Control-plane side of the cluster: worker membership, placement and bot RPCs.
+
+    Workers register by heartbeating. Each bot belongs to the worker that owns its id on
+    the hash ring, unless a scheduler places it by load instead. Whenever membership
+    changes, on_change is called so the caller can move the bots whose owner changed.
+    Bot directories are expected on storage every node shares, at the same path.
+    """
+
+    def __init__(self, database, on_status: Optional[StatusCallback] = None,
+                 on_metrics: Optional[MetricsCallback] = None, port: int = CLUSTER_PORT,
+                 listen: str = CLUSTER_LISTEN, secret: str = CLUSTER_SECRET,
+                 timeout: float = NODE_TIMEOUT):
+        self.db = database
+        self.on_status = on_status
+        self.on_metrics = on_metrics
+        self.on_change: Optional[Callable[[], Awaitable[None]]] = None
+        self.port = port
+        self.listen = listen
+        self.secret = secret
+        self.timeout = timeout
+        self.nodes: Dict[str, WorkerNode] = {}
+        self.ring = HashRing()
+        # Bots with a start/stop RPC in flight; heartbeats must not second-guess them
+        self.pending: Set[int] = set()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._runner = None
+        self._monitor: Optional[asyncio.Task] = None
+        self._change: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.port)
+
+    def owner(self, bot_id: int) -> Optional[WorkerNode]:
+        node_id = self.ring.owner(bot_id)
+        return self.nodes.get(node_id) if node_id else None
+
+    def is_live(self, node_id: Optional[str]) -> bool:
+        return node_id in self.nodes
+
+    def lost(self, bot) -> bool:
+        """Whether the node a bot is placed on no longer reports it (e.g. after a worker restart)."""
+        node = self.nodes.get(bot[12]) if bot[12] else None
+        return bool(node and node.reported is not None and bot[0] not in node.reported
+                    and bot[0] not in self.pending)
+
+    def needs_move(self, bot) -> bool:
+        """Whether a running bot is not where the ring wants it, or its node lost it."""
+        return self.ring.owner(bot[0]) != bot[12] or self.lost(bot)
+
+    # ----------------- LIFECYCLE -----------------
+    async def start(self):
+        if not self.enabled:
+            return
+        if not self.secret:
+            raise RuntimeError("CLUSTER_SECRET must be set when CLUSTER_PORT is")
+        self._client = httpx.AsyncClient(timeout=RPC_TIMEOUT, headers={TOKEN_HEADER: self.secret})
+        # Nodes up at shutdown get a full timeout to heartbeat again before their bots move
+        for row in await self.db.get_nodes("up"):
+            self._join(row[0], row[1])
+        app = web.Application()
+        app.router.add_post("/cluster/heartbeat", self._heartbeat)
+        app.router.add_post("/cluster/status", self._status)
+        app.router.add_post("/cluster/leave", self._leave)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        self._monitor = asyncio.create_task(self._watch_nodes())
+        logger.info(f"Cluster control listening on {self.listen}:{self.port} with {len(self.nodes)} known nodes")
+
+    async def stop(self):
+        for task in (self._monitor, self._change):
+            if task:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._monitor, self._change) if t), return_exceptions=True)
+        if self._runner:
+            await self._runner.cleanup()
+        if self._client:
+            await self._client.aclose()
+
+    def _join(self, node_id: str, url: str) -> WorkerNode:
+        node = self.nodes[node_id] = WorkerNode(node_id, url)
+        self.ring.add(node_id)
+        return node
+
+    async def _drop(self, node_id: str, reason: str):
+        node = self.nodes.pop(node_id, None)
+        if node:
+            self.ring.remove(node_id)
+            logger.warning(f"Node {node_id} left the cluster ({reason})")
+            await self.db.save_node(node_id, node.url, "down")
+            self._changed()
+
+    def _changed(self):
+        # Bursts of joins/leaves coalesce; a change during a run queues exactly one more
+        self._dirty = True
+        if self.on_change and (self._change is None or self._change.done()):
+            self._change = asyncio.create_task(self._run_change())
+
+    async def _run_change(self):
+        while self._dirty:
+            self._dirty = False
+            await asyncio.sleep(0.5)
+            try:
+                await self.on_change()
+            except Exception as e:
+                logger.error(f"Rebalance failed: {e}")
+
+    async def _watch_nodes(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            for node in list(self.nodes.values()):
+                if now - node.last_seen > self.timeout:
+                    await self._drop(node.node_id, "heartbeat timeout")
+
+    # ----------------- RPC TO WORKERS -----------------
+    async def _rpc(self, node: WorkerNode, path: str, payload: dict) -> Dict[str, any]:
+        try:
+            response = await self._client.post(node.url + path, json=payload)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            return {"success": False, "message": f"Node {node.node_id} unreachable: {e}"}
+
+    async def start_bot(self, node: WorkerNode, bot_id: int, bot_type: str, file_path: str,
+                        premium: bool) -> Dict[str, any]:
+        self.pending.add(bot_id)
+        try:
+            result = await self._rpc(node, f"/bots/{bot_id}/start",
+                                     {"bot_type": bot_type, "file_path": file_path, "premium": premium})
+        finally:
+            self.pending.discard(bot_id)
+        if result.get("success") and node.reported is not None:
+            node.reported[bot_id] = "running"
+        return result
+
+    async def stop_bot(self, node_id: str, bot_id: int) -> Dict[str, any]:
+        node = self.nodes.get(node_id)
+        if node is None:
+            # A node that is gone has nothing left running for us to stop
+            return {"success": True, "message": "Bot stopped"}
+        self.pending.add(bot_id)
+        try:
+            result = await self._rpc(node, f"/bots/{bot_id}/stop", {})
+        finally:
+            self.pending.discard(bot_id)
+        if result.get("success") and node.reported is not None:
+            node.reported.pop(bot_id, None)
+        return result
+
+    # ----------------- HTTP HANDLERS -----------------
+    async def _heartbeat(self, request: web.Request) -> web.Response:
+        if not authorized(request, self.secret):
+            return web.Response(status=403)
+        data = await request.json()
+        node_id = data["node_id"]
+        node = self.nodes.get(node_id)
+        joined = node is None
+        if joined:
+            node = self._join(node_id, data["url"])
+            logger.info(f"Node {node_id} joined the cluster at {data['url']}")
+        node.url = data["url"].rstrip("/")
+        node.last_seen = time.monotonic()
+        if node.boot != data["boot"]:
+            # New or restarted worker process: check its bots are all there
+            node.boot = data["boot"]
+            joined = True
+        node.reported = {int(bot_id): info["status"] for bot_id, info in data["bots"].items()}
+        capacity = data.get("capacity")
+        node.capacity = (float(capacity["cpu"]), float(capacity["memory"])) if capacity else None
+        await self.db.save_node(node_id, node.url, "up")
+
+        for bot_id, info in data["bots"].items():
+            bot_id = int(bot_id)
+            if bot_id in self.pending:
+                continue
+            bot = await self.db.get_bot(bot_id)
+            if not bot or bot[12] != node_id:
+                # Left over from before a failover, or deleted while the node was unreachable
+                logger.warning(f"Node {node_id} runs bot {bot_id} it no longer owns, stopping it")
+                asyncio.create_task(self._rpc(node, f"/bots/{bot_id}/stop", {}))
+                continue
+            if info["status"] != bot[6] and bot[6] in ACTIVE_STATUSES and self.on_status:
+                await self.on_status(bot_id, info["status"])
+            if self.on_metrics and info.get("cpu") is not None:
+                self.on_metrics(bot_id, info["cpu"], info["memory"], info["uptime"], info.get("net"))
+        if joined:
+            self._changed()
+        return web.json_response({"ok": True})
+
+    async def _status(self, request: web.Request) -> web.Response:
+        if not authorized(request, self.secret):
+            return web.Response(status=403)
+        data = await request.json()
+        bot = await self.db.get_bot(int(data["bot_id"]))
+        # Only the node a bot is placed on gets to change its status, and only while it is meant to run
+        if bot and bot[12] == data["node_id"] and bot[6] in ACTIVE_STATUSES and self.on_status:
+            await self.on_status(bot[0], data["status"])
+        return web.json_response({"ok": True})
+
+    async def _leave(self, request: web.Request) -> web.Response:
+        if not authorized(request, self.secret):
+            return web.Response(status=403)
+        data = await request.json()
+        await self._drop(data["node_id"], "shut down")
+        return web.json_response({"ok": True})
+
+    def describe(self) -> List[Dict[str, any]]:
+        now = time.monotonic()
+        return [{"node_id": node.node_id, "url": node.url, "bots": len(node.reported or ()),
+                 "capacity": node.capacity, "last_seen": now - node.last_seen}
+                for node in sorted(self.nodes.values(), key=lambda n: n.node_id)]
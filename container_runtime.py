@@ -0,0 +1,243 @@
+import os
+import asyncio
+import logging
+import tarfile
+import threading
+from typing import Dict, Iterator, List
+
+import docker
+from docker.errors import DockerException, ImageNotFound
+
+from deps import PYTHON_DEPS_DIR
+from supervisor import BotProcess
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+# Every bot of a language shares one base image, so its layers are stored and cached once
+BASE_IMAGES = {
+    "python": os.getenv("PYTHON_BASE_IMAGE", "python:3.11-slim"),
+    "javascript": os.getenv("NODE_BASE_IMAGE", "node:20-slim"),
+}
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "4"))
+CONTAINER_WORKDIR = "/app"
+POOL_LABEL = "bothost.pool"
+# Bot directories are tarred straight into the upload in pieces this big, never whole
+COPY_CHUNK = 256 * 1024
+CPU_PERIOD = 100000
+PLAN_LIMITS = {
+    "free": {"mem_limit": "512m", "cpu_quota": 50000},      # 512 MB, half a core
+    "premium": {"mem_limit": "1g", "cpu_quota": 100000},    # 1 GB, one core
+}
+
+
+# ----------------- CONTAINER HANDLE -----------------
+class ContainerHandle:
+    """Stands in for an asyncio Process: exposes pid, returncode and wait()."""
+
+    def __init__(self, exec_id: str, pid: int):
+        self.exec_id = exec_id
+        self.pid = pid
+        self.returncode = None
+        self._done = asyncio.get_running_loop().create_future()
+
+    def _finish(self, returncode: int):
+        if not self._done.done():
+            self.returncode = returncode
+            self._done.set_result(returncode)
+
+    async def wait(self) -> int:
+        return await asyncio.shield(self._done)
+
+
+# ----------------- DOCKER RUNTIME -----------------
+class DockerRuntime:
+    """Runs each bot in its own container, claimed from a warm pool of paused ones.
+
+    Pool containers idle on `sleep infinity`; starting a bot unpauses one, applies the
+    plan's cgroup limits, copies the bot in and execs it, so no cold create is on the
+    critical path. Pass `client` (or set DOCKER_HOST) to run against a fake Docker API.
+    """
+
+    name = "docker"
+
+    def __init__(self, client=None, pool_size: int = WARM_POOL_SIZE):
+        self.client = client
+        self.pool_size = pool_size
+        self.pool: Dict[str, List] = {bot_type: [] for bot_type in BASE_IMAGES}
+        self._refills: Dict[str, asyncio.Task] = {}
+
+    async def startup(self):
+        if self.client is None:
+            self.client = await asyncio.to_thread(docker.from_env)
+        await asyncio.to_thread(self._prepare)
+        for bot_type in BASE_IMAGES:
+            self._schedule_refill(bot_type)
+
+    def _prepare(self):
+        for image in BASE_IMAGES.values():
+            try:
+                self.client.images.get(image)
+            except ImageNotFound:
+                logger.info(f"Pulling base image {image}")
+                self.client.images.pull(image)
+        # Containers left over from a previous run are not tracked any more
+        for container in self.client.containers.list(all=True, filters={"label": POOL_LABEL}):
+            container.remove(force=True)
+
+    def _create(self, bot_type: str):
+        limits = PLAN_LIMITS["free"]
+        container = self.client.containers.create(
+            BASE_IMAGES[bot_type], command=["sleep", "infinity"], working_dir=CONTAINER_WORKDIR,
+            labels={POOL_LABEL: bot_type}, detach=True,
+            mem_limit=limits["mem_limit"], cpu_period=CPU_PERIOD, cpu_quota=limits["cpu_quota"]
+        )
+        container.start()
+        return container
+
+    def _fill(self, bot_type: str):
+        while len(self.pool[bot_type]) < self.pool_size:
+            container = self._create(bot_type)
+            container.pause()
+            self.pool[bot_type].append(container)
+
+    def _schedule_refill(self, bot_type: str):
+        task = self._refills.get(bot_type)
+        if task is None or task.done():
+            self._refills[bot_type] = asyncio.create_task(self._refill(bot_type))
+
+    async def _refill(self, bot_type: str):
+        try:
+            await asyncio.to_thread(self._fill, bot_type)
+        except DockerException as e:
+            logger.error(f"Warm pool refill for {bot_type} failed: {e}")
+
+    def _claim(self, bot_type: str, premium: bool):
+        try:
+            container = self.pool[bot_type].pop()
+            container.unpause()
+        except IndexError:
+            logger.info(f"Warm pool for {bot_type} empty, creating a container cold")
+            container = self._create(bot_type)
+        limits = PLAN_LIMITS["premium" if premium else "free"]
+        container.update(mem_limit=limits["mem_limit"], memswap_limit=limits["mem_limit"],
+                         cpu_period=CPU_PERIOD, cpu_quota=limits["cpu_quota"])
+        return container
+
+    @staticmethod
+    def _tar_stream(bot_dir) -> Iterator[bytes]:
+        """The bot directory as a tar, produced by a thread while the upload consumes it.
+
+        Installed modules make bot directories large; this keeps memory at one pipe's
+        worth whatever their size, and the daemon unpacks while the rest is still read.
+        """
+        read_fd, write_fd = os.pipe()
+        failure = []
+
+        def produce():
+            try:
+                with os.fdopen(write_fd, "wb") as out, tarfile.open(fileobj=out, mode="w|") as tar:
+                    for entry in os.listdir(bot_dir):
+                        # Logs stay on the host; the platform writes them from the exec stream
+                        if entry not in ("bot.log", "logs"):
+                            tar.add(os.path.join(bot_dir, entry), arcname=entry)
+            except Exception as e:
+                failure.append(e)
+
+        producer = threading.Thread(target=produce, name="bot-copy-in", daemon=True)
+        producer.start()
+        with os.fdopen(read_fd, "rb") as src:
+            while chunk := src.read(COPY_CHUNK):
+                yield chunk
+        producer.join()
+        if failure:
+            raise failure[0]
+
+    def _copy_in(self, container, bot_dir):
+        container.put_archive(CONTAINER_WORKDIR, self._tar_stream(bot_dir))
+
+    def _exec(self, proc: BotProcess):
+        binary = "python" if proc.bot_type == "python" else "node"
+        cmd = [binary, "-u", proc.main_file.name] if binary == "python" else [binary, proc.main_file.name]
+        environment = {"PYTHONPATH": f"{CONTAINER_WORKDIR}/{PYTHON_DEPS_DIR}"} if binary == "python" else None
+        exec_id = self.client.api.exec_create(proc.container_id, cmd, workdir=CONTAINER_WORKDIR,
+                                              stdout=True, stderr=True, environment=environment)["Id"]
+        stream = self.client.api.exec_start(exec_id, stream=True)
+        return exec_id, stream, self.client.api.exec_inspect(exec_id).get("Pid") or 0
+
+    async def spawn(self, proc: BotProcess):
+        loop = asyncio.get_running_loop()
+        if proc.container_id is None:
+            container = await asyncio.to_thread(self._claim, proc.bot_type, proc.premium)
+            proc.container_id = container.id
+            self._schedule_refill(proc.bot_type)
+            await asyncio.to_thread(self._copy_in, container, proc.cwd)
+        exec_id, stream, pid = await asyncio.to_thread(self._exec, proc)
+        handle = ContainerHandle(exec_id, pid)
+        proc.process = handle
+        proc.pump = loop.create_future()
+        # A dedicated thread per bot: the blocking stream must not tie up the shared executor
+        threading.Thread(target=self._pump, args=(proc, handle, stream, loop),
+                         name=f"bot-{proc.bot_id}-output", daemon=True).start()
+
+    def _pump(self, proc: BotProcess, handle: ContainerHandle, stream, loop):
+        pending = b""
+        try:
+            for chunk in stream:
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    loop.call_soon_threadsafe(proc.log_store.append, line + b"\n")
+                loop.call_soon_threadsafe(proc.log_store.flush)
+            if pending:
+                loop.call_soon_threadsafe(proc.log_store.append, pending)
+            returncode = self.client.api.exec_inspect(handle.exec_id).get("ExitCode")
+        except DockerException as e:
+            logger.error(f"Output stream for bot {proc.bot_id} failed: {e}")
+            returncode = -1
+        loop.call_soon_threadsafe(handle._finish, -1 if returncode is None else returncode)
+        loop.call_soon_threadsafe(lambda: proc.pump.done() or proc.pump.set_result(None))
+
+    def stats(self, container_id: str) -> dict:
+        """One reading of a bot container's counters from the daemon; empty if it can't be read.
+
+        Blocking. The exec'd bot's PID lives in the host's PID namespace, which the platform
+        usually can't see, so this is the only way to measure it.
+        """
+        try:
+            return self.client.api.stats(container_id, stream=False, one_shot=True)
+        except DockerException as e:
+            logger.debug(f"Reading stats of container {container_id[:12]} failed: {e}")
+            return {}
+
+    def _signal(self, container_id: str, sig: int):
+        # kill -1 reaches every process except PID 1 (the idle sleep), so the container survives
+        exec_id = self.client.api.exec_create(container_id, ["sh", "-c", f"kill -{int(sig)} -1"])["Id"]
+        self.client.api.exec_start(exec_id)
+
+    async def signal(self, proc: BotProcess, sig: int):
+        if proc.container_id:
+            try:
+                await asyncio.to_thread(self._signal, proc.container_id, sig)
+            except DockerException as e:
+                logger.error(f"Signalling bot {proc.bot_id} failed: {e}")
+
+    async def release(self, proc: BotProcess):
+        if proc.container_id:
+            container_id, proc.container_id = proc.container_id, None
+            try:
+                await asyncio.to_thread(self.client.api.remove_container, container_id, force=True)
+            except DockerException as e:
+                logger.error(f"Removing container of bot {proc.bot_id} failed: {e}")
+
+    async def shutdown(self):
+        for task in self._refills.values():
+            task.cancel()
+        spares = [c for containers in self.pool.values() for c in containers]
+        for containers in self.pool.values():
+            containers.clear()
+        for container in spares:
+            try:
+                await asyncio.to_thread(container.remove, force=True)
+            except DockerException:
+                pass
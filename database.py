@@ -1,198 +1,829 @@
+import time
+import queue
+import logging
 import sqlite3
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict
+
+from state_cache import BotRecord, RecordCache, UserRecord
+
+POOL_SIZE = 8
+POOL_TIMEOUT = 30.0
+# Per-connection cache of compiled statements; every query below is a constant string,
+# so each one is prepared once per connection and reused afterwards.
+STATEMENT_CACHE_SIZE = 256
+# Write-behind batching: a batch is committed once it holds WRITE_BATCH_ROWS rows
+# or WRITE_FLUSH_INTERVAL seconds after its first row, whichever comes first.
+WRITE_BATCH_ROWS = 500
+WRITE_FLUSH_INTERVAL = 0.05
+WRITE_QUEUE_SIZE = 10000
+# A batch the database refused is retried this long after, together with newer rows;
+# on shutdown it gets WRITE_SHUTDOWN_RETRIES more attempts before it is given up
+WRITE_RETRY_INTERVAL = 1.0
+WRITE_SHUTDOWN_RETRIES = 5
+# Least recently used validation verdicts beyond this many are dropped
+VALIDATION_CACHE_ROWS = 20000
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------- SCHEMA MIGRATIONS -----------------
+# bot.py used to create its own tables with different column names; these map them
+# onto the canonical schema. Column positions are the same in both, so renaming in
+# place keeps every tuple index stable.
+COLUMN_RENAMES = {
+    'users': {'name': 'first_name', 'joined': 'join_date', 'banned': 'is_banned', 'premium': 'is_premium'},
+    'bots': {'name': 'bot_name'},
+}
+
+COLUMN_ADDITIONS = {
+    'users': [('github_token', 'TEXT')],
+    'bots': [
+        ('created_at', 'TEXT'),
+        ('last_active', 'TEXT'),
+        ('cpu_usage', 'REAL DEFAULT 0'),
+        ('memory_usage', 'REAL DEFAULT 0'),
+        ('uptime', 'INTEGER DEFAULT 0'),
+    ],
+}
+
+
+def _table_columns(conn, table: str):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _reconcile_schema(conn):
+    for table, renames in COLUMN_RENAMES.items():
+        columns = _table_columns(conn, table)
+        for old, new in renames.items():
+            if old in columns and new not in columns:
+                conn.execute(f'ALTER TABLE {table} RENAME COLUMN {old} TO {new}')
+    for table, additions in COLUMN_ADDITIONS.items():
+        columns = _table_columns(conn, table)
+        for column, decl in additions:
+            if column not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+def _add_lookup_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bots_user_status ON bots(user_id, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_bot_timestamp ON logs(bot_id, timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_modules_bot ON modules(bot_id)')
+
+
+def _add_metric_series(conn):
+    # One compact blob of downsampled CPU/memory buckets per bot (see timeseries.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metric_series (
+            bot_id INTEGER PRIMARY KEY,
+            data BLOB,
+            updated_at TEXT
+        )
+    ''')
+
+
+def _add_validation_cache(conn):
+    # language carries the validator version too, e.g. "python:1"
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS validation_cache (
+            sha256 TEXT,
+            language TEXT,
+            result TEXT,
+            requirements TEXT,
+            last_used REAL,
+            PRIMARY KEY (sha256, language)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_validation_last_used ON validation_cache(last_used)')
+
+
+def _add_broadcasts(conn):
+    # cursor is the user_id below which every recipient has been handled
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            broadcast_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            message_id INTEGER,
+            text TEXT,
+            status TEXT DEFAULT 'running',
+            cursor INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+
+
+def _add_node_placement(conn):
+    # node_id is the worker a bot was last placed on; NULL means this host
+    conn.execute('ALTER TABLE bots ADD COLUMN node_id TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bots_node ON bots(node_id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS nodes (
+            node_id TEXT PRIMARY KEY,
+            url TEXT,
+            status TEXT,
+            joined_at TEXT,
+            last_seen REAL
+        )
+    ''')
+
+
+def _add_wake_schedule(conn):
+    # Comma-separated HH:MM (UTC) times a hibernated bot is started again, e.g. "08:00,20:30"
+    conn.execute('ALTER TABLE bots ADD COLUMN wake_at TEXT')
+
+
+# Append-only: each entry runs once, in order, and bumps PRAGMA user_version
+MIGRATIONS = [
+    (1, _reconcile_schema),
+    (2, _add_lookup_indexes),
+    (3, _add_metric_series),
+    (4, _add_validation_cache),
+    (5, _add_broadcasts),
+    (6, _add_node_placement),
+    (7, _add_wake_schedule),
+]
+
+
+class ConnectionPool:
+    def __init__(self, db_path: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+
+    def release(self, conn):
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def _merge_status(older, newer):
+    # The newest status wins, but a container_id set earlier in the batch must survive it
+    if older is None or newer[2]:
+        return newer
+    return (newer[0], newer[1], older[2], older[3])
+
+
+class WriteBehindQueue:
+    """Background writer that groups log inserts and status changes into one transaction.
+
+    Rows of a batch that fails are kept and retried with the next one instead of dropped.
+    """
+
+    _STOP = object()
+
+    def __init__(self, pool: ConnectionPool, batch_rows: int = WRITE_BATCH_ROWS,
+                 flush_interval: float = WRITE_FLUSH_INTERVAL, max_pending: int = WRITE_QUEUE_SIZE):
+        self.pool = pool
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        # A bounded queue gives backpressure: producers block once max_pending rows are waiting
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.max_pending = max_pending
+        # Rows of the last failed batch: logs in order, statuses by bot
+        self._retry_logs = []
+        self._retry_statuses = {}
+        self._retry_at = 0.0
+        self._pending_status = {}
+        self._status_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def add_log(self, bot_id: int, log_type: str, log_message: str):
+        self._put(('log', (bot_id, log_type, log_message, datetime.now().isoformat())))
+
+    def update_status(self, bot_id: int, status: str, container_id: str = None):
+        with self._status_lock:
+            self._pending_status[bot_id] = status
+        self._put(('status', (bot_id, status, container_id, datetime.now().isoformat())))
+
+    def pending_status(self, bot_id: int):
+        with self._status_lock:
+            return self._pending_status.get(bot_id)
+
+    def has_pending_status(self) -> bool:
+        with self._status_lock:
+            return bool(self._pending_status)
+
+    def _put(self, item):
+        if self._closed:
+            raise RuntimeError('Write-behind queue is closed')
+        self._queue.put(item)
+
+    def flush(self, timeout: float = None):
+        done = threading.Event()
+        self._put(('flush', done))
+        done.wait(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._has_retry() and time.monotonic() >= self._retry_at:
+                    self._write([])
+                continue
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if item[0] == 'flush' or len(batch) >= self.batch_rows:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._write(batch)
+        # Nothing will come along to retry a failed batch any more, so insist now
+        for attempt in range(WRITE_SHUTDOWN_RETRIES):
+            if not self._has_retry():
+                return
+            time.sleep(WRITE_RETRY_INTERVAL * 2 ** attempt)
+            self._write([])
+        if self._has_retry():
+            logger.error(f"Dropping {len(self._retry_logs)} log rows and {len(self._retry_statuses)} "
+                         f"status changes the database would not take")
+
+    def _has_retry(self) -> bool:
+        return bool(self._retry_logs or self._retry_statuses)
+
+    def _write(self, batch):
+        logs, self._retry_logs = self._retry_logs, []
+        statuses, self._retry_statuses = self._retry_statuses, {}
+        waiters = []
+        for kind, payload in batch:
+            if kind == 'log':
+                logs.append(payload)
+            elif kind == 'status':
+                # Only the newest status per bot in a batch needs to reach disk
+                statuses[payload[0]] = _merge_status(statuses.get(payload[0]), payload)
+            else:
+                waiters.append(payload)
+        written = statuses
+        try:
+            if logs or statuses:
+                with self.pool.connection() as conn:
+                    if logs:
+                        conn.executemany('''
+                            INSERT INTO logs (bot_id, log_type, log_message, timestamp)
+                            VALUES (?, ?, ?, ?)
+                        ''', logs)
+                    for bot_id, status, container_id, now in statuses.values():
+                        if container_id:
+                            conn.execute('''
+                                UPDATE bots SET status = ?, container_id = ?, last_active = ?
+                                WHERE bot_id = ?
+                            ''', (status, container_id, now, bot_id))
+                        else:
+                            conn.execute('UPDATE bots SET status = ? WHERE bot_id = ?', (status, bot_id))
+        except sqlite3.Error as e:
+            logger.error(f"Write-behind batch of {len(logs) + len(statuses)} rows failed, retrying: {e}")
+            written = {}
+            # Statuses stay pending, so readers keep seeing them until they are on disk
+            self._retry_statuses = statuses
+            self._retry_logs = logs[-self.max_pending:]
+            if len(logs) > self.max_pending:
+                logger.error(f"Dropping {len(logs) - self.max_pending} oldest unwritten log rows")
+            self._retry_at = time.monotonic() + WRITE_RETRY_INTERVAL
+        finally:
+            with self._status_lock:
+                for bot_id, status, _, _ in written.values():
+                    if self._pending_status.get(bot_id) == status:
+                        del self._pending_status[bot_id]
+            for done in waiters:
+                done.set()
+
+    def close(self):
+        # Blocks until everything queued so far has been committed
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+
 
 class Database:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool_size: int = POOL_SIZE):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, pool_size)
         self.init_db()
-    
+        self.writer = WriteBehindQueue(self.pool)
+
     def init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                join_date TEXT,
-                is_banned INTEGER DEFAULT 0,
-                total_bots INTEGER DEFAULT 0,
-                is_premium INTEGER DEFAULT 0
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bots (
-                bot_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                bot_name TEXT,
-                bot_type TEXT,
-                file_path TEXT,
-                container_id TEXT,
-                status TEXT,
-                created_at TEXT,
-                last_active TEXT,
-                cpu_usage REAL DEFAULT 0,
-                memory_usage REAL DEFAULT 0,
-                uptime INTEGER DEFAULT 0,
-                FOREIGN KEY(user_id) REFERENCES users(user_id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS modules (
-                module_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                bot_id INTEGER,
-                module_name TEXT,
-                version TEXT,
-                install_date TEXT,
-                FOREIGN KEY(bot_id) REFERENCES bots(bot_id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS logs (
-                log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                bot_id INTEGER,
-                log_type TEXT,
-                log_message TEXT,
-                timestamp TEXT,
-                FOREIGN KEY(bot_id) REFERENCES bots(bot_id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    first_name TEXT,
+                    join_date TEXT,
+                    is_banned INTEGER DEFAULT 0,
+                    total_bots INTEGER DEFAULT 0,
+                    is_premium INTEGER DEFAULT 0,
+                    github_token TEXT
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bots (
+                    bot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    bot_name TEXT,
+                    bot_type TEXT,
+                    file_path TEXT,
+                    container_id TEXT,
+                    status TEXT,
+                    created_at TEXT,
+                    last_active TEXT,
+                    cpu_usage REAL DEFAULT 0,
+                    memory_usage REAL DEFAULT 0,
+                    uptime INTEGER DEFAULT 0,
+                    FOREIGN KEY(user_id) REFERENCES users(user_id)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS modules (
+                    module_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bot_id INTEGER,
+                    module_name TEXT,
+                    version TEXT,
+                    install_date TEXT,
+                    FOREIGN KEY(bot_id) REFERENCES bots(bot_id)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS logs (
+                    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bot_id INTEGER,
+                    log_type TEXT,
+                    log_message TEXT,
+                    timestamp TEXT,
+                    FOREIGN KEY(bot_id) REFERENCES bots(bot_id)
+                )
+            ''')
+
+        self.migrate()
+
+    def migrate(self):
+        with self.pool.connection() as conn:
+            for version, migration in MIGRATIONS:
+                # IMMEDIATE takes the write lock up front, so two processes starting
+                # together cannot both apply the same step
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                        conn.rollback()
+                        continue
+                    migration(conn)
+                    conn.execute(f'PRAGMA user_version = {version}')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                logger.info(f"Applied database migration {version}: {migration.__name__}")
+
     def add_user(self, user_id: int, username: str, first_name: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR IGNORE INTO users (user_id, username, first_name, join_date)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, username, first_name, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
-    
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO users (user_id, username, first_name, join_date)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, username, first_name, datetime.now().isoformat()))
+
     def get_user(self, user_id: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        user = cursor.fetchone()
-        conn.close()
-        return user
-    
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+
+    def set_premium(self, user_id: int, is_premium: bool):
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE users SET is_premium = ? WHERE user_id = ?', (int(is_premium), user_id))
+
+    def set_github_token(self, user_id: int, token: str):
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE users SET github_token = ? WHERE user_id = ?', (token, user_id))
+
     def add_bot(self, user_id: int, bot_name: str, bot_type: str, file_path: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO bots (user_id, bot_name, bot_type, file_path, status, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, bot_name, bot_type, file_path, 'stopped', datetime.now().isoformat()))
-        bot_id = cursor.lastrowid
-        cursor.execute('UPDATE users SET total_bots = total_bots + 1 WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
-        return bot_id
-    
+        with self.pool.connection() as conn:
+            cursor = conn.execute('''
+                INSERT INTO bots (user_id, bot_name, bot_type, file_path, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, bot_name, bot_type, file_path, 'stopped', datetime.now().isoformat()))
+            conn.execute('UPDATE users SET total_bots = total_bots + 1 WHERE user_id = ?', (user_id,))
+            return cursor.lastrowid
+
+    def update_bot_file(self, bot_id: int, file_path: str, bot_type: str):
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE bots SET file_path = ?, bot_type = ? WHERE bot_id = ?',
+                         (file_path, bot_type, bot_id))
+
+    def _with_pending_status(self, bot):
+        # Status writes are batched, so overlay anything not yet committed
+        status = self.writer.pending_status(bot[0]) if bot else None
+        if status is None:
+            return bot
+        return bot[:6] + (status,) + bot[7:]
+
     def get_user_bots(self, user_id: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM bots WHERE user_id = ?', (user_id,))
-        bots = cursor.fetchall()
-        conn.close()
-        return bots
-    
+        with self.pool.connection() as conn:
+            bots = conn.execute('SELECT * FROM bots WHERE user_id = ?', (user_id,)).fetchall()
+        return [self._with_pending_status(bot) for bot in bots]
+
+    def get_bots_page(self, cursor: int, forward: bool = True, limit: int = 20):
+        with self.pool.connection() as conn:
+            rows, more = self._page(conn, 'bots', 'bot_id', cursor, forward, limit)
+        return [self._with_pending_status(bot) for bot in rows], more
+
+    def count_bots_by_status(self):
+        if self.writer.has_pending_status():
+            self.writer.flush()
+        with self.pool.connection() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM bots GROUP BY status').fetchall())
+
+    def get_bots_by_status(self, *statuses: str):
+        if self.writer.has_pending_status():
+            self.writer.flush()
+        placeholders = ','.join('?' * len(statuses))
+        with self.pool.connection() as conn:
+            return conn.execute(f'SELECT * FROM bots WHERE status IN ({placeholders})', statuses).fetchall()
+
     def update_bot_status(self, bot_id: int, status: str, container_id: str = None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        if container_id:
-            cursor.execute('''
-                UPDATE bots SET status = ?, container_id = ?, last_active = ?
-                WHERE bot_id = ?
-            ''', (status, container_id, datetime.now().isoformat(), bot_id))
-        else:
-            cursor.execute('UPDATE bots SET status = ? WHERE bot_id = ?', (status, bot_id))
-        conn.commit()
-        conn.close()
-    
+        self.writer.update_status(bot_id, status, container_id)
+
+    def set_bot_node(self, bot_id: int, node_id: str):
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE bots SET node_id = ? WHERE bot_id = ?', (node_id, bot_id))
+
+    def set_wake_times(self, bot_id: int, wake_at: str):
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE bots SET wake_at = ? WHERE bot_id = ?', (wake_at, bot_id))
+
+    def count_bots_by_node(self):
+        if self.writer.has_pending_status():
+            self.writer.flush()
+        with self.pool.connection() as conn:
+            return dict(conn.execute('''
+                SELECT node_id, COUNT(*) FROM bots WHERE status IN ('running', 'restarting') GROUP BY node_id
+            ''').fetchall())
+
+    def save_node(self, node_id: str, url: str, status: str):
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO nodes (node_id, url, status, joined_at, last_seen) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(node_id) DO UPDATE SET url = excluded.url, status = excluded.status,
+                    last_seen = excluded.last_seen
+            ''', (node_id, url, status, datetime.now().isoformat(), time.time()))
+
+    def get_nodes(self, status: str):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT * FROM nodes WHERE status = ?', (status,)).fetchall()
+
+    def update_bot_metrics(self, rows):
+        # rows: (cpu_usage, memory_usage, uptime, bot_id)
+        with self.pool.connection() as conn:
+            conn.executemany('UPDATE bots SET cpu_usage = ?, memory_usage = ?, uptime = ? WHERE bot_id = ?', rows)
+
+    def save_metric_series(self, rows):
+        # rows: (bot_id, blob)
+        now = datetime.now().isoformat()
+        with self.pool.connection() as conn:
+            conn.executemany('INSERT OR REPLACE INTO metric_series (bot_id, data, updated_at) VALUES (?, ?, ?)',
+                             [(bot_id, blob, now) for bot_id, blob in rows])
+
+    def load_metric_series(self):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT bot_id, data FROM metric_series').fetchall()
+
+    def get_validation(self, sha256: str, language: str):
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT result, requirements FROM validation_cache WHERE sha256 = ? AND language = ?',
+                               (sha256, language)).fetchone()
+            if row:
+                conn.execute('UPDATE validation_cache SET last_used = ? WHERE sha256 = ? AND language = ?',
+                             (time.time(), sha256, language))
+            return row
+
+    def save_validation(self, sha256: str, language: str, result: str, requirements: str):
+        with self.pool.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO validation_cache VALUES (?, ?, ?, ?, ?)',
+                         (sha256, language, result, requirements, time.time()))
+            conn.execute('''
+                DELETE FROM validation_cache WHERE rowid IN (
+                    SELECT rowid FROM validation_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            ''', (VALIDATION_CACHE_ROWS,))
+
     def get_bot(self, bot_id: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM bots WHERE bot_id = ?', (bot_id,))
-        bot = cursor.fetchone()
-        conn.close()
-        return bot
-    
+        with self.pool.connection() as conn:
+            bot = conn.execute('SELECT * FROM bots WHERE bot_id = ?', (bot_id,)).fetchone()
+        return self._with_pending_status(bot)
+
     def add_log(self, bot_id: int, log_type: str, log_message: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (bot_id, log_type, log_message, timestamp)
-            VALUES (?, ?, ?, ?)
-        ''', (bot_id, log_type, log_message, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
-    
+        self.writer.add_log(bot_id, log_type, log_message)
+
     def add_module(self, bot_id: int, module_name: str, version: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO modules (bot_id, module_name, version, install_date)
-            VALUES (?, ?, ?, ?)
-        ''', (bot_id, module_name, version, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
-    
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO modules (bot_id, module_name, version, install_date)
+                VALUES (?, ?, ?, ?)
+            ''', (bot_id, module_name, version, datetime.now().isoformat()))
+
     def get_bot_modules(self, bot_id: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM modules WHERE bot_id = ?', (bot_id,))
-        modules = cursor.fetchall()
-        conn.close()
-        return modules
-    
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT * FROM modules WHERE bot_id = ?', (bot_id,)).fetchall()
+
     def get_all_bots(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM bots')
-        bots = cursor.fetchall()
-        conn.close()
-        return bots
-    
+        with self.pool.connection() as conn:
+            bots = conn.execute('SELECT * FROM bots').fetchall()
+        return [self._with_pending_status(bot) for bot in bots]
+
     def get_all_users(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users')
-        users = cursor.fetchall()
-        conn.close()
-        return users
-    
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT * FROM users').fetchall()
+
     def ban_user(self, user_id: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET is_banned = 1 WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
-    
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE users SET is_banned = 1 WHERE user_id = ?', (user_id,))
+
     def unban_user(self, user_id: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET is_banned = 0 WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
-    
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE users SET is_banned = 0 WHERE user_id = ?', (user_id,))
+
+    def count_users(self):
+        # (total, premium, banned) in one pass
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT COUNT(*), SUM(is_premium != 0), SUM(is_banned != 0) FROM users').fetchone()
+            return row[0], row[1] or 0, row[2] or 0
+
+    @staticmethod
+    def _page(conn, table: str, key: str, cursor: int, forward: bool, limit: int):
+        # Keyset pagination: seek past the cursor on the primary key instead of OFFSET.
+        # One extra row is fetched to tell whether another page exists.
+        if forward:
+            sql = f'SELECT * FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?'
+        else:
+            sql = f'SELECT * FROM {table} WHERE {key} < ? ORDER BY {key} DESC LIMIT ?'
+        rows = conn.execute(sql, (cursor, limit + 1)).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return (rows if forward else rows[::-1]), more
+
+    def get_users_page(self, cursor: int, forward: bool = True, limit: int = 20):
+        with self.pool.connection() as conn:
+            return self._page(conn, 'users', 'user_id', cursor, forward, limit)
+
+    def get_user_ids_after(self, user_id: int, limit: int):
+        # Keyset page over the primary key: cost does not grow with the offset
+        with self.pool.connection() as conn:
+            rows = conn.execute('SELECT user_id FROM users WHERE user_id > ? AND is_banned = 0 ORDER BY user_id LIMIT ?',
+                                (user_id, limit)).fetchall()
+            return [row[0] for row in rows]
+
+    def count_active_users(self):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM users WHERE is_banned = 0').fetchone()[0]
+
+    # ----------------- BROADCASTS -----------------
+    def create_broadcast(self, chat_id: int, message_id: int, text: str, total: int):
+        now = datetime.now().isoformat()
+        with self.pool.connection() as conn:
+            cursor = conn.execute('''
+                INSERT INTO broadcasts (chat_id, message_id, text, total, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (chat_id, message_id, text, total, now, now))
+            return cursor.lastrowid
+
+    def save_broadcast(self, broadcast_id: int, status: str, cursor: int, sent: int, failed: int, blocked: int):
+        with self.pool.connection() as conn:
+            conn.execute('''
+                UPDATE broadcasts SET status = ?, cursor = ?, sent = ?, failed = ?, blocked = ?, updated_at = ?
+                WHERE broadcast_id = ?
+            ''', (status, cursor, sent, failed, blocked, datetime.now().isoformat(), broadcast_id))
+
+    def get_broadcasts_by_status(self, status: str):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT * FROM broadcasts WHERE status = ?', (status,)).fetchall()
+
     def delete_bot(self, bot_id: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM bots WHERE bot_id = ?', (bot_id,))
-        result = cursor.fetchone()
-        if result:
-            user_id = result[0]
-            cursor.execute('DELETE FROM bots WHERE bot_id = ?', (bot_id,))
-            cursor.execute('DELETE FROM modules WHERE bot_id = ?', (bot_id,))
-            cursor.execute('DELETE FROM logs WHERE bot_id = ?', (bot_id,))
-            cursor.execute('UPDATE users SET total_bots = total_bots - 1 WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+        # Make sure no queued log rows for this bot land after the delete
+        self.writer.flush()
+        with self.pool.connection() as conn:
+            result = conn.execute('SELECT user_id FROM bots WHERE bot_id = ?', (bot_id,)).fetchone()
+            if result:
+                user_id = result[0]
+                conn.execute('DELETE FROM bots WHERE bot_id = ?', (bot_id,))
+                conn.execute('DELETE FROM modules WHERE bot_id = ?', (bot_id,))
+                conn.execute('DELETE FROM logs WHERE bot_id = ?', (bot_id,))
+                conn.execute('DELETE FROM metric_series WHERE bot_id = ?', (bot_id,))
+                conn.execute('UPDATE users SET total_bots = total_bots - 1 WHERE user_id = ?', (user_id,))
+
+    def close(self):
+        self.writer.close()
+        self.pool.close()
+
+
+class AsyncDatabase:
+    """Awaitable view of a Database; every call runs on a thread sized to the connection pool.
+
+    User and bot rows are served from in-process caches. Every write to those tables
+    must go through this class, which patches or drops the cached copy as it writes.
+    """
+
+    def __init__(self, database: Database):
+        self.sync = database
+        self._executor = ThreadPoolExecutor(max_workers=database.pool.size, thread_name_prefix="db")
+        self.users = RecordCache()
+        self.bots = RecordCache()
+        # user_id -> tuple of that user's bot ids
+        self.owned = RecordCache()
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+        return call
+
+    async def _call(self, name: str, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(getattr(self.sync, name), *args))
+
+    async def _load(self, cache: RecordCache, key, loader):
+        record = cache.get(key)
+        if record is not None:
+            return record
+        token = cache.begin_load(key)
+        record = None
+        try:
+            record = await loader()
+        finally:
+            cache.finish_load(key, token, record)
+        return record
+
+    # ----------------- CACHED READS -----------------
+    async def get_user(self, user_id: int):
+        async def load():
+            row = await self._call('get_user', user_id)
+            return UserRecord(row) if row else None
+        return await self._load(self.users, user_id, load)
+
+    async def get_bot(self, bot_id: int):
+        async def load():
+            row = await self._call('get_bot', bot_id)
+            return BotRecord(row) if row else None
+        return await self._load(self.bots, bot_id, load)
+
+    async def get_user_bots(self, user_id: int):
+        bot_ids = self.owned.get(user_id)
+        if bot_ids is not None:
+            bots = [self.bots.get(bot_id) for bot_id in bot_ids]
+            if all(bots):
+                return bots
+
+        version = self.bots.version
+        records = []
+
+        async def load():
+            records.extend(BotRecord(row) for row in await self._call('get_user_bots', user_id))
+            return tuple(record.bot_id for record in records)
+        await self._load(self.owned, user_id, load)
+        # One query filled many keys, so only keep them if no bot changed meanwhile
+        if self.bots.version == version:
+            for record in records:
+                self.bots.put(record.bot_id, record)
+        return records
+
+    def cache_stats(self) -> Dict[str, dict]:
+        return {'users': self.users.stats(), 'bots': self.bots.stats()}
+
+    # ----------------- WRITE-THROUGH -----------------
+    async def add_user(self, user_id: int, username: str, first_name: str):
+        await self._call('add_user', user_id, username, first_name)
+        self.users.invalidate(user_id)
+
+    async def set_premium(self, user_id: int, is_premium: bool):
+        await self._call('set_premium', user_id, is_premium)
+        self.users.update(user_id, is_premium=int(is_premium))
+
+    async def set_github_token(self, user_id: int, token: str):
+        await self._call('set_github_token', user_id, token)
+        self.users.update(user_id, github_token=token)
+
+    async def ban_user(self, user_id: int):
+        await self._call('ban_user', user_id)
+        self.users.update(user_id, is_banned=1)
+
+    async def unban_user(self, user_id: int):
+        await self._call('unban_user', user_id)
+        self.users.update(user_id, is_banned=0)
+
+    async def add_bot(self, user_id: int, bot_name: str, bot_type: str, file_path: str):
+        bot_id = await self._call('add_bot', user_id, bot_name, bot_type, file_path)
+        self.users.invalidate(user_id)
+        self.owned.invalidate(user_id)
+        return bot_id
+
+    async def update_bot_file(self, bot_id: int, file_path: str, bot_type: str):
+        await self._call('update_bot_file', bot_id, file_path, bot_type)
+        self.bots.update(bot_id, file_path=file_path, bot_type=bot_type)
+
+    async def update_bot_status(self, bot_id: int, status: str, container_id: str = None):
+        await self._call('update_bot_status', bot_id, status, container_id)
+        if container_id:
+            self.bots.update(bot_id, status=status, container_id=container_id,
+                             last_active=datetime.now().isoformat())
+        else:
+            self.bots.update(bot_id, status=status)
+
+    async def set_bot_node(self, bot_id: int, node_id: str):
+        await self._call('set_bot_node', bot_id, node_id)
+        self.bots.update(bot_id, node_id=node_id)
+
+    async def set_wake_times(self, bot_id: int, wake_at: str):
+        await self._call('set_wake_times', bot_id, wake_at)
+        self.bots.update(bot_id, wake_at=wake_at)
+
+    async def update_bot_metrics(self, rows):
+        await self._call('update_bot_metrics', rows)
+        for cpu_usage, memory_usage, uptime, bot_id in rows:
+            self.bots.update(bot_id, cpu_usage=cpu_usage, memory_usage=memory_usage, uptime=uptime)
+
+    async def delete_bot(self, bot_id: int):
+        bot = await self.get_bot(bot_id)
+        await self._call('delete_bot', bot_id)
+        self.bots.invalidate(bot_id)
+        if bot:
+            self.users.invalidate(bot.user_id)
+            self.owned.invalidate(bot.user_id)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.sync.close()
@@ -0,0 +1,470 @@
+import os
+import re
+import csv
+import sys
+import stat
+import json
+import shutil
+import hashlib
+import asyncio
+import itertools
+import tempfile
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# ----------------- CONFIG -----------------
+CACHE_DIR = Path(os.getenv("DEPS_CACHE_DIR", "deps_cache"))
+# Relative to each bot directory; added to PYTHONPATH when the bot runs
+PYTHON_DEPS_DIR = ".deps/python"
+INSTALL_TIMEOUT = 600
+INSTALL_WORKERS = int(os.getenv("INSTALL_WORKERS", "4"))
+# Lower runs first
+PREMIUM_PRIORITY = 0
+FREE_PRIORITY = 1
+# Package specs only: no leading dash (pip/npm options), no paths or URLs
+SPEC_PATTERN = re.compile(r'^[A-Za-z0-9@][A-Za-z0-9._\-/@=<>!~^\[\],]*$')
+# "/" and "@" only ever appear in npm scopes; to pip they mean a local path or a direct reference
+PYTHON_SPEC_FORBIDDEN = "/@"
+# The only variables installers see; builds run tenant-chosen packages and must not
+# inherit the bot token, database or Docker settings of the platform
+BUILD_ENV = ("PATH", "HOME", "LANG", "LC_ALL", "TMPDIR", "HTTP_PROXY", "HTTPS_PROXY", "NO_PROXY",
+             "http_proxy", "https_proxy", "no_proxy", "SSL_CERT_FILE", "SSL_CERT_DIR")
+BUILD_ENV_PREFIXES = ("PIP_", "npm_config_", "NPM_CONFIG_")
+# Specs pinned to one exact version, which the wheel cache alone can satisfy for good
+EXACT_PIN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._\-]*(\[[A-Za-z0-9._\-,]*\])?==[A-Za-z0-9.+!_\-]+$')
+
+
+Progress = Callable[[str], Awaitable[None]]
+
+
+class InstallError(Exception):
+    pass
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _wheel_name_version(wheel: Path) -> Tuple[str, str]:
+    name, version = wheel.name.split("-")[:2]
+    return name, version
+
+
+def _link_file(source: str, target: Path):
+    # A hardlink shares its inode with the store and every other bot linking it, so it
+    # must not be writable, or one tenant could rewrite a module under all the others
+    mode = os.stat(source).st_mode
+    if mode & 0o222:
+        os.chmod(source, stat.S_IMODE(mode) & ~0o222)
+    # Linked beside the target and renamed over it, so a running bot never sees it missing
+    staging = target.with_name(f".{target.name}.link")
+    staging.unlink(missing_ok=True)
+    try:
+        os.link(source, staging)
+    except OSError:
+        shutil.copy2(source, staging)
+    os.replace(staging, target)
+
+
+def link_tree(src: Path, dst: Path):
+    """Mirror `src` into `dst` with hardlinks, falling back to copies across filesystems.
+
+    Files `src` has replace those in `dst`; anything else in `dst` is left alone.
+    """
+    for root, dirs, files in os.walk(src):
+        target_root = dst / os.path.relpath(root, src)
+        target_root.mkdir(parents=True, exist_ok=True)
+        for name in files:
+            _link_file(os.path.join(root, name), target_root / name)
+
+
+def swap_tree(src: Path, dst: Path):
+    """Replace the directory `dst` with a mirror of `src`, built aside and renamed into place."""
+    staging = dst.with_name(f".{dst.name}.staging")
+    retired = dst.with_name(f".{dst.name}.old")
+    for path in (staging, retired):
+        shutil.rmtree(path, ignore_errors=True)
+    link_tree(src, staging)
+    if dst.exists():
+        os.rename(dst, retired)
+    os.rename(staging, dst)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def remove_distribution(site: Path, dist_info: Path):
+    """Delete an installed Python distribution: the files its RECORD lists, then the dist-info."""
+    record = dist_info / "RECORD"
+    parents = set()
+    if record.exists():
+        root = site.resolve()
+        for row in csv.reader(record.read_text(errors="replace").splitlines()):
+            if not row:
+                continue
+            path = (site / row[0]).resolve()
+            # Scripts are recorded as ../../bin/...; nothing outside the tree is ours to delete
+            if root not in path.parents or not path.is_file():
+                continue
+            path.unlink()
+            parents.update(p for p in path.parents if root in p.parents)
+    shutil.rmtree(dist_info, ignore_errors=True)
+    for parent in sorted(parents, key=lambda p: len(p.parts), reverse=True):
+        pycache = parent / "__pycache__"
+        if pycache.is_dir() and not any(pycache.glob("*.py")):
+            shutil.rmtree(pycache, ignore_errors=True)
+        try:
+            parent.rmdir()
+        except OSError:
+            pass
+
+
+def build_env() -> Dict[str, str]:
+    return {key: value for key, value in os.environ.items()
+            if key in BUILD_ENV or key.startswith(BUILD_ENV_PREFIXES)}
+
+
+async def _run(*cmd: str, cwd: Optional[Path] = None, timeout: float = INSTALL_TIMEOUT) -> Tuple[int, str]:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, cwd=str(cwd) if cwd else None, env=build_env(),
+        stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+    )
+    try:
+        output, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise InstallError(f"{cmd[0]} timed out after {timeout}s")
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return proc.returncode, output.decode(errors="replace")
+
+
+# ----------------- DEPENDENCY CACHE -----------------
+class DependencyCache:
+    """Shared, content-addressed store of installed packages, hardlinked into each bot.
+
+    Python: every wheel is unpacked once into store/<sha256 of wheel>; a bot's
+    .deps/python is a tree of hardlinks into those entries.
+    Node: every resolved name@version is installed once into npm/<sha256>; its
+    node_modules is hardlinked into the bot directory.
+    """
+
+    def __init__(self, root: Path = CACHE_DIR):
+        self.root = root
+        self.wheels = root / "wheels"
+        self.store = root / "store"
+        self.npm_store = root / "npm"
+        for path in (self.wheels, self.store, self.npm_store):
+            path.mkdir(parents=True, exist_ok=True)
+        self._locks = {}
+
+    def _lock(self, key: str) -> asyncio.Lock:
+        return self._locks.setdefault(key, asyncio.Lock())
+
+    @staticmethod
+    def validate_spec(spec: str, bot_type: str = "python"):
+        if not SPEC_PATTERN.match(spec) or ".." in spec:
+            raise InstallError(f"Invalid package name: {spec}")
+        if bot_type == "python" and any(c in spec for c in PYTHON_SPEC_FORBIDDEN):
+            raise InstallError(f"Invalid package name: {spec}")
+
+    async def prepare(self, bot_type: str, spec: str,
+                      progress: Optional[Progress] = None) -> Tuple[str, str, List[Path]]:
+        """Make sure `spec` is in the store; returns (name, version, store entries)."""
+        self.validate_spec(spec, bot_type)
+        progress = progress or _no_progress
+        if bot_type == "python":
+            return await self._prepare_python(spec, progress)
+        if bot_type == "javascript":
+            return await self._prepare_node(spec, progress)
+        raise InstallError(f"Unsupported bot type: {bot_type}")
+
+    @staticmethod
+    def link(bot_dir: Path, bot_type: str, entries: List[Path]):
+        """Link store entries into a bot, replacing whatever version it had of each package."""
+        if bot_type == "python":
+            target = bot_dir / PYTHON_DEPS_DIR
+            target.mkdir(parents=True, exist_ok=True)
+            for entry in entries:
+                for dist_info in entry.glob("*.dist-info"):
+                    project = _normalize(dist_info.name.split("-")[0])
+                    for installed in target.glob("*.dist-info"):
+                        if _normalize(installed.name.split("-")[0]) == project:
+                            remove_distribution(target, installed)
+                link_tree(entry, target)
+            return
+        target = bot_dir / "node_modules"
+        target.mkdir(parents=True, exist_ok=True)
+        for entry in entries:
+            for child in entry.iterdir():
+                if child.name == ".bin":
+                    # Shared by every package; only the links this one brings change
+                    link_tree(child, target / ".bin")
+                elif child.is_file():
+                    _link_file(str(child), target / child.name)
+                elif child.name.startswith("@"):
+                    (target / child.name).mkdir(exist_ok=True)
+                    for package in child.iterdir():
+                        swap_tree(package, target / child.name / package.name)
+                else:
+                    swap_tree(child, target / child.name)
+
+    async def install(self, bot_dir: Path, bot_type: str, spec: str,
+                      progress: Optional[Progress] = None) -> Tuple[str, str]:
+        """Install `spec` for one bot and return the (name, version) that was installed."""
+        name, version, entries = await self.prepare(bot_type, spec, progress)
+        await asyncio.to_thread(self.link, bot_dir, bot_type, entries)
+        return name, version
+
+    # ----- python -----
+    async def _resolve_wheels(self, spec: str, wheel_dir: Path):
+        # Wheels only: building an sdist would run the package's setup.py on this host
+        base = [sys.executable, "-m", "pip", "wheel", "--disable-pip-version-check", "-q",
+                "--only-binary=:all:", "--wheel-dir", str(wheel_dir), "--find-links", str(self.wheels)]
+        # Offline first for exact pins only: a range satisfied by the cache would otherwise
+        # stay on the first version ever cached and never see a newer release
+        code = 1
+        if EXACT_PIN.match(spec):
+            code, _ = await _run(*base, "--no-index", spec)
+        if code != 0:
+            code, output = await _run(*base, spec)
+            if code != 0:
+                raise InstallError(output.strip().splitlines()[-1] if output.strip() else "pip failed")
+
+    async def _unpack_wheel(self, wheel: Path) -> Path:
+        digest = _sha256(wheel)
+        entry = self.store / digest
+        async with self._lock(digest):
+            if not entry.exists():
+                staging = self.store / f".{digest}.tmp"
+                shutil.rmtree(staging, ignore_errors=True)
+                code, output = await _run(sys.executable, "-m", "pip", "install", "-q",
+                                          "--disable-pip-version-check", "--no-deps", "--no-index",
+                                          "--target", str(staging), str(wheel))
+                if code != 0:
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise InstallError(f"Unpacking {wheel.name} failed: {output.strip()[-300:]}")
+                os.replace(staging, entry)
+            cached = self.wheels / wheel.name
+            if not cached.exists():
+                shutil.copy2(wheel, cached)
+        return entry
+
+    async def _prepare_python(self, spec: str, progress: Progress) -> Tuple[str, str, List[Path]]:
+        with tempfile.TemporaryDirectory(dir=self.root) as tmp:
+            wheel_dir = Path(tmp)
+            await progress("resolving")
+            await self._resolve_wheels(spec, wheel_dir)
+            wheels = sorted(wheel_dir.glob("*.whl"))
+            if not wheels:
+                raise InstallError(f"No distributions found for {spec}")
+            entries = []
+            for i, wheel in enumerate(wheels, 1):
+                await progress(f"unpacking {i}/{len(wheels)} ({wheel.name.split('-')[0]})")
+                entries.append(await self._unpack_wheel(wheel))
+            wanted = _normalize(re.split(r"[\[=<>!~ ]", spec, 1)[0])
+            for wheel in wheels:
+                name, version = _wheel_name_version(wheel)
+                if _normalize(name) == wanted:
+                    return name, version, entries
+            return (*_wheel_name_version(wheels[0]), entries)
+
+    # ----- node -----
+    @staticmethod
+    def _split_npm_spec(spec: str) -> Tuple[str, str]:
+        at = spec.find("@", 1)
+        if at == -1:
+            return spec, "latest"
+        return spec[:at], spec[at + 1:]
+
+    async def _prepare_node(self, spec: str, progress: Progress) -> Tuple[str, str, List[Path]]:
+        name, wanted = self._split_npm_spec(spec)
+        await progress("resolving")
+        code, output = await _run("npm", "view", f"{name}@{wanted}", "version", "--json", "--prefer-offline")
+        if code != 0:
+            raise InstallError(f"npm could not resolve {spec}")
+        versions = json.loads(output or "null")
+        version = versions[-1] if isinstance(versions, list) else versions
+        if not version:
+            raise InstallError(f"No versions of {name} match {wanted}")
+
+        digest = hashlib.sha256(f"{name}@{version}".encode()).hexdigest()
+        entry = self.npm_store / digest
+        async with self._lock(digest):
+            if not entry.exists():
+                await progress(f"installing {name}@{version}")
+                staging = self.npm_store / f".{digest}.tmp"
+                shutil.rmtree(staging, ignore_errors=True)
+                staging.mkdir()
+                # --ignore-scripts: install hooks would run tenant-chosen code on this host
+                code, output = await _run("npm", "install", "--prefix", str(staging), "--no-save",
+                                          "--no-package-lock", "--omit=dev", "--prefer-offline",
+                                          "--ignore-scripts", "--no-audit", "--no-fund", f"{name}@{version}")
+                if code != 0:
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise InstallError(f"npm install {name}@{version} failed: {output.strip()[-300:]}")
+                # npm's hidden lockfile describes this entry only; it must not leak into bots
+                (staging / "node_modules" / ".package-lock.json").unlink(missing_ok=True)
+                os.replace(staging, entry)
+        return name, version, [entry / "node_modules"]
+
+
+async def _no_progress(text: str):
+    pass
+
+
+# ----------------- INSTALL QUEUE -----------------
+class InstallTarget:
+    """One bot waiting on an install job."""
+
+    def __init__(self, bot_id: int, bot_dir: Path, progress: Optional[Progress]):
+        self.bot_id = bot_id
+        self.bot_dir = bot_dir
+        self.progress = progress
+        self.future = asyncio.get_running_loop().create_future()
+
+    def fail(self, error: Exception):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class InstallJob:
+    def __init__(self, key: Tuple[str, str], bot_type: str, spec: str, priority: int):
+        self.key = key
+        self.bot_type = bot_type
+        self.spec = spec
+        self.priority = priority
+        self.targets: Dict[int, InstallTarget] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = False
+
+    async def report(self, text: str):
+        for target in list(self.targets.values()):
+            if target.progress:
+                try:
+                    await target.progress(text)
+                except Exception:
+                    # A failed status edit must never fail the install
+                    pass
+
+
+class InstallQueue:
+    """Runs installs on a fixed number of workers, premium jobs first.
+
+    Identical requests (same language and spec) share one job while it is queued
+    or running; each bot then gets its own link step and result.
+    """
+
+    def __init__(self, cache: DependencyCache, workers: int = INSTALL_WORKERS):
+        self.cache = cache
+        self.workers = workers
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.jobs: Dict[Tuple[str, str], InstallJob] = {}
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for job in list(self.jobs.values()):
+            self._cancel_job(job, InstallError("Platform shutting down"))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _enqueue(self, job: InstallJob):
+        # A job may sit in the heap twice after a priority bump; the stale entry is skipped
+        self.queue.put_nowait((job.priority, next(self._seq), job))
+
+    def waiting(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.task is None)
+
+    async def submit(self, bot_id: int, bot_dir: Path, bot_type: str, spec: str,
+                     premium: bool = False, progress: Optional[Progress] = None) -> Tuple[str, str]:
+        self.cache.validate_spec(spec, bot_type)
+        priority = PREMIUM_PRIORITY if premium else FREE_PRIORITY
+        key = (bot_type, spec.lower())
+        job = self.jobs.get(key)
+        if job is None:
+            job = self.jobs[key] = InstallJob(key, bot_type, spec, priority)
+            self._enqueue(job)
+        elif priority < job.priority and job.task is None:
+            job.priority = priority
+            self._enqueue(job)
+        target = job.targets.get(bot_id)
+        if target is None:
+            target = job.targets[bot_id] = InstallTarget(bot_id, bot_dir, progress)
+            if job.task is None and progress:
+                try:
+                    await progress(f"queued ({self.waiting() - 1} ahead)")
+                except Exception:
+                    pass
+        return await target.future
+
+    def cancel(self, bot_id: int, spec: Optional[str] = None) -> int:
+        """Withdraw a bot from its pending installs; jobs nobody waits on any more are stopped."""
+        cancelled = 0
+        for job in list(self.jobs.values()):
+            if spec is not None and job.spec.lower() != spec.lower():
+                continue
+            target = job.targets.pop(bot_id, None)
+            if target is None:
+                continue
+            target.fail(InstallError("Install cancelled"))
+            cancelled += 1
+            if not job.targets:
+                self._cancel_job(job, InstallError("Install cancelled"))
+        return cancelled
+
+    def _cancel_job(self, job: InstallJob, error: Exception):
+        job.cancelled = True
+        if self.jobs.get(job.key) is job:
+            del self.jobs[job.key]
+        for target in job.targets.values():
+            target.fail(error)
+        if job.task:
+            job.task.cancel()
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self.queue.get()
+            if job.cancelled or job.task is not None:
+                continue
+            job.task = asyncio.create_task(self._run(job))
+            await asyncio.wait([job.task])
+
+    async def _run(self, job: InstallJob):
+        try:
+            name, version, entries = await self.cache.prepare(job.bot_type, job.spec, job.report)
+        except asyncio.CancelledError:
+            return
+        except InstallError as e:
+            self._cancel_job(job, e)
+            return
+        except Exception as e:
+            self._cancel_job(job, InstallError(str(e)))
+            return
+        # From here on new requests start a fresh job, which will hit the store right away
+        if self.jobs.get(job.key) is job:
+            del self.jobs[job.key]
+        await job.report("linking")
+        for target in list(job.targets.values()):
+            try:
+                await asyncio.to_thread(self.cache.link, target.bot_dir, job.bot_type, entries)
+            except OSError as e:
+                target.fail(InstallError(f"Linking failed: {e}"))
+                continue
+            if not target.future.done():
+                target.future.set_result((name, version))
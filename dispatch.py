@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+import logging
+import contextlib
+from collections import deque
+from typing import Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+# Handlers running at once, across all users
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+# Updates admitted at once, including those waiting behind the same user's earlier ones
+UPDATE_BACKLOG = int(os.getenv("UPDATE_BACKLOG", "1024"))
+WAIT_SAMPLES = 1000
+SLOW_WAIT = 5.0
+
+
+def ordering_key(update: object) -> Optional[Hashable]:
+    """Updates sharing a key run one at a time, in arrival order."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return ("chat", update.effective_chat.id)
+    return None
+
+
+class _KeyLock:
+    __slots__ = ("lock", "holders")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.holders = 0
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates concurrently, but each user's updates strictly one after another.
+
+    A slow handler only holds up the user who sent it. That per-user order is also what
+    keeps the upload ConversationHandler consistent with concurrency enabled.
+    """
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, backlog: int = UPDATE_BACKLOG):
+        # The base class semaphore bounds admitted updates; ours bounds the running ones.
+        # Taking ours only after the user's lock means a user's queued updates never
+        # tie up a slot another user could run in.
+        super().__init__(max_concurrent_updates=max(backlog, concurrency))
+        self.concurrency = concurrency
+        self._running = asyncio.Semaphore(concurrency)
+        self._keys: Dict[Hashable, _KeyLock] = {}
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        key = ordering_key(update)
+        entry = self._hold(key) if key is not None else None
+        arrived = time.monotonic()
+        started = False
+        self.waiting += 1
+        try:
+            async with entry.lock if entry else contextlib.nullcontext():
+                async with self._running:
+                    started = True
+                    self._started(arrived)
+                    try:
+                        await coroutine
+                    finally:
+                        self.running -= 1
+                        self.processed += 1
+        finally:
+            if not started:
+                # Cancelled while queued (e.g. on shutdown)
+                self.waiting -= 1
+                if asyncio.iscoroutine(coroutine):
+                    coroutine.close()
+            if entry is not None:
+                self._release(key, entry)
+
+    def _hold(self, key: Hashable) -> _KeyLock:
+        entry = self._keys.get(key)
+        if entry is None:
+            entry = self._keys[key] = _KeyLock()
+        entry.holders += 1
+        return entry
+
+    def _release(self, key: Hashable, entry: _KeyLock):
+        entry.holders -= 1
+        if not entry.holders:
+            del self._keys[key]
+
+    def _started(self, arrived: float):
+        wait = time.monotonic() - arrived
+        self.waiting -= 1
+        self.running += 1
+        self.waits.append(wait)
+        if wait > SLOW_WAIT:
+            logger.warning(f"Update waited {wait:.1f}s to start ({self.waiting} queued, {self.running} running)")
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self) -> Dict[str, float]:
+        waits = sorted(self.waits)
+
+        def percentile(p: float) -> float:
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+        return {
+            "queued": self.waiting,
+            "running": self.running,
+            "processed": self.processed,
+            "users": len(self._keys),
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+            "wait_max": waits[-1] if waits else 0.0,
+        }
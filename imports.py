@@ -0,0 +1,227 @@
+import re
+import ast
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+# ----------------- LOOKUP TABLES -----------------
+# Import name -> PyPI distribution, where the two differ. Dotted keys win over
+# their prefixes, so namespace packages like google.* can be told apart.
+IMPORT_TO_DIST = {
+    "telegram": "python-telegram-bot",
+    "telebot": "pyTelegramBotAPI",
+    "telethon": "Telethon",
+    "tgcrypto": "TgCrypto",
+    "discord": "discord.py",
+    "PIL": "Pillow",
+    "cv2": "opencv-python",
+    "yaml": "PyYAML",
+    "bs4": "beautifulsoup4",
+    "dotenv": "python-dotenv",
+    "dateutil": "python-dateutil",
+    "jwt": "PyJWT",
+    "jose": "python-jose",
+    "Crypto": "pycryptodome",
+    "Cryptodome": "pycryptodomex",
+    "nacl": "PyNaCl",
+    "OpenSSL": "pyOpenSSL",
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "attr": "attrs",
+    "magic": "python-magic",
+    "serial": "pyserial",
+    "usb": "pyusb",
+    "docx": "python-docx",
+    "pptx": "python-pptx",
+    "fitz": "PyMuPDF",
+    "MySQLdb": "mysqlclient",
+    "psycopg2": "psycopg2-binary",
+    "bson": "pymongo",
+    "gridfs": "pymongo",
+    "dns": "dnspython",
+    "socks": "PySocks",
+    "websocket": "websocket-client",
+    "zmq": "pyzmq",
+    "git": "GitPython",
+    "github": "PyGithub",
+    "slugify": "python-slugify",
+    "multipart": "python-multipart",
+    "Levenshtein": "python-Levenshtein",
+    "speech_recognition": "SpeechRecognition",
+    "gtts": "gTTS",
+    "apscheduler": "APScheduler",
+    "yt_dlp": "yt-dlp",
+    "faker": "Faker",
+    "googleapiclient": "google-api-python-client",
+    "google.generativeai": "google-generativeai",
+    "google.cloud.storage": "google-cloud-storage",
+    "google.cloud.firestore": "google-cloud-firestore",
+    "google.protobuf": "protobuf",
+    "google.oauth2": "google-auth",
+    "google.auth": "google-auth",
+    "firebase_admin": "firebase-admin",
+    "pkg_resources": "setuptools",
+    "win32api": "pywin32",
+    "Xlib": "python-xlib",
+}
+# Namespace packages shared by many distributions: only a dotted match above says which
+NAMESPACE_PACKAGES = {"google", "azure"}
+
+NODE_BUILTINS = {
+    "assert", "async_hooks", "buffer", "child_process", "cluster", "console", "constants",
+    "crypto", "dgram", "diagnostics_channel", "dns", "domain", "events", "fs", "http", "http2",
+    "https", "inspector", "module", "net", "os", "path", "perf_hooks", "process", "punycode",
+    "querystring", "readline", "repl", "stream", "string_decoder", "sys", "timers", "tls",
+    "trace_events", "tty", "url", "util", "v8", "vm", "wasi", "worker_threads", "zlib",
+}
+
+# Directories that hold installed or vendored code rather than the bot's own modules
+SKIP_DIRS = {".deps", "node_modules", "venv", ".venv", "site-packages", "__pycache__"}
+JS_EXTENSIONS = (".js", ".mjs", ".cjs", ".json")
+
+
+# ----------------- EXTRACTION -----------------
+def python_imports(code: str) -> List[str]:
+    """Every module a Python source may import, as written.
+
+    Relative imports keep their leading dots. For `from a import b`, both `a` and
+    `a.b` are listed, since `b` may be a submodule.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            found.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = "." * node.level + (node.module or "")
+            found.append(base)
+            sep = "" if base.endswith(".") else "."
+            found.extend(base + sep + alias.name for alias in node.names if alias.name != "*")
+    return sorted(set(found))
+
+
+# Strings are matched first so comment markers inside them are left alone
+_JS_TOKENS = re.compile(r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`)|//[^\n]*|/\*.*?\*/', re.S)
+_JS_IMPORTS = [
+    re.compile(r'\bimport\s+(?:[\w*${}\s,]+?\s+from\s+)?["\']([^"\']+)["\']'),
+    re.compile(r'\bexport\s+(?:\*(?:\s+as\s+\w+)?|\{[^}]*\})\s*from\s+["\']([^"\']+)["\']'),
+    re.compile(r'\bimport\s*\(\s*["\']([^"\']+)["\']\s*\)'),
+    re.compile(r'\brequire\s*\(\s*["\']([^"\']+)["\']\s*\)'),
+]
+
+
+def _strip_js_token(match) -> str:
+    literal = match.group(1)
+    if not literal:
+        return " "
+    # Quotes inside a literal would let the patterns below match code quoted in a string
+    return literal[0] + re.sub(r"[\'\"`]", "", literal[1:-1]) + literal[-1]
+
+
+def javascript_imports(code: str) -> List[str]:
+    """Module specifiers from ESM imports/re-exports, dynamic import() and require()."""
+    code = _JS_TOKENS.sub(_strip_js_token, code)
+    found = set()
+    for pattern in _JS_IMPORTS:
+        found.update(pattern.findall(code))
+    return sorted(found)
+
+
+def extract_imports(code: str, language: str) -> List[str]:
+    if language == "python":
+        return python_imports(code)
+    if language == "javascript":
+        return javascript_imports(code)
+    return []
+
+
+# ----------------- RESOLUTION -----------------
+def distribution_for(module: str) -> Optional[str]:
+    """PyPI distribution that provides `module` (a dotted import name), if it can be told."""
+    parts = module.split(".")
+    for i in range(len(parts), 0, -1):
+        dist = IMPORT_TO_DIST.get(".".join(parts[:i]))
+        if dist:
+            return dist
+    return None if parts[0] in NAMESPACE_PACKAGES else parts[0]
+
+
+def npm_package(specifier: str) -> Optional[str]:
+    """Package name for a bare specifier, or None for builtins and paths."""
+    if specifier.startswith(("node:", ".", "/")) or ":" in specifier:
+        return None
+    parts = specifier.split("/")
+    name = "/".join(parts[:2]) if specifier.startswith("@") else parts[0]
+    return None if name in NODE_BUILTINS else name
+
+
+def _python_module_file(base: Path, dotted: str) -> Optional[Path]:
+    target = base.joinpath(*dotted.split(".")) if dotted else base
+    for candidate in (target.with_suffix(".py"), target / "__init__.py"):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def _local_python(source: Path, module: str, search_root: Path) -> Optional[Path]:
+    if module.startswith("."):
+        level = len(module) - len(module.lstrip("."))
+        base = source.parent
+        for _ in range(level - 1):
+            base = base.parent
+        return _python_module_file(base, module[level:])
+    return _python_module_file(search_root, module)
+
+
+def _local_javascript(source: Path, specifier: str) -> Optional[Path]:
+    target = (source.parent / specifier)
+    candidates = [target] + [target.with_name(target.name + ext) for ext in JS_EXTENSIONS]
+    candidates += [target / ("index" + ext) for ext in JS_EXTENSIONS]
+    for candidate in candidates:
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def resolve_requirements(entry: Path, root: Path, imports: Dict[Path, Iterable[str]],
+                         language: str) -> List[str]:
+    """Walk from `entry` through the bot's own modules and return what must be installed.
+
+    `imports` maps each source file to its extract_imports() result; files missing
+    from it are treated as having no imports. Local modules are followed, stdlib and
+    Node builtins dropped, and Python import names mapped to PyPI distributions.
+    """
+    root = root.resolve()
+    imports = {Path(path).resolve(): specs for path, specs in imports.items()}
+    search_root = entry.resolve().parent
+    required: Set[str] = set()
+    seen: Set[Path] = set()
+    pending = [entry.resolve()]
+    while pending:
+        source = pending.pop()
+        if source in seen:
+            continue
+        seen.add(source)
+        for spec in imports.get(source, ()):
+            if language == "python":
+                local = _local_python(source, spec, search_root)
+                if local is None and not spec.startswith("."):
+                    top = spec.split(".")[0]
+                    own = (search_root / top).is_dir() or (search_root / f"{top}.py").is_file()
+                    dist = None if own or top in sys.stdlib_module_names else distribution_for(spec)
+                    if dist:
+                        required.add(dist)
+            else:
+                local = _local_javascript(source, spec) if spec.startswith((".", "/")) else None
+                if local is None:
+                    package = npm_package(spec)
+                    if package:
+                        required.add(package)
+            if local and local.suffix != ".json":
+                local = local.resolve()
+                if local.is_relative_to(root) and not SKIP_DIRS.intersection(local.relative_to(root).parts):
+                    pending.append(local)
+    return sorted(required)
@@ -0,0 +1,192 @@
+import os
+import zlib
+import json
+import stat
+import hashlib
+import zipfile
+import logging
+from pathlib import Path, PurePosixPath
+from typing import List, NamedTuple, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+CHUNK_SIZE = 64 * 1024
+# Telegram's Bot API will not serve anything larger to bots anyway
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_MEMBER_BYTES = int(os.getenv("MAX_MEMBER_BYTES", str(10 * 1024 * 1024)))
+MAX_EXTRACTED_BYTES = int(os.getenv("MAX_EXTRACTED_BYTES", str(100 * 1024 * 1024)))
+MAX_MEMBERS = 2000
+MAX_COMPRESSION_RATIO = 100
+# Source files are parsed in memory for validation, so they get their own cap
+MAX_SOURCE_BYTES = 2 * 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+# Conventional entry points, most specific first
+ENTRY_POINTS = ("main.py", "bot.py", "app.py", "index.js", "main.js", "bot.js", "app.js")
+# Written by the platform next to the bot's code; an archive must not bring its own
+RESERVED_NAMES = {"bot.log", "logs", ".deps", "node_modules"}
+
+
+class UploadRejected(Exception):
+    pass
+
+
+class IngestedFile(NamedTuple):
+    path: Path
+    size: int
+    sha256: str
+
+
+def check_declared_size(size: int):
+    """Reject on the size Telegram reports, before a single byte is fetched."""
+    if size and size > MAX_UPLOAD_BYTES:
+        raise UploadRejected(f"File is {size // 1024} KB, the limit is {MAX_UPLOAD_BYTES // 1024} KB")
+
+
+def _copy_capped(src, dst, limit: int, what: str) -> IngestedFile:
+    digest = hashlib.sha256()
+    size = 0
+    with open(dst, "wb") as out:
+        while chunk := src.read(CHUNK_SIZE):
+            size += len(chunk)
+            # Sizes in headers can lie; the bytes actually read are what count
+            if size > limit:
+                raise UploadRejected(f"{what} exceeds {limit // 1024} KB")
+            digest.update(chunk)
+            out.write(chunk)
+    return IngestedFile(Path(dst), size, digest.hexdigest())
+
+
+async def download(file, dest: Path, declared_size: int = 0, limit: int = MAX_UPLOAD_BYTES) -> IngestedFile:
+    """Stream a telegram.File to `dest`, hashing as it goes and aborting past `limit`."""
+    check_declared_size(declared_size)
+    if Path(file.file_path).is_file():
+        # Local Bot API server: the file is already on this machine
+        with open(file.file_path, "rb") as src:
+            return _copy_capped(src, dest, limit, "Upload")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT) as client:
+            async with client.stream("GET", file.file_path) as response:
+                response.raise_for_status()
+                length = int(response.headers.get("content-length") or 0)
+                if length > limit:
+                    raise UploadRejected(f"Upload exceeds {limit // 1024} KB")
+                if declared_size and length and length != declared_size:
+                    raise UploadRejected("Upload size does not match what Telegram reported")
+                with open(dest, "wb") as out:
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > limit:
+                            raise UploadRejected(f"Upload exceeds {limit // 1024} KB")
+                        digest.update(chunk)
+                        out.write(chunk)
+    except httpx.HTTPError as e:
+        # httpx's message carries the file URL, and with it the platform's bot token:
+        # neither the log nor the tenant gets it
+        status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+        logger.error(f"Downloading an upload failed: {type(e).__name__}{f' (HTTP {status})' if status else ''}")
+        raise UploadRejected("Download failed")
+    if declared_size and size != declared_size:
+        raise UploadRejected("Upload was truncated")
+    return IngestedFile(dest, size, digest.hexdigest())
+
+
+def _safe_target(dest: Path, name: str) -> Path:
+    member = PurePosixPath(name.replace("\\", "/"))
+    if member.is_absolute() or ".." in member.parts or (member.parts and ":" in member.parts[0]):
+        raise UploadRejected(f"Unsafe path in archive: {name}")
+    reserved = RESERVED_NAMES.intersection(member.parts)
+    if reserved:
+        raise UploadRejected(f"{name}: {reserved.pop()} is reserved by the platform, leave it out of the archive")
+    return dest.joinpath(*member.parts)
+
+
+def extract_archive(archive: Path, dest: Path) -> List[IngestedFile]:
+    """Extract a zip member by member under per-file, total, count and ratio caps.
+
+    Blocking; run it in a thread.
+    """
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise UploadRejected("Not a valid zip archive")
+
+    files = []
+    with zf:
+        members = zf.infolist()
+        if len(members) > MAX_MEMBERS:
+            raise UploadRejected(f"Archive has more than {MAX_MEMBERS} entries")
+        # Cheap pass over the central directory first, so obvious bombs cost nothing
+        declared_total = 0
+        for info in members:
+            _safe_target(dest, info.filename)
+            if stat.S_ISLNK(info.external_attr >> 16):
+                raise UploadRejected(f"Symlinks are not allowed: {info.filename}")
+            if info.file_size > MAX_MEMBER_BYTES:
+                raise UploadRejected(f"{info.filename} exceeds {MAX_MEMBER_BYTES // 1024} KB")
+            if info.compress_size and info.file_size / info.compress_size > MAX_COMPRESSION_RATIO:
+                raise UploadRejected(f"{info.filename} is compressed suspiciously well")
+            declared_total += info.file_size
+        if declared_total > MAX_EXTRACTED_BYTES:
+            raise UploadRejected(f"Archive expands past {MAX_EXTRACTED_BYTES // 1024} KB")
+
+        extracted = 0
+        for info in members:
+            target = _safe_target(dest, info.filename)
+            if info.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            limit = min(MAX_MEMBER_BYTES, MAX_EXTRACTED_BYTES - extracted)
+            try:
+                with zf.open(info) as src:
+                    ingested = _copy_capped(src, target, limit, info.filename)
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                # Bad CRC, or data that ends or inflates wrongly
+                raise UploadRejected(f"{info.filename} is corrupt: {e}")
+            except NotImplementedError:
+                raise UploadRejected(f"{info.filename} uses an unsupported compression method")
+            except RuntimeError:
+                raise UploadRejected(f"{info.filename} is encrypted")
+            extracted += ingested.size
+            files.append(ingested)
+    return files
+
+
+def _archive_root(dest: Path, files: List[IngestedFile]) -> Path:
+    # GitHub zipballs and "compress folder" archives wrap everything in one directory
+    tops = {f.path.relative_to(dest).parts[0] for f in files if f.path != dest}
+    if len(tops) == 1:
+        only = dest / tops.pop()
+        if only.is_dir():
+            return only
+    return dest
+
+
+def find_entry_point(dest: Path, files: List[IngestedFile]) -> Optional[Path]:
+    """Pick the file to run: package.json "main", then a conventional name, then a lone source file."""
+    root = _archive_root(dest, files)
+    package = root / "package.json"
+    if package.is_file():
+        try:
+            main = json.loads(package.read_text(encoding="utf-8")).get("main")
+        except (ValueError, UnicodeDecodeError):
+            main = None
+        if isinstance(main, str):
+            candidate = root / main
+            if candidate.is_dir():
+                candidate = candidate / "index.js"
+            elif not candidate.suffix:
+                candidate = candidate.with_suffix(".js")
+            if candidate.is_file() and candidate.resolve().is_relative_to(dest.resolve()):
+                return candidate
+    for name in ENTRY_POINTS:
+        if (root / name).is_file():
+            return root / name
+    sources = sorted(f.path for f in files if f.path.parent == root and f.path.suffix in (".py", ".js"))
+    return sources[0] if sources else None
@@ -0,0 +1,47 @@
+// Long-lived syntax checker used by validator.py. One JSON request per line on
+// stdin ({id, code}), one JSON reply per line on stdout. Code is compiled, never run.
+const vm = require('vm');
+const readline = require('readline');
+
+const FILENAME = 'bot.js';
+const CJS_PARAMS = ['exports', 'require', 'module', '__filename', '__dirname'];
+const ESM_HINT = /Cannot use import statement|Unexpected token 'export'|import\.meta|await is only valid/;
+
+function describe(err, code) {
+  const match = String(err.stack).match(/bot\.js:(\d+)(?::(\d+))?/);
+  const line = match ? Number(match[1]) : null;
+  return {
+    line,
+    offset: match && match[2] ? Number(match[2]) : null,
+    message: `${err.name}: ${err.message}`,
+    text: line ? code.split('\n')[line - 1] : null,
+  };
+}
+
+function check(code) {
+  try {
+    // Same wrapper node applies to CommonJS files, so top-level return is allowed
+    vm.compileFunction(code, CJS_PARAMS, { filename: FILENAME });
+    return { valid: true };
+  } catch (err) {
+    if (!ESM_HINT.test(err.message) || typeof vm.SourceTextModule !== 'function') {
+      return { valid: false, error: describe(err, code) };
+    }
+  }
+  try {
+    new vm.SourceTextModule(code, { identifier: FILENAME });
+    return { valid: true };
+  } catch (err) {
+    return { valid: false, error: describe(err, code) };
+  }
+}
+
+readline.createInterface({ input: process.stdin }).on('line', (line) => {
+  let request;
+  try {
+    request = JSON.parse(line);
+  } catch (err) {
+    return;
+  }
+  process.stdout.write(JSON.stringify({ id: request.id, ...check(String(request.code)) }) + '\n');
+});
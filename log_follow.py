@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from log_reader import fit_message
+from log_store import BotLogStore
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+FOLLOW_LINES = 30
+# Telegram throttles edits of the same message; batching lines into one edit every few
+# seconds keeps a busy bot from tripping the limit
+FOLLOW_EDIT_INTERVAL = 3.0
+FOLLOW_IDLE_TIMEOUT = 300
+FOLLOW_MAX_DURATION = 3600
+# Network failures an edit is retried through, with growing pauses, before the follow ends
+FOLLOW_EDIT_RETRIES = 3
+
+
+# ----------------- LIVE LOG FOLLOWER -----------------
+class LogFollower:
+    """Keeps one Telegram message updated with the newest lines of a bot's log."""
+
+    def __init__(self, bot_id: int, store: BotLogStore, message, lines: int = FOLLOW_LINES):
+        self.bot_id = bot_id
+        self.store = store
+        self.message = message
+        self.lines = deque(maxlen=lines)
+        self._dirty = asyncio.Event()
+        self._last_text = None
+
+    def _on_line(self, line: str):
+        self.lines.append(line)
+        self._dirty.set()
+
+    def _render(self, footer: str) -> str:
+        body = fit_message(list(self.lines), 3800) or "(no output yet)"
+        return f"📡 **LIVE LOGS (Bot {self.bot_id})**\n\n```\n{body}\n```\n{footer}"
+
+    async def _edit(self, text: str):
+        if text == self._last_text:
+            return
+        failures = 0
+        while True:
+            try:
+                await self.message.edit_text(text, parse_mode=ParseMode.MARKDOWN)
+                self._last_text = text
+                return
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                # "Message is not modified" and friends are harmless here
+                logger.debug(f"Follow edit for bot {self.bot_id} rejected: {e}")
+                return
+            except NetworkError as e:
+                failures += 1
+                if failures > FOLLOW_EDIT_RETRIES:
+                    raise
+                logger.debug(f"Follow edit for bot {self.bot_id} failed, retrying: {e}")
+                await asyncio.sleep(FOLLOW_EDIT_INTERVAL * failures)
+
+    async def run(self):
+        self.lines.extend(await asyncio.to_thread(self.store.tail, self.lines.maxlen))
+        self.store.add_listener(self._on_line)
+        started = time.monotonic()
+        reason = "stopped"
+        try:
+            await self._edit(self._render("🟢 following…"))
+            while True:
+                remaining = FOLLOW_MAX_DURATION - (time.monotonic() - started)
+                if remaining <= 0:
+                    reason = "time limit reached"
+                    break
+                try:
+                    await asyncio.wait_for(self._dirty.wait(), min(FOLLOW_IDLE_TIMEOUT, remaining))
+                except asyncio.TimeoutError:
+                    reason = "no new output" if remaining > FOLLOW_IDLE_TIMEOUT else "time limit reached"
+                    break
+                self._dirty.clear()
+                await self._edit(self._render("🟢 following…"))
+                # Lines arriving during the pause are coalesced into the next edit
+                await asyncio.sleep(FOLLOW_EDIT_INTERVAL)
+        except asyncio.CancelledError:
+            reason = "stopped"
+        except TelegramError as e:
+            # Blocked by the user, message deleted, or Telegram unreachable for too long
+            logger.warning(f"Following logs of bot {self.bot_id} ended: {e}")
+            reason = "Telegram error"
+        finally:
+            self.store.remove_listener(self._on_line)
+        try:
+            await self._edit(self._render(f"⏹ Follow ended ({reason})"))
+        except TelegramError as e:
+            logger.debug(f"Final follow edit for bot {self.bot_id} failed: {e}")
+
+
+class FollowRegistry:
+    """One follower per (chat, bot); starting a new one replaces the old."""
+
+    def __init__(self):
+        self.tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+
+    def start(self, chat_id: int, follower: LogFollower):
+        key = (chat_id, follower.bot_id)
+        self.stop(chat_id, follower.bot_id)
+        task = asyncio.create_task(follower.run())
+        self.tasks[key] = task
+        task.add_done_callback(lambda t: self.tasks.pop(key, None) if self.tasks.get(key) is t else None)
+
+    def stop(self, chat_id: int, bot_id: int) -> bool:
+        task = self.tasks.pop((chat_id, bot_id), None)
+        if task:
+            task.cancel()
+        return task is not None
@@ -0,0 +1,70 @@
+import os
+import re
+import mmap
+from pathlib import Path
+from typing import List, Optional
+
+TAIL_BLOCK_SIZE = 256 * 1024
+# Upper bound on how far back a filtered tail will search before giving up
+MAX_SCAN_BYTES = 64 * 1024 * 1024
+DEFAULT_TAIL_LINES = 50
+MAX_TAIL_LINES = 500
+
+
+def compile_filter(pattern: Optional[str]):
+    # A literal, case-insensitive substring: tenant-supplied regexes could backtrack
+    # catastrophically over megabytes of log in a shared executor thread
+    if not pattern:
+        return None
+    return re.compile(re.escape(pattern), re.IGNORECASE)
+
+
+def tail_lines(path: Path, lines: int = DEFAULT_TAIL_LINES, pattern: Optional[str] = None,
+               max_scan: int = MAX_SCAN_BYTES) -> List[str]:
+    """Return the last `lines` lines of a file (optionally only those matching `pattern`).
+
+    The file is memory-mapped and walked backwards block by block, so the cost depends
+    on how much of the tail is needed rather than on the size of the file.
+    """
+    regex = compile_filter(pattern)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or lines <= 0:
+            return []
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            floor = max(0, size - max_scan)
+            end = size - 1 if mm[size - 1:size] == b'\n' else size
+            found = []
+            while end > floor and len(found) < lines:
+                start = max(floor, end - TAIL_BLOCK_SIZE)
+                if start > floor:
+                    # Align to a line boundary so no line is split across two blocks
+                    newline = mm.find(b'\n', start, end)
+                    if newline == -1:
+                        start = max(floor, mm.rfind(b'\n', floor, start) + 1)
+                    else:
+                        start = newline + 1
+                block = mm[start:end].decode('utf-8', errors='replace').split('\n')
+                if start == floor and floor > 0:
+                    # The scan limit cut into the middle of this line
+                    block = block[1:]
+                for line in reversed(block):
+                    if regex is None or regex.search(line):
+                        found.append(line)
+                        if len(found) >= lines:
+                            break
+                end = start - 1
+    found.reverse()
+    return found
+
+
+def fit_message(lines: List[str], limit: int = 4000) -> str:
+    # Keep the newest lines that fit in one Telegram message
+    kept = []
+    total = 0
+    for line in reversed(lines):
+        total += len(line) + 1
+        if total > limit:
+            break
+        kept.append(line)
+    return '\n'.join(reversed(kept))
@@ -0,0 +1,272 @@
+import os
+import re
+import gzip
+import json
+import time
+import bisect
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+
+from log_reader import tail_lines, compile_filter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+SEGMENT_MAX_BYTES = int(os.getenv("LOG_SEGMENT_MAX_BYTES", str(8 * 1024 * 1024)))
+SEGMENT_MAX_AGE = int(os.getenv("LOG_SEGMENT_MAX_AGE", str(6 * 3600)))
+# Closed segments kept per bot: (max segments, max age in days)
+RETENTION = {
+    "free": (4, 3),
+    "premium": (40, 30),
+}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIMESTAMP_LEN = 19
+# The only files an index entry may name. The index lives in the tenant's bot directory,
+# so anything else in it is planted, not written by rotate()
+SEGMENT_NAME = re.compile(r"segment-\d+\.log(\.gz|\.zst)?")
+
+# Compression runs off the event loop; two threads are plenty for rotation bursts
+_compressor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="log-compress")
+
+
+def _open_segment(path: Path):
+    if path.suffix == ".zst":
+        return zstandard.open(path, "rb")
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _line_time(line: str) -> Optional[float]:
+    try:
+        return datetime.strptime(line[:TIMESTAMP_LEN], TIMESTAMP_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+# ----------------- SEGMENTED LOG STORE -----------------
+class BotLogStore:
+    """Per-bot log: the active bot.log plus compressed, time-indexed closed segments."""
+
+    def __init__(self, bot_dir: Path, premium: bool = False):
+        self.active_path = bot_dir / "bot.log"
+        self.segments_dir = bot_dir / "logs"
+        self.index_path = self.segments_dir / "index.json"
+        self.premium = premium
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._opened_at = None
+        self._listeners: List[Callable[[str], None]] = []
+        # Raw segments queued for compression; retention leaves them to _compress
+        self._compressing: Set[str] = set()
+        self.index: List[Dict] = self._load_index()
+
+    def _load_index(self) -> List[Dict]:
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if not isinstance(entries, list):
+            return []
+        valid = []
+        for entry in entries:
+            try:
+                if SEGMENT_NAME.fullmatch(entry["file"]):
+                    valid.append({"file": entry["file"], "start": float(entry["start"]),
+                                  "end": float(entry["end"]), "bytes": int(entry.get("bytes", 0))})
+                    continue
+            except (TypeError, KeyError, ValueError):
+                pass
+            logger.warning(f"Ignoring invalid log index entry in {self.index_path}")
+        return valid
+
+    def _segment_path(self, entry: Dict) -> Optional[Path]:
+        # Segment files may be swapped for symlinks by the bot; only real files in logs/ count
+        if not SEGMENT_NAME.fullmatch(entry["file"]):
+            return None
+        path = self.segments_dir / entry["file"]
+        if path.resolve().parent != self.segments_dir.resolve():
+            return None
+        return path
+
+    def refresh(self):
+        # For readers of a log another process writes: reload the segment index
+        if self._file is None:
+            with self._lock:
+                self.index = self._load_index()
+
+    def _save_index(self):
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+    def _open(self):
+        self._file = open(self.active_path, "ab")
+        self._size = self._file.tell()
+        self._opened_at = time.time()
+        if self._size:
+            with open(self.active_path, "r", encoding="utf-8", errors="replace") as f:
+                self._opened_at = _line_time(f.readline()) or self._opened_at
+
+    def append(self, data: bytes):
+        if self._file is None:
+            self._open()
+        now = time.time()
+        if self._size and (self._size >= SEGMENT_MAX_BYTES or now - self._opened_at >= SEGMENT_MAX_AGE):
+            self.rotate()
+            self._open()
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        line = time.strftime(TIMESTAMP_FORMAT, time.localtime(now)).encode() + b" " + data
+        self._file.write(line)
+        self._size += len(line)
+        if self._listeners:
+            text = line.decode("utf-8", errors="replace").rstrip("\n")
+            for listener in list(self._listeners):
+                listener(text)
+
+    def add_listener(self, listener: Callable[[str], None]):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def flush(self):
+        if self._file:
+            self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def rotate(self):
+        if self._file is None and not self.active_path.exists():
+            return
+        started = self._opened_at or time.time()
+        self.close()
+        self.segments_dir.mkdir(exist_ok=True)
+        segment = self.segments_dir / f"segment-{time.time_ns()}.log"
+        os.replace(self.active_path, segment)
+        entry = {"file": segment.name, "start": started, "end": time.time(), "bytes": segment.stat().st_size}
+        with self._lock:
+            self.index.append(entry)
+            self._compressing.add(segment.name)
+            self._save_index()
+        _compressor.submit(self._compress, entry)
+
+    def _compress(self, entry: Dict):
+        raw = self.segments_dir / entry["file"]
+        try:
+            self._pack(entry, raw)
+        except Exception as e:
+            logger.error(f"Compressing log segment {raw} failed: {e}")
+        finally:
+            with self._lock:
+                self._compressing.discard(raw.name)
+
+    def _pack(self, entry: Dict, raw: Path):
+        if zstandard is not None:
+            packed = raw.with_name(raw.name + ".zst")
+            with open(raw, "rb") as src, zstandard.open(packed, "wb") as dst:
+                while chunk := src.read(1024 * 1024):
+                    dst.write(chunk)
+        else:
+            packed = raw.with_name(raw.name + ".gz")
+            with open(raw, "rb") as src, gzip.open(packed, "wb", compresslevel=6) as dst:
+                while chunk := src.read(1024 * 1024):
+                    dst.write(chunk)
+        with self._lock:
+            entry["file"] = packed.name
+            entry["bytes"] = packed.stat().st_size
+            self._compressing.discard(raw.name)
+            self._apply_retention()
+            self._save_index()
+        raw.unlink()
+
+    def _apply_retention(self):
+        max_segments, max_days = RETENTION["premium" if self.premium else "free"]
+        cutoff = time.time() - max_days * 86400
+        keep = [e for e in self.index if e["end"] >= cutoff][-max_segments:]
+        keep += [e for e in self.index if e["file"] in self._compressing and e not in keep]
+        keep.sort(key=lambda e: e["end"])
+        for entry in self.index:
+            if entry not in keep:
+                path = self._segment_path(entry)
+                if path is None:
+                    continue
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+        self.index = keep
+
+    def _segments_between(self, since: float, until: float) -> List[Dict]:
+        with self._lock:
+            entries = list(self.index)
+        # Segments are appended in time order, so the index is sorted by end time
+        ends = [e["end"] for e in entries]
+        first = bisect.bisect_left(ends, since)
+        return [e for e in entries[first:] if e["start"] <= until]
+
+    def read_range(self, since: float, until: float, lines: int, pattern: Optional[str] = None) -> List[str]:
+        """Newest `lines` lines written between two epoch times; only overlapping segments are opened."""
+        regex = compile_filter(pattern)
+        found = []
+        sources = [path for path in map(self._segment_path, self._segments_between(since, until)) if path]
+        if self.active_path.exists() and (self._opened_at is None or self._opened_at <= until):
+            self.flush()
+            sources.append(self.active_path)
+        for path in sources:
+            try:
+                with _open_segment(path) as f:
+                    for raw in f:
+                        line = raw.decode("utf-8", errors="replace").rstrip("\n")
+                        stamp = _line_time(line)
+                        if stamp is not None and not since <= stamp <= until:
+                            continue
+                        if regex is None or regex.search(line):
+                            found.append(line)
+            except FileNotFoundError:
+                # Retention or compression swapped the file out from under us
+                continue
+            found = found[-lines:]
+        return found
+
+    def tail(self, lines: int, pattern: Optional[str] = None) -> List[str]:
+        self.flush()
+        found = tail_lines(self.active_path, lines, pattern) if self.active_path.exists() else []
+        with self._lock:
+            entries = list(reversed(self.index))
+        for entry in entries:
+            if len(found) >= lines:
+                break
+            # A freshly rotated active file may be short; top up from the newest segments
+            older = self._read_segment(entry, pattern)
+            found = older[-(lines - len(found)):] + found
+        return found
+
+    def _read_segment(self, entry: Dict, pattern: Optional[str]) -> List[str]:
+        regex = compile_filter(pattern)
+        path = self._segment_path(entry)
+        if path is None:
+            return []
+        try:
+            with _open_segment(path) as f:
+                return [line for line in (raw.decode("utf-8", errors="replace").rstrip("\n") for raw in f)
+                        if regex is None or regex.search(line)]
+        except FileNotFoundError:
+            return []
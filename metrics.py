@@ -0,0 +1,327 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+import logging
+import subprocess
+from collections import deque, namedtuple
+from typing import Callable, Dict, List, Optional
+
+import psutil
+
+from timeseries import TimeSeriesStore
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+SAMPLE_INTERVAL = 10.0
+# Samples kept in memory per bot (10 minutes at the default interval)
+SAMPLE_HISTORY = 60
+# Aggregates are written to the bots table once every this many samples
+FLUSH_EVERY = 6
+# A sample above either of these counts as activity. Long-polling for updates alone
+# stays under the traffic threshold.
+IDLE_CPU_PERCENT = float(os.getenv("IDLE_CPU_PERCENT", "1.0"))
+IDLE_NET_BYTES = int(os.getenv("IDLE_NET_BYTES", "4096"))   # sent per minute
+
+# net_sent: bytes the bot sent over the network since its previous sample; None if unknown
+Sample = namedtuple("Sample", ["timestamp", "cpu_percent", "memory_mb", "uptime", "net_sent"],
+                    defaults=(None,))
+
+SS_OWNER = re.compile(r"pid=(\d+),fd=(\d+)")
+SS_SENT = re.compile(r"bytes_sent:(\d+)")
+
+
+# ----------------- OUTBOUND TRAFFIC -----------------
+def _netns(pid: int) -> Optional[str]:
+    try:
+        return os.readlink(f"/proc/{pid}/ns/net")
+    except OSError:
+        return None
+
+
+def _interface_bytes_sent(pid: int) -> Optional[int]:
+    # Every interface but loopback, of the network namespace pid lives in
+    try:
+        with open(f"/proc/{pid}/net/dev") as f:
+            lines = f.readlines()[2:]
+    except OSError:
+        return None
+    total = 0
+    for line in lines:
+        name, counters = line.split(":", 1)
+        if name.strip() != "lo":
+            total += int(counters.split()[8])
+    return total
+
+
+def _socket_bytes_sent() -> Optional[Dict[tuple, int]]:
+    """(pid, fd, local, peer) -> bytes sent, for every TCP socket ss can tie to a process."""
+    try:
+        out = subprocess.run(["ss", "-tinpH"], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    sockets = {}
+    header = None
+    for line in out.splitlines():
+        if not line[:1].isspace():
+            header = line.split()
+            continue
+        sent = SS_SENT.search(line)
+        if header and len(header) > 5 and sent:
+            for pid, fd in SS_OWNER.findall(header[5]):
+                sockets[(int(pid), int(fd), header[3], header[4])] = int(sent.group(1))
+    return sockets
+
+
+class OutboundCounter:
+    """Bytes each bot's process tree sent since the previous pass.
+
+    A process in its own network namespace is measured by that namespace's interface
+    counters. The others share ours, so their TCP sockets are read one by one through
+    `ss`. Without ss nothing is reported for them and only CPU shows activity. Docker
+    bots are not counted here; their traffic comes with the container stats.
+    """
+
+    def __init__(self):
+        self.host_ns = _netns(os.getpid())
+        self.has_ss = shutil.which("ss") is not None
+        self.sockets: Dict[tuple, int] = {}
+        self.interfaces: Dict[int, int] = {}
+
+    def sample(self, trees: Dict[int, List[int]]) -> Dict[int, int]:
+        sockets = _socket_bytes_sent() if self.has_ss else None
+        sent = {}
+        interfaces = {}
+        for bot_id, pids in trees.items():
+            ns = _netns(pids[0])
+            if ns and ns != self.host_ns:
+                total = _interface_bytes_sent(pids[0])
+                if total is not None:
+                    interfaces[bot_id] = total
+                    if bot_id in self.interfaces:
+                        sent[bot_id] = max(0, total - self.interfaces[bot_id])
+            elif sockets is not None:
+                tree = set(pids)
+                # A socket opened since the last pass counts in full
+                sent[bot_id] = sum(max(0, count - self.sockets.get(key, 0))
+                                   for key, count in sockets.items() if key[0] in tree)
+        if sockets is not None:
+            self.sockets = sockets
+        self.interfaces = interfaces
+        return sent
+
+
+# ----------------- CONTAINERS -----------------
+def _container_memory(stats: dict) -> int:
+    # What `docker stats` shows: usage without the reclaimable page cache
+    memory = stats.get("memory_stats") or {}
+    detail = memory.get("stats") or {}
+    cache = detail.get("inactive_file", detail.get("total_inactive_file", 0))
+    return max(0, memory.get("usage", 0) - cache)
+
+
+class ContainerSampler:
+    """CPU, memory and outbound traffic of bots in containers, from the runtime's stats readings.
+
+    Container counters are cumulative, so CPU and traffic are deltas since the previous
+    pass; a container's first reading reports no CPU and unknown traffic.
+    """
+
+    def __init__(self, read: Callable[[str], dict]):
+        self.read = read
+        # container_id -> (container CPU ns, system CPU ns, bytes sent)
+        self.previous: Dict[str, tuple] = {}
+
+    def sample(self, containers: Dict[int, str]) -> Dict[int, tuple]:
+        """bot_id -> (cpu percent, memory bytes, bytes sent or None) for every container read."""
+        usage = {}
+        previous = {}
+        for bot_id, container_id in containers.items():
+            stats = self.read(container_id)
+            cpu_stats = stats.get("cpu_stats") or {}
+            total = (cpu_stats.get("cpu_usage") or {}).get("total_usage")
+            system = cpu_stats.get("system_cpu_usage")
+            if total is None or not system:
+                continue
+            # Every interface of the container's own network namespace
+            tx = sum(net.get("tx_bytes", 0) for net in (stats.get("networks") or {}).values())
+            cpu = 0.0
+            sent = None
+            last = self.previous.get(container_id)
+            if last:
+                if system > last[1]:
+                    # Scaled like psutil: 100 is one full core
+                    cpu = max(0.0, (total - last[0]) / (system - last[1]) * (cpu_stats.get("online_cpus") or 1) * 100)
+                sent = max(0, tx - last[2])
+            previous[container_id] = (total, system, tx)
+            usage[bot_id] = (cpu, _container_memory(stats), sent)
+        self.previous = previous
+        return usage
+
+
+# ----------------- METRICS COLLECTOR -----------------
+class MetricsCollector:
+    """Samples every supervised bot on a fixed interval and keeps recent samples in memory.
+
+    Bots on worker nodes are not sampled here; their samples arrive through ingest().
+    Bots in containers are read through the runtime's stats, the rest through psutil.
+    Without a database (as on a worker) nothing is persisted. It also notes when each
+    bot was last active, for hibernating idle ones.
+    """
+
+    def __init__(self, supervisor, database, interval: float = SAMPLE_INTERVAL,
+                 timeseries: Optional[TimeSeriesStore] = None):
+        self.supervisor = supervisor
+        self.db = database
+        self.interval = interval
+        self.timeseries = timeseries or TimeSeriesStore()
+        self.samples: Dict[int, deque] = {}
+        # psutil needs the same Process object across calls to report CPU deltas
+        self._proc_cache: Dict[int, psutil.Process] = {}
+        # Bots sampled elsewhere -> monotonic time of their last sample
+        self.remote: Dict[int, float] = {}
+        # bot_id -> time of the last sample that showed CPU or network activity
+        self.active_at: Dict[int, float] = {}
+        self.outbound = OutboundCounter()
+        stats = getattr(supervisor.runtime, "stats", None)
+        self.containers = ContainerSampler(stats) if stats else None
+        self._task: Optional[asyncio.Task] = None
+        self._ticks = 0
+
+    def latest(self, bot_id: int) -> Optional[Sample]:
+        history = self.samples.get(bot_id)
+        return history[-1] if history else None
+
+    def history(self, bot_id: int) -> List[Sample]:
+        return list(self.samples.get(bot_id, ()))
+
+    def average(self, bot_id: int) -> Optional[Sample]:
+        history = self.samples.get(bot_id)
+        if not history:
+            return None
+        n = len(history)
+        return Sample(history[-1].timestamp, sum(s.cpu_percent for s in history) / n,
+                      sum(s.memory_mb for s in history) / n, history[-1].uptime)
+
+    def ingest(self, bot_id: int, sample: Sample):
+        self._record(bot_id, sample)
+        self.remote[bot_id] = time.monotonic()
+
+    def _record(self, bot_id: int, sample: Sample):
+        self.samples.setdefault(bot_id, deque(maxlen=SAMPLE_HISTORY)).append(sample)
+        self.timeseries.record(bot_id, sample.timestamp, sample.cpu_percent, sample.memory_mb)
+        busy_net = IDLE_NET_BYTES * self.interval / 60
+        if (bot_id not in self.active_at or sample.cpu_percent > IDLE_CPU_PERCENT
+                or (sample.net_sent is not None and sample.net_sent > busy_net)):
+            self.active_at[bot_id] = sample.timestamp
+
+    def idle_for(self, bot_id: int) -> Optional[float]:
+        """Seconds since the bot last used CPU or the network; None if it isn't being sampled."""
+        active_at = self.active_at.get(bot_id)
+        return time.time() - active_at if active_at is not None else None
+
+    def reset_idle(self, bot_id: int):
+        self.active_at[bot_id] = time.time()
+
+    def _cached(self, proc: psutil.Process) -> psutil.Process:
+        cached = self._proc_cache.get(proc.pid)
+        if cached is None:
+            self._proc_cache[proc.pid] = cached = proc
+        return cached
+
+    def _sample_all(self, targets: Dict[int, tuple]) -> Dict[int, Sample]:
+        # Runs in a worker thread: one pass over every supervised process tree or container
+        now = time.time()
+        usage = {}
+        trees = {}
+        seen = set()
+        container_sent = {}
+        containers = {bot_id: target for bot_id, (target, _) in targets.items() if isinstance(target, str)}
+        if containers and self.containers:
+            for bot_id, (cpu, memory, sent) in self.containers.sample(containers).items():
+                usage[bot_id] = (cpu, memory, targets[bot_id][1])
+                container_sent[bot_id] = sent
+        for bot_id, (pid, uptime) in targets.items():
+            if bot_id in containers:
+                continue
+            cpu = 0.0
+            rss = 0
+            try:
+                root = self._proc_cache.get(pid) or self._cached(psutil.Process(pid))
+                tree = [root] + [self._cached(child) for child in root.children(recursive=True)]
+            except psutil.Error:
+                continue
+            for proc in tree:
+                try:
+                    with proc.oneshot():
+                        cpu += proc.cpu_percent(None)
+                        rss += proc.memory_info().rss
+                    seen.add(proc.pid)
+                except psutil.Error:
+                    pass
+            usage[bot_id] = (cpu, rss, uptime)
+            trees[bot_id] = [proc.pid for proc in tree]
+        for pid in list(self._proc_cache):
+            if pid not in seen:
+                del self._proc_cache[pid]
+        sent = self.outbound.sample(trees)
+        sent.update(container_sent)
+        return {bot_id: Sample(now, round(cpu, 2), round(rss / 1024 / 1024, 2), int(uptime), sent.get(bot_id))
+                for bot_id, (cpu, rss, uptime) in usage.items()}
+
+    def _targets(self) -> Dict[int, tuple]:
+        """bot_id -> (container ID, or PID of a plain process, uptime)."""
+        now = time.monotonic()
+        return {bot_id: (proc.container_id or proc.pid, now - proc.started_at)
+                for bot_id, proc in self.supervisor.processes.items() if proc.pid is not None}
+
+    async def collect_once(self):
+        results = await asyncio.to_thread(self._sample_all, self._targets())
+        for bot_id, sample in results.items():
+            self._record(bot_id, sample)
+        stale = time.monotonic() - 3 * self.interval
+        for bot_id, seen in list(self.remote.items()):
+            if seen < stale:
+                del self.remote[bot_id]
+        for bot_id in list(self.samples):
+            if bot_id not in self.supervisor.processes and bot_id not in self.remote:
+                del self.samples[bot_id]
+                self.active_at.pop(bot_id, None)
+        self._ticks += 1
+        if self._ticks % FLUSH_EVERY == 0 and self.samples and self.db is not None:
+            rows = []
+            for bot_id in self.samples:
+                avg = self.average(bot_id)
+                rows.append((avg.cpu_percent, avg.memory_mb, avg.uptime, bot_id))
+            await self.db.update_bot_metrics(rows)
+            await self.db.save_metric_series(self.timeseries.dirty_blobs())
+        return results
+
+    async def load_history(self):
+        self.timeseries.load(await self.db.load_metric_series())
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.collect_once()
+            except Exception as e:
+                logger.error(f"Metrics collection failed: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.db is not None:
+            await self.db.save_metric_series(self.timeseries.dirty_blobs())
@@ -0,0 +1,275 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class Demand(NamedTuple):
+    cpu: float      # percent of one core, like the collected samples
+    memory: float   # MB
+
+
+class Migration(NamedTuple):
+    bot_id: int
+    source: str
+    target: str
+
+
+# ----------------- CONFIG -----------------
+# "binpack" places bots by measured load; "hash" keeps plain consistent hashing
+SCHEDULER = os.getenv("SCHEDULER", "binpack")
+# Share of every node that bots of free users may not fill, kept for premium tenants
+PREMIUM_HEADROOM = float(os.getenv("PREMIUM_HEADROOM", "0.2"))
+# A node whose observed CPU or memory goes above this share of capacity is hot
+HOT_THRESHOLD = float(os.getenv("HOT_THRESHOLD", "0.9"))
+# Migrations off a hot node stop once it is back at this share
+TARGET_UTILIZATION = float(os.getenv("TARGET_UTILIZATION", "0.75"))
+# Perform suggested migrations on every pass instead of only listing them in /placement
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "0") == "1"
+SCHEDULE_INTERVAL = float(os.getenv("SCHEDULE_INTERVAL", "60"))
+MAX_MIGRATIONS = 5
+# History a bot's demand is estimated from, and the window "observed" load covers
+DEMAND_WINDOW = 24 * 3600
+RECENT_WINDOW = 300
+# CPU bursts above this percentile are absorbed by headroom; memory is reserved at its peak
+DEMAND_PERCENTILE = 0.95
+# What a bot with no history yet is assumed to need
+DEFAULT_DEMAND = Demand(5.0, 64.0)
+
+
+def estimate_demand(cpu: Sequence[float], memory: Sequence[float]) -> Optional[Demand]:
+    """Demand to reserve for a bot, from its CPU and memory history; None without history."""
+    if not cpu:
+        return None
+    cpu = sorted(cpu)
+    return Demand(cpu[min(len(cpu) - 1, int(DEMAND_PERCENTILE * len(cpu)))], max(memory))
+
+
+# ----------------- NODE LOAD -----------------
+class NodeLoad:
+    """Capacity of one worker node and the demand placed on it."""
+
+    __slots__ = ("node_id", "cpu_capacity", "memory_capacity", "cpu", "memory", "bots")
+
+    def __init__(self, node_id: str, cpu_capacity: float, memory_capacity: float):
+        self.node_id = node_id
+        self.cpu_capacity = cpu_capacity
+        self.memory_capacity = memory_capacity
+        self.cpu = 0.0
+        self.memory = 0.0
+        # bot_id -> (demand, premium)
+        self.bots: Dict[int, tuple] = {}
+
+    def utilization(self, cpu: float = 0.0, memory: float = 0.0) -> float:
+        # The scarcer resource decides how full a node is
+        return max((self.cpu + cpu) / self.cpu_capacity, (self.memory + memory) / self.memory_capacity)
+
+    def fits(self, demand: Demand, premium: bool, ceiling: float = 1.0) -> bool:
+        limit = 1.0 if premium else 1.0 - PREMIUM_HEADROOM
+        return self.utilization(*demand) <= min(limit, ceiling)
+
+    def add(self, bot_id: int, demand: Demand, premium: bool):
+        self.remove(bot_id)
+        self.bots[bot_id] = (demand, premium)
+        self.cpu += demand.cpu
+        self.memory += demand.memory
+
+    def remove(self, bot_id: int):
+        entry = self.bots.pop(bot_id, None)
+        if entry:
+            self.cpu -= entry[0].cpu
+            self.memory -= entry[0].memory
+
+
+def best_fit(loads: Iterable[NodeLoad], demand: Demand, premium: bool,
+             ceiling: float = 1.0) -> Optional[NodeLoad]:
+    """The node left fullest by the placement, among those it fits on.
+
+    Filling the busiest nodes first packs bots densely and keeps whole nodes free for
+    large bots, or to be drained.
+    """
+    fitting = [load for load in loads if load.fits(demand, premium, ceiling)]
+    return max(fitting, key=lambda load: load.utilization(*demand), default=None)
+
+
+def least_loaded(loads: Iterable[NodeLoad], demand: Demand) -> Optional[NodeLoad]:
+    return min(loads, key=lambda load: load.utilization(*demand), default=None)
+
+
+def plan_migrations(loads: Dict[str, NodeLoad], hot: float = HOT_THRESHOLD, target: float = TARGET_UTILIZATION,
+                    limit: int = MAX_MIGRATIONS) -> List[Migration]:
+    """Moves that bring hot nodes back down to target without making another node hot.
+
+    Free bots go before premium ones, and bigger bots before smaller, so premium tenants
+    are disturbed last and each move sheds as much as it can. loads is updated in place.
+    """
+    migrations = []
+    for source in sorted(loads.values(), key=lambda load: load.utilization(), reverse=True):
+        if source.utilization() <= hot:
+            break
+        candidates = sorted(source.bots.items(),
+                            key=lambda item: (item[1][1], -max(item[1][0].cpu / source.cpu_capacity,
+                                                               item[1][0].memory / source.memory_capacity)))
+        for bot_id, (demand, premium) in candidates:
+            if source.utilization() <= target or len(migrations) >= limit:
+                break
+            others = [load for load in loads.values() if load is not source]
+            dest = best_fit(others, demand, premium, ceiling=target)
+            if dest is None:
+                continue
+            source.remove(bot_id)
+            dest.add(bot_id, demand, premium)
+            migrations.append(Migration(bot_id, source.node_id, dest.node_id))
+    return migrations
+
+
+# ----------------- SCHEDULER -----------------
+History = Callable[[int, float], list]
+
+
+class Scheduler:
+    """Places bots on worker nodes by measured load instead of by hash alone.
+
+    Each bot reserves its estimated demand on the node it is placed on. Bots stay where
+    they are while they still fit; new ones go best-fit. Nodes that don't report capacity
+    (and the "hash" policy) fall back to the cluster's hash ring. A periodic pass looks
+    for hot nodes and suggests migrations off them, or performs them with AUTO_MIGRATE.
+    """
+
+    def __init__(self, cluster, history: History, policy: str = SCHEDULER):
+        self.cluster = cluster
+        # (bot_id, since) -> timeseries buckets
+        self.history = history
+        self.policy = policy
+        # bot_id -> (node_id, demand, premium)
+        self.placed: Dict[int, tuple] = {}
+        self.suggestions: List[Migration] = []
+        self.on_migrate: Optional[Callable[[Migration], Awaitable[None]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self.cluster.enabled and self.policy == "binpack"
+
+    def demand(self, bot) -> Demand:
+        buckets = self.history(bot[0], time.time() - DEMAND_WINDOW)
+        estimate = estimate_demand([b[2] for b in buckets], [b[6] for b in buckets])
+        if estimate:
+            return estimate
+        if bot[9] or bot[10]:
+            # Averages kept in the bots table, for bots whose history wasn't saved
+            return Demand(bot[9] or 0.0, bot[10] or 0.0)
+        return DEFAULT_DEMAND
+
+    def observed(self, bot_id: int) -> Optional[Demand]:
+        buckets = self.history(bot_id, time.time() - RECENT_WINDOW)
+        if not buckets:
+            return None
+        return Demand(sum(b[2] for b in buckets) / len(buckets), max(b[6] for b in buckets))
+
+    def loads(self, observed: bool = False) -> Dict[str, NodeLoad]:
+        loads = {node.node_id: NodeLoad(node.node_id, *node.capacity)
+                 for node in self.cluster.nodes.values() if node.capacity}
+        for bot_id, (node_id, demand, premium) in self.placed.items():
+            load = loads.get(node_id)
+            if load:
+                load.add(bot_id, (self.observed(bot_id) if observed else None) or demand, premium)
+        return loads
+
+    def place(self, bot, premium: bool, node_id: str = None):
+        """Pick the worker node for a bot and reserve its demand there; None runs it on this host.
+
+        With node_id the bot goes to that node if it is still up, as for a migration.
+        """
+        if not self.active:
+            return self.cluster.owner(bot[0])
+        loads = self.loads()
+        if not loads:
+            # No worker reports its capacity yet
+            return self.cluster.owner(bot[0])
+        for load in loads.values():
+            load.remove(bot[0])
+        demand = self.demand(bot)
+        current = loads.get(node_id or bot[12])
+        if current and (node_id or current.fits(demand, premium)):
+            target = current
+        else:
+            target = best_fit(loads.values(), demand, premium)
+            if target is None:
+                target = least_loaded(loads.values(), demand)
+                logger.warning(f"No node has room for bot {bot[0]}, placing it on {target.node_id}, the least loaded")
+        self.reserve(bot[0], target.node_id, demand, premium)
+        return self.cluster.nodes[target.node_id]
+
+    def reserve(self, bot_id: int, node_id: str, demand: Demand, premium: bool):
+        self.placed[bot_id] = (node_id, demand, premium)
+
+    def release(self, bot_id: int):
+        self.placed.pop(bot_id, None)
+
+    def _sized(self) -> bool:
+        return any(node.capacity for node in self.cluster.nodes.values())
+
+    def needs_move(self, bot) -> bool:
+        if not self.active or not self._sized():
+            return self.cluster.needs_move(bot)
+        if not bot[12]:
+            # Bots left on this host move onto workers once there are some
+            return True
+        # Nodes joining move nothing: new bots and migrations fill them
+        return not self.cluster.is_live(bot[12]) or self.cluster.lost(bot)
+
+    # ----------------- REBALANCING PASSES -----------------
+    def refresh(self):
+        # Demand estimates drift as history accumulates
+        for bot_id, (node_id, demand, premium) in list(self.placed.items()):
+            buckets = self.history(bot_id, time.time() - DEMAND_WINDOW)
+            estimate = estimate_demand([b[2] for b in buckets], [b[6] for b in buckets])
+            if estimate:
+                self.placed[bot_id] = (node_id, estimate, premium)
+
+    async def run_once(self) -> List[Migration]:
+        self.refresh()
+        self.suggestions = plan_migrations(self.loads(observed=True))
+        if self.suggestions:
+            logger.info(f"{len(self.suggestions)} migrations suggested off hot nodes")
+        if self.suggestions and AUTO_MIGRATE and self.on_migrate:
+            await self.apply()
+        return self.suggestions
+
+    async def apply(self) -> int:
+        done = 0
+        suggestions, self.suggestions = self.suggestions, []
+        for migration in suggestions:
+            try:
+                await self.on_migrate(migration)
+                done += 1
+            except Exception as e:
+                logger.error(f"Migrating bot {migration.bot_id} failed: {e}")
+        return done
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(SCHEDULE_INTERVAL)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Scheduling pass failed: {e}")
+
+    def start(self):
+        if self.active and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def describe(self) -> List[Dict[str, any]]:
+        return [{"node_id": load.node_id, "bots": len(load.bots),
+                 "cpu": load.cpu / load.cpu_capacity, "memory": load.memory / load.memory_capacity}
+                for load in sorted(self.loads(observed=True).values(), key=lambda load: load.node_id)]
@@ -0,0 +1,281 @@
+"""Replay recorded per-bot load through the placement policies and compare packing.
+
+    python simulate.py --db bot_hosting.db          # history saved by the metrics collector
+    python simulate.py --trace load.csv             # timestamp,bot_id,cpu,memory[,premium]
+    python simulate.py --synthetic 500 --days 3     # generated diurnal load
+
+Bots are placed online, as they appear in the trace, from the history replayed so far;
+the trace itself is what they then actually use. Bin-packing opens a node only when no
+open one has room, so its peak node count is the capacity it needed. Hashing gets the
+same number of nodes unless --nodes says otherwise.
+"""
+import csv
+import math
+import random
+import argparse
+from collections import defaultdict, deque
+from typing import Dict, Optional, Set
+
+from cluster import HashRing
+from scheduler import (DEFAULT_DEMAND, DEMAND_WINDOW, HOT_THRESHOLD, Demand, NodeLoad, best_fit,
+                       estimate_demand, least_loaded, plan_migrations)
+
+# ----------------- CONFIG -----------------
+NODE_CPU = 400.0        # 4 cores
+NODE_MEMORY = 4096.0    # MB
+# Trace steps between scheduling passes, which is when migrations happen
+PASS_EVERY = 12
+
+
+# ----------------- TRACES -----------------
+class Trace:
+    """Per-step samples: timestamp -> {bot_id: (cpu, memory)}."""
+
+    def __init__(self):
+        self.steps: Dict[int, Dict[int, tuple]] = defaultdict(dict)
+        self.premium: Set[int] = set()
+
+    def add(self, ts: int, bot_id: int, cpu: float, memory: float):
+        self.steps[ts][bot_id] = (cpu, memory)
+
+    @property
+    def step(self) -> int:
+        stamps = sorted(self.steps)
+        gaps = sorted(b - a for a, b in zip(stamps, stamps[1:]))
+        return gaps[len(gaps) // 2] if gaps else 60
+
+
+def load_csv(path: str) -> Trace:
+    trace = Trace()
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            bot_id = int(row["bot_id"])
+            trace.add(int(float(row["timestamp"])), bot_id, float(row["cpu"]), float(row["memory"]))
+            if row.get("premium") in ("1", "true", "True"):
+                trace.premium.add(bot_id)
+    return trace
+
+
+def load_database(path: str, resolution: str = "hours") -> Trace:
+    from database import Database
+    from timeseries import BotSeries
+
+    database = Database(path)
+    try:
+        trace = Trace()
+        for bot_id, blob in database.load_metric_series():
+            series = BotSeries.from_blob(blob)
+            if series is None:
+                continue
+            for bucket in getattr(series, resolution).range(0, float("inf")):
+                trace.add(bucket[0], bot_id, bucket[2], bucket[5])
+        premium_users = {user[0] for user in database.get_all_users() if user[6]}
+        trace.premium = {bot[0] for bot in database.get_all_bots() if bot[1] in premium_users}
+    finally:
+        database.close()
+    return trace
+
+
+def synthetic(bots: int, days: float = 2, step: int = 300, seed: int = 1) -> Trace:
+    """Heavy-tailed bot sizes with a daily cycle, occasional bursts, arrivals and departures."""
+    rng = random.Random(seed)
+    trace = Trace()
+    steps = int(days * 86400 // step)
+    for bot_id in range(1, bots + 1):
+        cpu_base = rng.lognormvariate(1.0, 1.0)
+        memory_base = rng.lognormvariate(4.0, 0.6)
+        phase = rng.uniform(0, 2 * math.pi)
+        swing = rng.uniform(0.0, 0.8)
+        start = rng.randrange(steps // 2) if rng.random() < 0.3 else 0
+        end = rng.randrange(start + 1, steps + 1) if rng.random() < 0.2 else steps
+        if rng.random() < 0.2:
+            trace.premium.add(bot_id)
+        for i in range(start, end):
+            ts = i * step
+            cpu = cpu_base * (1 + swing * math.sin(2 * math.pi * ts / 86400 + phase))
+            if rng.random() < 0.02:
+                cpu *= rng.uniform(3, 8)
+            memory = memory_base * (1 + 0.2 * (i - start) / steps) + rng.gauss(0, memory_base * 0.02)
+            trace.add(ts, bot_id, round(cpu, 2), round(max(memory, 1.0), 1))
+    return trace
+
+
+# ----------------- SIMULATION -----------------
+class Simulation:
+    def __init__(self, policy: str, step: int, nodes: int = 0, cpu: float = NODE_CPU,
+                 memory: float = NODE_MEMORY, pass_every: int = PASS_EVERY):
+        self.policy = policy
+        self.cpu = cpu
+        self.memory = memory
+        self.pass_every = pass_every
+        self.elastic = not nodes
+        self.loads: Dict[str, NodeLoad] = {}
+        self.ring = HashRing()
+        self.placement: Dict[int, str] = {}
+        window = max(1, DEMAND_WINDOW // step)
+        self.history: Dict[int, tuple] = defaultdict(lambda: (deque(maxlen=window), deque(maxlen=window)))
+        for _ in range(nodes):
+            self._open_node()
+        self.steps = 0
+        self.peak_nodes = 0
+        self.node_steps = 0
+        self.overloaded = 0
+        self.hot = 0
+        self.premium_steps = 0
+        self.premium_overloaded = 0
+        self.migrations = 0
+        self.density = 0.0
+        self.cpu_util = 0.0
+        self.memory_util = 0.0
+
+    def _open_node(self) -> NodeLoad:
+        node_id = f"node-{len(self.loads) + 1}"
+        self.loads[node_id] = load = NodeLoad(node_id, self.cpu, self.memory)
+        self.ring.add(node_id)
+        return load
+
+    def demand(self, bot_id: int) -> Demand:
+        cpu, memory = self.history[bot_id]
+        return estimate_demand(cpu, memory) or DEFAULT_DEMAND
+
+    def place(self, bot_id: int, premium: bool):
+        demand = self.demand(bot_id)
+        if self.policy == "hash":
+            if not self.loads:
+                self._open_node()
+            target = self.loads[self.ring.owner(bot_id)]
+        else:
+            target = best_fit(self.loads.values(), demand, premium)
+            if target is None:
+                target = self._open_node() if self.elastic else least_loaded(self.loads.values(), demand)
+        target.add(bot_id, demand, premium)
+        self.placement[bot_id] = target.node_id
+
+    def run_pass(self, samples: Dict[int, tuple]):
+        for load in self.loads.values():
+            for bot_id, (_, premium) in list(load.bots.items()):
+                load.add(bot_id, self.demand(bot_id), premium)
+        if self.elastic and all(load.bots for load in self.loads.values()):
+            # Somewhere for a hot node to shed to, as adding a worker would give
+            self._open_node()
+        observed = {node_id: NodeLoad(node_id, self.cpu, self.memory) for node_id in self.loads}
+        for bot_id, node_id in self.placement.items():
+            cpu, memory = samples[bot_id]
+            observed[node_id].add(bot_id, Demand(cpu, memory), self.loads[node_id].bots[bot_id][1])
+        for migration in plan_migrations(observed):
+            _, premium = self.loads[migration.source].bots[migration.bot_id]
+            self.loads[migration.source].remove(migration.bot_id)
+            self.loads[migration.target].add(migration.bot_id, self.demand(migration.bot_id), premium)
+            self.placement[migration.bot_id] = migration.target
+            self.migrations += 1
+
+    def step(self, samples: Dict[int, tuple], premium: Set[int]):
+        for bot_id in [b for b in self.placement if b not in samples]:
+            self.loads[self.placement.pop(bot_id)].remove(bot_id)
+        for bot_id in samples:
+            if bot_id not in self.placement:
+                self.place(bot_id, bot_id in premium)
+
+        usage = defaultdict(lambda: [0.0, 0.0, 0])
+        for bot_id, node_id in self.placement.items():
+            cpu, memory = samples[bot_id]
+            entry = usage[node_id]
+            entry[0] += cpu
+            entry[1] += memory
+            entry[2] += 1
+        overloaded = set()
+        for node_id, (cpu, memory, _) in usage.items():
+            utilization = max(cpu / self.cpu, memory / self.memory)
+            if utilization > 1.0:
+                overloaded.add(node_id)
+            if utilization > HOT_THRESHOLD:
+                self.hot += 1
+        for bot_id in samples:
+            if bot_id in premium:
+                self.premium_steps += 1
+                self.premium_overloaded += self.placement[bot_id] in overloaded
+
+        self.steps += 1
+        self.node_steps += len(usage)
+        self.overloaded += len(overloaded)
+        self.peak_nodes = max(self.peak_nodes, len(usage))
+        if usage:
+            self.density += len(samples) / len(usage)
+            self.cpu_util += sum(u[0] for u in usage.values()) / (self.cpu * len(usage))
+            self.memory_util += sum(u[1] for u in usage.values()) / (self.memory * len(usage))
+
+        for bot_id, (cpu, memory) in samples.items():
+            history = self.history[bot_id]
+            history[0].append(cpu)
+            history[1].append(memory)
+        if self.policy == "binpack" and self.steps % self.pass_every == 0:
+            self.run_pass(samples)
+
+    def replay(self, trace: Trace) -> "Simulation":
+        for ts in sorted(trace.steps):
+            self.step(trace.steps[ts], trace.premium)
+        return self
+
+    def report(self) -> Dict[str, float]:
+        steps = self.steps or 1
+        return {
+            "nodes": self.peak_nodes,
+            "bots/node": self.density / steps,
+            "cpu util": self.cpu_util / steps,
+            "mem util": self.memory_util / steps,
+            "hot": self.hot / (self.node_steps or 1),
+            "overloaded": self.overloaded / (self.node_steps or 1),
+            "premium hit": self.premium_overloaded / (self.premium_steps or 1),
+            "migrations": self.migrations,
+        }
+
+
+def compare(trace: Trace, nodes: Optional[int] = None, cpu: float = NODE_CPU, memory: float = NODE_MEMORY,
+            pass_every: int = PASS_EVERY) -> Dict[str, Dict[str, float]]:
+    step = trace.step
+    binpack = Simulation("binpack", step, nodes or 0, cpu, memory, pass_every).replay(trace)
+    hashed = Simulation("hash", step, nodes or binpack.peak_nodes, cpu, memory, pass_every).replay(trace)
+    return {"binpack": binpack.report(), "hash": hashed.report()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bot placement against recorded load")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="CSV with timestamp,bot_id,cpu,memory[,premium] rows")
+    source.add_argument("--db", help="Replay the metric history saved in this database")
+    source.add_argument("--synthetic", type=int, metavar="BOTS", help="Generate load for this many bots")
+    parser.add_argument("--resolution", choices=("minutes", "hours"), default="hours",
+                        help="Which history buckets to replay with --db")
+    parser.add_argument("--days", type=float, default=2, help="Length of a synthetic trace")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--nodes", type=int, help="Fixed node count (default: as many as bin-packing needs)")
+    parser.add_argument("--node-cpu", type=float, default=NODE_CPU, help="CPU percent per node")
+    parser.add_argument("--node-memory", type=float, default=NODE_MEMORY, help="Memory MB per node")
+    parser.add_argument("--pass-every", type=int, default=PASS_EVERY, help="Trace steps between scheduling passes")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_csv(args.trace)
+    elif args.db:
+        trace = load_database(args.db, args.resolution)
+    else:
+        trace = synthetic(args.synthetic, args.days, seed=args.seed)
+    if not trace.steps:
+        raise SystemExit("Trace is empty")
+    bots = {bot_id for samples in trace.steps.values() for bot_id in samples}
+    print(f"{len(trace.steps)} steps of {trace.step}s, {len(bots)} bots ({len(trace.premium & bots)} premium)")
+
+    results = compare(trace, args.nodes, args.node_cpu, args.node_memory, args.pass_every)
+    columns = list(results["binpack"])
+    print(f"{'policy':<9}" + "".join(f"{c:>13}" for c in columns))
+    for policy, report in results.items():
+        cells = []
+        for column in columns:
+            value = report[column]
+            cells.append(f"{value:>13.1%}" if column in ("cpu util", "mem util", "hot", "overloaded", "premium hit")
+                         else f"{value:>13.1f}" if isinstance(value, float) else f"{value:>13}")
+        print(f"{policy:<9}" + "".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List
+
+# ----------------- CONFIG -----------------
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", "10000"))
+# Every write goes through the cache, so the TTL only bounds drift from edits made
+# outside this process (e.g. by hand in sqlite3)
+STATE_CACHE_TTL = float(os.getenv("STATE_CACHE_TTL", "300"))
+
+
+# ----------------- RECORDS -----------------
+class Record:
+    """A table row in fixed slots; indexes and slices like the tuple it replaces."""
+
+    __slots__ = ()
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        return getattr(self, self.__slots__[index])
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return f"{type(self).__name__}{tuple(self)!r}"
+
+
+class UserRecord(Record):
+    __slots__ = ("user_id", "username", "first_name", "join_date", "is_banned", "total_bots",
+                 "is_premium", "github_token")
+
+
+class BotRecord(Record):
+    __slots__ = ("bot_id", "user_id", "bot_name", "bot_type", "file_path", "container_id", "status",
+                 "created_at", "last_active", "cpu_usage", "memory_usage", "uptime", "node_id", "wake_at")
+
+
+# ----------------- CACHE -----------------
+class RecordCache:
+    """LRU of records with a TTL.
+
+    A read that misses takes a load token first; invalidate() marks every open token
+    for the key stale, so a row read before a write can't be cached after it.
+    """
+
+    def __init__(self, size: int = STATE_CACHE_SIZE, ttl: float = STATE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.loading: Dict[Hashable, List[list]] = {}
+        # Bumped on every write, for fills that cover more than one key
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def begin_load(self, key) -> list:
+        token = [False]
+        self.loading.setdefault(key, []).append(token)
+        return token
+
+    def finish_load(self, key, token: list, value):
+        tokens = [t for t in self.loading.pop(key, ()) if t is not token]
+        if tokens:
+            self.loading[key] = tokens
+        if not token[0] and value is not None:
+            self.put(key, value)
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def update(self, key, **fields):
+        # Patch a cached record in place; readers already holding it see the change too
+        self.version += 1
+        for token in self.loading.get(key, ()):
+            token[0] = True
+        entry = self.entries.get(key)
+        if entry is not None:
+            for name, value in fields.items():
+                setattr(entry[1], name, value)
+
+    def invalidate(self, key):
+        self.version += 1
+        for token in self.loading.get(key, ()):
+            token[0] = True
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.version += 1
+        for tokens in self.loading.values():
+            for token in tokens:
+                token[0] = True
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                "hit_rate": round(100 * self.hits / total) if total else 0}
@@ -0,0 +1,259 @@
+import os
+import sys
+import signal
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Callable, Awaitable
+
+from deps import PYTHON_DEPS_DIR
+from log_store import BotLogStore
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+MAX_CONCURRENT_SPAWNS = int(os.getenv("MAX_CONCURRENT_SPAWNS", "32"))
+STOP_TIMEOUT = float(os.getenv("BOT_STOP_TIMEOUT", "10"))
+RESTART_BACKOFF_BASE = 1.0
+RESTART_BACKOFF_MAX = 60.0
+MAX_RESTARTS = 5
+# A run that lasts this long (seconds) counts as healthy and resets the backoff
+STABLE_RUNTIME = 60
+# Largest single line read from a bot's output before it is split
+STREAM_LIMIT = 1024 * 1024
+
+StatusCallback = Callable[[int, str], Awaitable[None]]
+
+
+# ----------------- PROCESS RECORD -----------------
+class BotProcess:
+    def __init__(self, bot_id: int, bot_type: str, main_file: Path, log_store: BotLogStore,
+                 premium: bool = False):
+        self.bot_id = bot_id
+        self.bot_type = bot_type
+        self.main_file = main_file
+        self.cwd = main_file.parent
+        self.log_store = log_store
+        self.premium = premium
+        # Runtime handle: an asyncio Process, or anything with pid/returncode/wait()
+        self.process = None
+        self.watcher: Optional[asyncio.Task] = None
+        self.pump: Optional[asyncio.Task] = None
+        self.container_id: Optional[str] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.stopping = False
+
+    @property
+    def pid(self) -> Optional[int]:
+        if self.process and self.process.returncode is None:
+            return self.process.pid
+        return None
+
+
+# ----------------- SUBPROCESS RUNTIME -----------------
+class SubprocessRuntime:
+    """Runs each bot as a plain child process of the platform."""
+
+    name = "process"
+
+    @staticmethod
+    def build_command(bot_type: str, file_path: str) -> List[str]:
+        if bot_type == "python":
+            return [sys.executable, "-u", file_path]
+        if bot_type == "javascript":
+            return ["node", file_path]
+        raise ValueError(f"Unsupported bot type: {bot_type}")
+
+    @staticmethod
+    def build_env(proc: BotProcess) -> Dict[str, str]:
+        env = dict(os.environ)
+        if proc.bot_type == "python":
+            # Installed modules are hardlinked into the bot's own .deps tree
+            deps = str((proc.cwd / PYTHON_DEPS_DIR).resolve())
+            env["PYTHONPATH"] = os.pathsep.join(filter(None, [deps, env.get("PYTHONPATH")]))
+        return env
+
+    async def spawn(self, proc: BotProcess):
+        cmd = self.build_command(proc.bot_type, str(proc.main_file.resolve()))
+        proc.process = await asyncio.create_subprocess_exec(
+            *cmd, cwd=str(proc.cwd), env=self.build_env(proc),
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT, start_new_session=True, limit=STREAM_LIMIT
+        )
+        # Output goes through the log store so it can be timestamped and rotated
+        proc.pump = asyncio.create_task(self._pump(proc, proc.process.stdout))
+
+    @staticmethod
+    async def _pump(proc: BotProcess, stream: asyncio.StreamReader):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # Over-long line: take what is buffered and carry on
+                line = await stream.read(STREAM_LIMIT)
+            if not line:
+                break
+            proc.log_store.append(line)
+            proc.log_store.flush()
+
+    async def signal(self, proc: BotProcess, sig: int):
+        # Bots run in their own session, so signal the whole group to catch forked children
+        try:
+            os.killpg(proc.process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    async def release(self, proc: BotProcess):
+        pass
+
+    async def startup(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def make_runtime(name: str):
+    """Runtime for BOT_RUNTIME: "docker" gives each bot its own container, anything else a child process."""
+    if name == "docker":
+        from container_runtime import DockerRuntime
+        return DockerRuntime()
+    return SubprocessRuntime()
+
+
+# ----------------- SUPERVISOR -----------------
+class ProcessSupervisor:
+    """Launches hosted bots through a runtime and keeps them alive."""
+
+    def __init__(self, on_status: Optional[StatusCallback] = None, runtime=None):
+        self.processes: Dict[int, BotProcess] = {}
+        self.on_status = on_status
+        self.runtime = runtime or SubprocessRuntime()
+        self._spawn_slots = asyncio.Semaphore(MAX_CONCURRENT_SPAWNS)
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def _lock(self, bot_id: int) -> asyncio.Lock:
+        return self._locks.setdefault(bot_id, asyncio.Lock())
+
+    def is_running(self, bot_id: int) -> bool:
+        proc = self.processes.get(bot_id)
+        return bool(proc and proc.pid)
+
+    def is_supervised(self, bot_id: int) -> bool:
+        # Also true while a crashed bot waits out its restart backoff
+        return bot_id in self.processes
+
+    def pids(self) -> Dict[int, int]:
+        return {bot_id: p.pid for bot_id, p in self.processes.items() if p.pid}
+
+    async def _notify(self, bot_id: int, status: str):
+        if self.on_status:
+            try:
+                await self.on_status(bot_id, status)
+            except Exception as e:
+                logger.error(f"Status callback failed for bot {bot_id}: {e}")
+
+    async def _spawn(self, proc: BotProcess):
+        async with self._spawn_slots:
+            await self.runtime.spawn(proc)
+        proc.started_at = time.monotonic()
+        logger.info(f"Bot {proc.bot_id} spawned ({self.runtime.name}) with PID {proc.process.pid}")
+
+    async def _watch(self, proc: BotProcess):
+        while True:
+            returncode = await proc.process.wait()
+            if proc.stopping:
+                return
+            logger.warning(f"Bot {proc.bot_id} exited with code {returncode}")
+            if time.monotonic() - proc.started_at >= STABLE_RUNTIME:
+                proc.restarts = 0
+            if proc.restarts >= MAX_RESTARTS:
+                await self._retire(proc)
+                await self._notify(proc.bot_id, "crashed")
+                return
+            delay = min(RESTART_BACKOFF_BASE * 2 ** proc.restarts, RESTART_BACKOFF_MAX)
+            proc.restarts += 1
+            await self._notify(proc.bot_id, "restarting")
+            await asyncio.sleep(delay)
+            if proc.stopping or self.processes.get(proc.bot_id) is not proc:
+                return
+            try:
+                await self._spawn(proc)
+            except Exception as e:
+                logger.error(f"Bot {proc.bot_id} respawn failed: {e}")
+                await self._retire(proc)
+                await self._notify(proc.bot_id, "crashed")
+                return
+            await self._notify(proc.bot_id, "running")
+
+    async def _retire(self, proc: BotProcess):
+        if self.processes.get(proc.bot_id) is proc:
+            self.processes.pop(proc.bot_id)
+        if proc.pump:
+            try:
+                await asyncio.wait_for(proc.pump, 1)
+            except asyncio.TimeoutError:
+                pass
+        await self.runtime.release(proc)
+        proc.log_store.close()
+
+    async def start(self, bot_id: int, bot_type: str, file_path: str,
+                    log_store: Optional[BotLogStore] = None, premium: bool = False) -> Dict[str, any]:
+        async with self._lock(bot_id):
+            if self.is_supervised(bot_id):
+                return {"success": False, "message": "Bot already running"}
+            path = Path(file_path)
+            if not path.is_file():
+                return {"success": False, "message": "Bot file missing"}
+            if bot_type not in ("python", "javascript"):
+                return {"success": False, "message": f"Unsupported bot type: {bot_type}"}
+
+            proc = BotProcess(bot_id, bot_type, path, log_store or BotLogStore(path.parent), premium)
+            try:
+                await self._spawn(proc)
+            except Exception as e:
+                await self.runtime.release(proc)
+                return {"success": False, "message": f"Launch failed: {e}"}
+            self.processes[bot_id] = proc
+            proc.watcher = asyncio.create_task(self._watch(proc))
+            return {"success": True, "message": "Bot started"}
+
+    async def stop(self, bot_id: int, timeout: float = STOP_TIMEOUT) -> Dict[str, any]:
+        async with self._lock(bot_id):
+            proc = self.processes.pop(bot_id, None)
+            if not proc:
+                return {"success": True, "message": "Bot stopped"}
+            proc.stopping = True
+            if proc.pid:
+                await self.runtime.signal(proc, signal.SIGTERM)
+                try:
+                    await asyncio.wait_for(proc.process.wait(), timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Bot {bot_id} ignored SIGTERM, killing")
+                    await self.runtime.signal(proc, signal.SIGKILL)
+                    await proc.process.wait()
+            if proc.watcher:
+                proc.watcher.cancel()
+                try:
+                    await proc.watcher
+                except asyncio.CancelledError:
+                    pass
+            if proc.pump:
+                # Let the pump drain whatever the bot printed on its way out
+                try:
+                    await asyncio.wait_for(proc.pump, 1)
+                except asyncio.TimeoutError:
+                    pass
+            await self.runtime.release(proc)
+            proc.log_store.close()
+            return {"success": True, "message": "Bot stopped"}
+
+    async def startup(self):
+        await self.runtime.startup()
+
+    async def shutdown(self):
+        await asyncio.gather(*(self.stop(bot_id) for bot_id in list(self.processes)),
+                             return_exceptions=True)
+        await self.runtime.shutdown()
@@ -0,0 +1,144 @@
+"""Just enough of the docker SDK's client for DockerRuntime, kept in memory."""
+import io
+import queue
+import tarfile
+import itertools
+
+from docker.errors import ImageNotFound, NotFound
+
+_ids = itertools.count(1)
+
+
+class FakeContainer:
+    def __init__(self, client, image, command, labels, **limits):
+        self.client = client
+        self.id = f"container{next(_ids):04d}"
+        self.image = image
+        self.command = command
+        self.labels = labels or {}
+        self.limits = dict(limits)
+        self.state = "created"
+        self.files = {}
+
+    def start(self):
+        self.state = "running"
+
+    def pause(self):
+        self.state = "paused"
+
+    def unpause(self):
+        self.state = "running"
+
+    def update(self, **limits):
+        self.limits.update(limits)
+
+    def put_archive(self, path, data):
+        raw = data if isinstance(data, bytes) else b"".join(data)
+        with tarfile.open(fileobj=io.BytesIO(raw)) as tar:
+            for member in tar.getmembers():
+                if member.isfile():
+                    self.files[f"{path}/{member.name}"] = tar.extractfile(member).read()
+        return True
+
+    def remove(self, force=False):
+        self.client.api.remove_container(self.id, force=force)
+
+
+class FakeExec:
+    def __init__(self, container, cmd, environment):
+        self.id = f"exec{next(_ids):04d}"
+        self.container = container
+        self.cmd = cmd
+        self.environment = environment
+        self.pid = 1000 + int(self.id[4:])
+        self.output = queue.Queue()
+        self.exit_code = None
+
+    def finish(self, code: int):
+        if self.exit_code is None:
+            self.exit_code = code
+            self.output.put(None)
+
+
+class FakeImages:
+    def __init__(self, present=()):
+        self.present = set(present)
+        self.pulled = []
+
+    def get(self, image):
+        if image not in self.present:
+            raise ImageNotFound(image)
+
+    def pull(self, image):
+        self.pulled.append(image)
+        self.present.add(image)
+
+
+class FakeContainers:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, image, command=None, labels=None, working_dir=None, detach=False, **limits):
+        container = FakeContainer(self.client, image, command, labels, **limits)
+        self.client.by_id[container.id] = container
+        return container
+
+    def list(self, all=False, filters=None):
+        label = (filters or {}).get("label")
+        return [c for c in self.client.by_id.values() if label is None or label in c.labels]
+
+
+class FakeAPI:
+    def __init__(self, client):
+        self.client = client
+        self.execs = {}
+        self.signals = []
+
+    def exec_create(self, container_id, cmd, workdir=None, stdout=True, stderr=True, environment=None):
+        execution = FakeExec(self.client.by_id[container_id], cmd, environment)
+        self.execs[execution.id] = execution
+        return {"Id": execution.id}
+
+    def exec_start(self, exec_id, stream=False):
+        execution = self.execs[exec_id]
+        if execution.cmd[0] == "sh":
+            # `kill -<sig> -1`: every bot exec in the container exits by that signal
+            sig = int(execution.cmd[2].split()[1][1:])
+            self.signals.append((execution.container.id, sig))
+            for other in self.running(execution.container.id):
+                other.finish(128 + sig)
+            return b""
+        execution.output.put(f"started {execution.cmd[-1]}\n".encode())
+        return iter(execution.output.get, None)
+
+    def running(self, container_id):
+        return [e for e in self.execs.values()
+                if e.container.id == container_id and e.cmd[0] != "sh" and e.exit_code is None]
+
+    def exec_inspect(self, exec_id):
+        execution = self.execs[exec_id]
+        return {"Pid": execution.pid, "ExitCode": execution.exit_code}
+
+    def remove_container(self, container_id, force=False):
+        container = self.client.by_id.pop(container_id, None)
+        if container is None:
+            raise NotFound(f"No such container: {container_id}")
+        for execution in self.running(container_id):
+            execution.finish(137)
+        self.client.removed.append(container_id)
+
+    def stats(self, container_id, stream=True, one_shot=None):
+        if container_id not in self.client.by_id:
+            raise NotFound(f"No such container: {container_id}")
+        return {"cpu_stats": {"cpu_usage": {"total_usage": 10**8}, "system_cpu_usage": 10**9, "online_cpus": 1},
+                "memory_stats": {"usage": 32 * 2**20, "stats": {}},
+                "networks": {"eth0": {"tx_bytes": 0}}}
+
+
+class FakeDockerClient:
+    def __init__(self, images=()):
+        self.by_id = {}
+        self.removed = []
+        self.images = FakeImages(images)
+        self.containers = FakeContainers(self)
+        self.api = FakeAPI(self)
@@ -0,0 +1,155 @@
+import asyncio
+import importlib
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def bot(tmp_path_factory):
+    # bot.py opens its database and bot directory in the working directory on import
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("bot"))
+    try:
+        module = importlib.import_module("bot")
+    finally:
+        os.chdir(cwd)
+    yield module
+    module.db.close()
+
+
+def at(day, hour, minute):
+    return datetime(2026, 3, day, hour, minute, tzinfo=timezone.utc)
+
+
+def row(bot_id, user_id, status="running", wake_at=None):
+    return (bot_id, user_id, f"bot{bot_id}", "python", f"/bots/{bot_id}/main.py", None, status,
+            None, None, 0, 0, 0, None, wake_at)
+
+
+class FakeDb:
+    def __init__(self, bots, premium_users=()):
+        self.bots = bots
+        self.premium_users = set(premium_users)
+
+    async def get_bots_by_status(self, *statuses):
+        return [bot for bot in self.bots if bot[6] in statuses]
+
+    async def get_user(self, user_id):
+        return (user_id, None, None, None, None, None, int(user_id in self.premium_users))
+
+
+class FakeMetrics:
+    def __init__(self, idle):
+        self.idle = idle
+
+    def idle_for(self, bot_id):
+        return self.idle.get(bot_id)
+
+
+@pytest.fixture
+def manager(bot, monkeypatch):
+    calls = []
+
+    async def stop_bot(bot_id, status="stopped"):
+        calls.append(("stop", bot_id, status))
+        return {"success": True, "message": "stopped"}
+
+    async def start_bot(bot_id, node_id=None):
+        calls.append(("start", bot_id))
+        return {"success": True, "message": "started"}
+
+    monkeypatch.setattr(bot.bot_manager, "stop_bot", stop_bot)
+    monkeypatch.setattr(bot.bot_manager, "start_bot", start_bot)
+    bot.bot_manager.calls = calls
+    yield bot.bot_manager
+    del bot.bot_manager.calls
+
+
+# ----------------- STATUS -----------------
+def test_every_state_has_its_own_label(bot):
+    states = ["running", "restarting", "crashed", "hibernated", "stopped"]
+    labels = [bot.status_label(state) for state in states]
+    assert len(set(labels)) == len(states)
+    assert bot.status_label("crashed") != bot.status_label("stopped")
+    assert bot.status_label("restarting") != bot.status_label("stopped")
+
+
+def test_unknown_state_shows_as_stopped(bot):
+    assert bot.status_label("installing") == bot.status_label("stopped")
+
+
+# ----------------- WAKE TIMES -----------------
+def test_parse_wake_times_normalises(bot):
+    assert bot.parse_wake_times("20:30, 8:00,08:00") == "08:00,20:30"
+
+
+@pytest.mark.parametrize("text", ["24:00", "12:60", "8", "08:00,", "noon", "8:5"])
+def test_parse_wake_times_rejects_malformed(bot, text):
+    assert bot.parse_wake_times(text) is None
+
+
+def test_wake_due_within_window(bot):
+    assert bot.wake_due("08:00", at(1, 7, 59), at(1, 8, 0))
+    assert not bot.wake_due("08:00", at(1, 8, 0), at(1, 8, 1))
+    assert not bot.wake_due("08:00", at(1, 7, 0), at(1, 7, 59))
+
+
+def test_wake_due_across_midnight(bot):
+    assert bot.wake_due("23:59", at(1, 23, 58), at(2, 0, 1))
+    assert bot.wake_due("00:00", at(1, 23, 59), at(2, 0, 1))
+    assert bot.wake_due("00:01", at(1, 23, 59), at(2, 0, 1))
+    assert not bot.wake_due("00:02", at(1, 23, 59), at(2, 0, 1))
+    assert not bot.wake_due("23:58", at(1, 23, 59), at(2, 0, 1))
+
+
+def test_wake_due_any_of_several_times(bot):
+    assert bot.wake_due("08:00,20:30", at(1, 20, 0), at(1, 20, 30))
+    assert not bot.wake_due("08:00,20:30", at(1, 9, 0), at(1, 20, 0))
+
+
+def test_wake_scheduled_starts_only_due_hibernated_bots(bot, manager, monkeypatch):
+    monkeypatch.setattr(bot, "db", FakeDb([
+        row(1, 10, "hibernated", "00:00"),
+        row(2, 10, "hibernated", "12:00"),
+        row(3, 10, "hibernated"),
+        row(4, 10, "stopped", "00:00"),
+    ]))
+    asyncio.run(manager.wake_scheduled(at(1, 23, 59), at(2, 0, 1)))
+    assert manager.calls == [("start", 1)]
+
+
+# ----------------- HIBERNATION -----------------
+def test_hibernates_only_bots_idle_past_the_threshold(bot, manager, monkeypatch):
+    monkeypatch.setattr(bot, "HIBERNATE_AFTER", 3600)
+    monkeypatch.setattr(bot, "db", FakeDb([row(1, 10), row(2, 10), row(3, 10), row(4, 10, "stopped")]))
+    monkeypatch.setattr(bot, "metrics", FakeMetrics({1: 7200, 2: 60, 4: 7200}))
+    asyncio.run(manager.hibernate_idle())
+    assert manager.calls == [("stop", 1, "hibernated")]
+
+
+def test_premium_bots_are_exempt(bot, manager, monkeypatch):
+    monkeypatch.setattr(bot, "HIBERNATE_AFTER", 3600)
+    monkeypatch.setattr(bot, "HIBERNATE_PREMIUM", False)
+    monkeypatch.setattr(bot, "db", FakeDb([row(1, 10), row(2, 20)], premium_users=[20]))
+    monkeypatch.setattr(bot, "metrics", FakeMetrics({1: 7200, 2: 7200}))
+    asyncio.run(manager.hibernate_idle())
+    assert manager.calls == [("stop", 1, "hibernated")]
+
+
+def test_premium_bots_hibernate_when_configured(bot, manager, monkeypatch):
+    monkeypatch.setattr(bot, "HIBERNATE_AFTER", 3600)
+    monkeypatch.setattr(bot, "HIBERNATE_PREMIUM", True)
+    monkeypatch.setattr(bot, "db", FakeDb([row(1, 10), row(2, 20)], premium_users=[20]))
+    monkeypatch.setattr(bot, "metrics", FakeMetrics({1: 7200, 2: 7200}))
+    asyncio.run(manager.hibernate_idle())
+    assert manager.calls == [("stop", 1, "hibernated"), ("stop", 2, "hibernated")]
+
+
+def test_hibernation_disabled(bot, manager, monkeypatch):
+    monkeypatch.setattr(bot, "HIBERNATE_AFTER", 0)
+    monkeypatch.setattr(bot, "db", FakeDb([row(1, 10)]))
+    monkeypatch.setattr(bot, "metrics", FakeMetrics({1: 7200}))
+    asyncio.run(manager.hibernate_idle())
+    assert manager.calls == []
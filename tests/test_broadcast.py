@@ -0,0 +1,197 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+import broadcast
+from broadcast import BroadcastEngine, BroadcastJob, ChatLimiter, TokenBucket
+
+
+class FakeDb:
+    """The broadcast half of AsyncDatabase over a fixed list of active users."""
+
+    def __init__(self, user_ids):
+        self.user_ids = sorted(user_ids)
+        self.broadcasts = {}
+
+    async def count_active_users(self):
+        return len(self.user_ids)
+
+    async def get_user_ids_after(self, user_id, limit):
+        return [u for u in self.user_ids if u > user_id][:limit]
+
+    async def create_broadcast(self, chat_id, message_id, text, total):
+        broadcast_id = len(self.broadcasts) + 1
+        self.broadcasts[broadcast_id] = [broadcast_id, chat_id, message_id, text, "running", 0, total, 0, 0, 0]
+        return broadcast_id
+
+    async def save_broadcast(self, broadcast_id, status, cursor, sent, failed, blocked):
+        self.broadcasts[broadcast_id][4:] = [status, cursor, self.broadcasts[broadcast_id][6], sent, failed, blocked]
+
+    async def get_broadcasts_by_status(self, status):
+        return [tuple(row) for row in self.broadcasts.values() if row[4] == status]
+
+
+class FakeBot:
+    def __init__(self, errors=None, hang=()):
+        # errors: chat_id -> exceptions raised by successive sends to it
+        self.errors = {chat: list(excs) for chat, excs in (errors or {}).items()}
+        self.hang = set(hang)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if chat_id in self.hang:
+            await asyncio.Event().wait()
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+        self.sent.append(chat_id)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch):
+    monkeypatch.setattr(broadcast, "GLOBAL_RATE", 10000.0)
+    monkeypatch.setattr(broadcast, "GLOBAL_BURST", 10000)
+    monkeypatch.setattr(broadcast, "PER_CHAT_INTERVAL", 0.0)
+
+
+async def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+async def finish(job):
+    await asyncio.gather(job.task, return_exceptions=True)
+
+
+# ----------------- RATE LIMITS -----------------
+def test_token_bucket_allows_a_burst_then_paces():
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+        await bucket.acquire()
+        await bucket.acquire()
+        burst = time.monotonic() - start
+        await bucket.acquire()
+        return burst, time.monotonic() - start
+
+    burst, paced = asyncio.run(scenario())
+    assert burst < 0.02
+    assert paced >= 0.04
+
+
+def test_token_bucket_pause_holds_every_caller():
+    async def scenario():
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.1)
+        start = time.monotonic()
+        await asyncio.gather(bucket.acquire(), bucket.acquire())
+        return time.monotonic() - start, bucket.tokens
+
+    waited, tokens = asyncio.run(scenario())
+    assert waited >= 0.09
+    assert tokens < 10
+
+
+def test_chat_limiter_spaces_one_chat_only():
+    async def scenario():
+        chats = ChatLimiter(0.1)
+        start = time.monotonic()
+        await chats.acquire(1)
+        await chats.acquire(2)
+        others = time.monotonic() - start
+        await chats.acquire(1)
+        return others, time.monotonic() - start
+
+    others, same = asyncio.run(scenario())
+    assert others < 0.02
+    assert same >= 0.09
+
+
+# ----------------- SENDING -----------------
+def test_outcomes_are_counted_and_saved():
+    async def scenario():
+        db = FakeDb([1, 2, 3, 4])
+        engine = BroadcastEngine(db, concurrency=2)
+        engine.bot = FakeBot(errors={2: [Forbidden("blocked")], 3: [BadRequest("chat not found")]})
+        job = await engine.create(100, 1, "hi")
+        await finish(job)
+        return db.broadcasts[job.broadcast_id], engine
+
+    row, engine = asyncio.run(scenario())
+    assert row[4:] == ["done", 4, 4, 2, 1, 1]
+    assert engine.jobs == {}
+
+
+def test_retry_after_pauses_the_bucket_and_retries(monkeypatch):
+    pauses = []
+
+    async def scenario():
+        db = FakeDb([1, 2])
+        engine = BroadcastEngine(db, concurrency=1)
+        monkeypatch.setattr(engine.bucket, "pause", pauses.append)
+        engine.bot = FakeBot(errors={1: [RetryAfter(3), RetryAfter(3)]})
+        job = await engine.create(100, 1, "hi")
+        await finish(job)
+        return db.broadcasts[job.broadcast_id], engine.bot.sent
+
+    row, sent = asyncio.run(scenario())
+    assert pauses == [3, 3]
+    assert sent == [1, 2]
+    assert row[7:] == [2, 0, 0]
+
+
+def test_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(broadcast, "MAX_ATTEMPTS", 2)
+
+    async def scenario():
+        db = FakeDb([1])
+        engine = BroadcastEngine(db, concurrency=1)
+        monkeypatch.setattr(engine.bucket, "pause", lambda seconds: None)
+        engine.bot = FakeBot(errors={1: [RetryAfter(1)] * 3})
+        job = await engine.create(100, 1, "hi")
+        await finish(job)
+        return db.broadcasts[job.broadcast_id]
+
+    assert asyncio.run(scenario())[7:] == [0, 1, 0]
+
+
+# ----------------- CHECKPOINTS -----------------
+def test_checkpoint_counts_only_up_to_the_cursor():
+    job = BroadcastJob((1, 100, 1, "hi", "running", 0, 5, 0, 0, 0))
+    job.in_flight = {1, 2, 3}
+    job.dispatched = 3
+    job.record(2, "sent")
+    job.record(3, "blocked")
+    assert job.checkpoint() == (0, {"sent": 0, "failed": 0, "blocked": 0})
+    job.record(1, "failed")
+    assert job.checkpoint() == (3, {"sent": 1, "failed": 1, "blocked": 1})
+    assert job.unsaved == {}
+
+
+def test_resume_after_crash_counts_each_recipient_once():
+    async def scenario():
+        db = FakeDb([1, 2, 3, 4, 5])
+        engine = BroadcastEngine(db, concurrency=3)
+        engine.bot = FakeBot(hang={3})
+        job = await engine.create(100, 1, "hi")
+        await wait_for(lambda: job.done == 4)
+        # stop() leaves the job running in the database, like a crash right after a checkpoint
+        await engine.stop()
+        saved = list(db.broadcasts[job.broadcast_id])
+
+        resumed = BroadcastEngine(db, concurrency=3)
+        bot = FakeBot()
+        await resumed.start(bot)
+        await finish(resumed.jobs[job.broadcast_id])
+        return saved, db.broadcasts[job.broadcast_id], bot.sent
+
+    saved, final, resent = asyncio.run(scenario())
+    assert saved[4:] == ["running", 2, 5, 2, 0, 0]
+    assert sorted(resent) == [3, 4, 5]
+    assert final[4:] == ["done", 5, 5, 5, 0, 0]
@@ -0,0 +1,103 @@
+import asyncio
+from collections import Counter
+
+from cluster import TOKEN_HEADER, ClusterManager, HashRing
+
+
+# ----------------- HASH RING -----------------
+def test_empty_ring_has_no_owner():
+    assert HashRing().owner(1) is None
+
+
+def test_owner_is_stable_and_spread():
+    ring = HashRing()
+    for node_id in ("a", "b", "c", "d"):
+        ring.add(node_id)
+    owners = {key: ring.owner(key) for key in range(4000)}
+    assert owners == {key: ring.owner(key) for key in range(4000)}
+    counts = Counter(owners.values())
+    assert set(counts) == {"a", "b", "c", "d"}
+    # Virtual nodes keep every share within a factor of the fair 1000
+    assert all(600 < count < 1400 for count in counts.values())
+
+
+def test_join_moves_only_keys_to_the_new_node():
+    ring = HashRing()
+    for node_id in ("a", "b", "c"):
+        ring.add(node_id)
+    before = {key: ring.owner(key) for key in range(3000)}
+    ring.add("d")
+    moved = {key for key in before if ring.owner(key) != before[key]}
+    assert moved
+    assert all(ring.owner(key) == "d" for key in moved)
+    assert len(moved) < 3000 / 4 * 1.5
+
+
+def test_leave_moves_only_the_leavers_keys():
+    ring = HashRing()
+    for node_id in ("a", "b", "c", "d"):
+        ring.add(node_id)
+    before = {key: ring.owner(key) for key in range(3000)}
+    ring.remove("b")
+    for key, owner in before.items():
+        if owner == "b":
+            assert ring.owner(key) in ("a", "c", "d")
+        else:
+            assert ring.owner(key) == owner
+
+
+def test_placement_does_not_depend_on_join_order():
+    first, second = HashRing(), HashRing()
+    for node_id in ("a", "b", "c"):
+        first.add(node_id)
+    for node_id in ("c", "a", "b"):
+        second.add(node_id)
+    assert all(first.owner(key) == second.owner(key) for key in range(1000))
+
+
+# ----------------- HEARTBEATS -----------------
+class FakeDatabase:
+    def __init__(self, bots):
+        self.bots = bots
+
+    async def get_bot(self, bot_id):
+        return self.bots.get(bot_id)
+
+    async def save_node(self, node_id, url, state):
+        pass
+
+
+class FakeRequest:
+    def __init__(self, data, secret):
+        self.data = data
+        self.headers = {TOKEN_HEADER: secret}
+
+    async def json(self):
+        return self.data
+
+
+def bot_row(bot_id, status, node_id):
+    return (bot_id, 1, "bot", "python", "/bots/main.py", None, status, None, None, 0, 0, 0, node_id, None)
+
+
+def heartbeat(bots):
+    return {"node_id": "n1", "url": "http://n1:9000", "boot": "b1",
+            "bots": {str(bot_id): {"status": status} for bot_id, status in bots.items()}}
+
+
+def test_stale_heartbeat_does_not_revive_stopped_bots():
+    statuses = []
+
+    async def on_status(bot_id, status):
+        statuses.append((bot_id, status))
+
+    database = FakeDatabase({1: bot_row(1, "stopped", "n1"), 2: bot_row(2, "hibernated", "n1"),
+                             3: bot_row(3, "running", "n1")})
+    cluster = ClusterManager(database, on_status=on_status, secret="s")
+
+    async def scenario():
+        # Sent before the stop RPCs for bots 1 and 2, received after they completed
+        await cluster._heartbeat(FakeRequest(heartbeat({1: "running", 2: "running", 3: "restarting"}), "s"))
+
+    asyncio.run(scenario())
+    assert statuses == [(3, "restarting")]
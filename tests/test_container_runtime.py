@@ -0,0 +1,136 @@
+import io
+import signal
+import asyncio
+import tarfile
+
+import pytest
+
+from fake_docker import FakeDockerClient
+from container_runtime import BASE_IMAGES, PLAN_LIMITS, POOL_LABEL, DockerRuntime
+from supervisor import BotProcess
+
+
+class ListLogStore:
+    def __init__(self):
+        self.lines = []
+
+    def append(self, line):
+        self.lines.append(line)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_bot(tmp_path, name="main.py"):
+    bot_dir = tmp_path / "bot"
+    (bot_dir / ".deps" / "python" / "demo").mkdir(parents=True)
+    (bot_dir / ".deps" / "python" / "demo" / "__init__.py").write_text("X = 1\n")
+    (bot_dir / name).write_text("print('hi')\n")
+    (bot_dir / "bot.log").write_text("host only\n")
+    (bot_dir / "logs").mkdir()
+    return bot_dir / name
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_startup_pulls_images_clears_leftovers_and_fills_pool():
+    client = FakeDockerClient(images=[BASE_IMAGES["python"]])
+    leftover = client.containers.create("old", labels={POOL_LABEL: "python"})
+    runtime = DockerRuntime(client, pool_size=2)
+
+    async def scenario():
+        await runtime.startup()
+        await asyncio.gather(*runtime._refills.values())
+        await runtime.shutdown()
+        return {bot_type: len(pool) for bot_type, pool in runtime.pool.items()}
+
+    pools = asyncio.run(scenario())
+    assert client.images.pulled == [BASE_IMAGES["javascript"]]
+    assert leftover.id in client.removed
+    assert pools == {"python": 0, "javascript": 0}
+    # Shutdown removed the four warm containers it had paused
+    assert len(client.removed) == 5
+
+
+def test_spawn_claims_warm_container_and_pumps_output(tmp_path):
+    client = FakeDockerClient(images=BASE_IMAGES.values())
+    runtime = DockerRuntime(client, pool_size=1)
+    main = make_bot(tmp_path)
+
+    async def scenario():
+        await runtime.startup()
+        await asyncio.gather(*runtime._refills.values())
+        warm = runtime.pool["python"][0]
+        proc = BotProcess(1, "python", main, ListLogStore(), premium=True)
+        await runtime.spawn(proc)
+        await wait_for(lambda: proc.log_store.lines)
+        assert proc.container_id == warm.id
+        assert warm.state == "running"
+        assert warm.limits["mem_limit"] == PLAN_LIMITS["premium"]["mem_limit"]
+        assert proc.process.pid > 0
+
+        await runtime.signal(proc, signal.SIGTERM)
+        assert await asyncio.wait_for(proc.process.wait(), 2) == 128 + signal.SIGTERM
+        await proc.pump
+        await runtime.release(proc)
+        await runtime.shutdown()
+        return warm, proc
+
+    warm, proc = asyncio.run(scenario())
+    assert proc.log_store.lines == [b"started main.py\n"]
+    assert set(warm.files) == {"/app/main.py", "/app/.deps/python/demo/__init__.py"}
+    assert client.api.signals == [(warm.id, signal.SIGTERM)]
+    assert warm.id in client.removed
+    assert proc.container_id is None
+
+
+def test_empty_pool_creates_cold_with_free_limits(tmp_path):
+    client = FakeDockerClient(images=BASE_IMAGES.values())
+    runtime = DockerRuntime(client, pool_size=0)
+    main = make_bot(tmp_path, "index.js")
+
+    async def scenario():
+        proc = BotProcess(2, "javascript", main, ListLogStore())
+        await runtime.spawn(proc)
+        container = client.by_id[proc.container_id]
+        await runtime.release(proc)
+        await proc.process.wait()
+        return container
+
+    container = asyncio.run(scenario())
+    assert container.image == BASE_IMAGES["javascript"]
+    assert container.limits["cpu_quota"] == PLAN_LIMITS["free"]["cpu_quota"]
+
+
+def test_stats_of_live_and_removed_containers():
+    client = FakeDockerClient()
+    runtime = DockerRuntime(client)
+    container = client.containers.create("img")
+    assert runtime.stats(container.id)["memory_stats"]["usage"] == 32 * 2**20
+    client.api.remove_container(container.id)
+    assert runtime.stats(container.id) == {}
+
+
+def test_tar_stream_is_chunked_and_skips_logs(tmp_path, monkeypatch):
+    main = make_bot(tmp_path)
+    (main.parent / "big.bin").write_bytes(b"x" * 1024 * 1024)
+    monkeypatch.setattr("container_runtime.COPY_CHUNK", 64 * 1024)
+    chunks = list(DockerRuntime._tar_stream(main.parent))
+    assert max(len(c) for c in chunks) <= 64 * 1024
+    with tarfile.open(fileobj=io.BytesIO(b"".join(chunks))) as tar:
+        names = set(tar.getnames())
+    assert "main.py" in names and "big.bin" in names
+    assert not {"bot.log", "logs"} & names
+
+
+def test_tar_stream_reports_producer_failure(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(DockerRuntime._tar_stream(tmp_path / "missing"))
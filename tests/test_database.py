@@ -0,0 +1,80 @@
+import sqlite3
+from contextlib import contextmanager
+
+import database
+from database import ConnectionPool, WriteBehindQueue
+
+
+class FlakyPool:
+    """A real pool whose transactions fail, as if the database were locked, while broken
+    or for the next `failures` attempts."""
+
+    def __init__(self, path, failures=0):
+        self.pool = ConnectionPool(path, 2)
+        self.failures = failures
+        self.broken = False
+
+    @contextmanager
+    def connection(self):
+        if self.broken or self.failures:
+            self.failures = max(0, self.failures - 1)
+            raise sqlite3.OperationalError("database is locked")
+        with self.pool.connection() as conn:
+            yield conn
+
+
+def make_db(tmp_path):
+    path = str(tmp_path / "test.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE bots (bot_id INTEGER PRIMARY KEY, container_id TEXT, status TEXT, last_active TEXT)")
+    conn.execute("CREATE TABLE logs (bot_id INTEGER, log_type TEXT, log_message TEXT, timestamp TEXT)")
+    conn.execute("INSERT INTO bots (bot_id, status) VALUES (1, 'stopped')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def read(path, query):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+
+def test_coalesced_status_keeps_container_id(tmp_path):
+    path = make_db(tmp_path)
+    writer = WriteBehindQueue(FlakyPool(path), flush_interval=0.2)
+    writer.update_status(1, "running", "abc123")
+    writer.update_status(1, "restarting")
+    writer.close()
+    assert read(path, "SELECT status, container_id FROM bots") == [("restarting", "abc123")]
+
+
+def test_failed_batch_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "WRITE_RETRY_INTERVAL", 0.01)
+    path = make_db(tmp_path)
+    pool = FlakyPool(path)
+    writer = WriteBehindQueue(pool, flush_interval=0.01)
+    pool.broken = True
+    writer.add_log(1, "info", "hello")
+    writer.update_status(1, "running", "abc123")
+    writer.flush(1)
+    assert writer.pending_status(1) == "running"
+    pool.broken = False
+    writer.flush(1)
+    writer.close()
+    assert read(path, "SELECT log_message FROM logs") == [("hello",)]
+    assert read(path, "SELECT status, container_id FROM bots") == [("running", "abc123")]
+    assert writer.pending_status(1) is None
+
+
+def test_shutdown_retries_synchronously(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "WRITE_RETRY_INTERVAL", 0.01)
+    path = make_db(tmp_path)
+    pool = FlakyPool(path)
+    writer = WriteBehindQueue(pool, flush_interval=0.01)
+    pool.failures = 3
+    writer.add_log(1, "info", "last words")
+    writer.close()
+    assert read(path, "SELECT log_message FROM logs") == [("last words",)]
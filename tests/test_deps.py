@@ -0,0 +1,296 @@
+import asyncio
+
+import pytest
+
+import deps
+from deps import DependencyCache, InstallError, InstallQueue
+
+
+@pytest.mark.parametrize("spec", ["requests", "requests==2.31.0", "uvicorn[standard]>=0.20,<1", "pyTelegramBotAPI~=4.0"])
+def test_python_specs_accepted(spec):
+    DependencyCache.validate_spec(spec, "python")
+
+
+@pytest.mark.parametrize("spec", ["express", "express@4.18.2", "@slack/bolt", "@slack/bolt@^3"])
+def test_npm_specs_accepted(spec):
+    DependencyCache.validate_spec(spec, "javascript")
+
+
+@pytest.mark.parametrize("spec", [
+    "-r requirements.txt",
+    "--index-url=http://evil",
+    "../outside",
+    "pkg/../../etc",
+    "./local_dir",
+    "/abs/path",
+    "https://example.com/pkg.whl",
+    "pkg; rm -rf /",
+    "pkg @ file:///tmp/x",
+    "",
+])
+def test_invalid_specs_rejected(spec):
+    for bot_type in ("python", "javascript"):
+        with pytest.raises(InstallError):
+            DependencyCache.validate_spec(spec, bot_type)
+
+
+@pytest.mark.parametrize("spec", ["local/dir", "pkg@git+ssh", "sub/dir==1.0"])
+def test_python_paths_and_direct_references_rejected(spec):
+    with pytest.raises(InstallError):
+        DependencyCache.validate_spec(spec, "python")
+
+
+def test_build_env_drops_platform_secrets(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "123:secret")
+    monkeypatch.setenv("DOCKER_HOST", "unix:///var/run/docker.sock")
+    monkeypatch.setenv("PIP_INDEX_URL", "https://mirror.example/simple")
+    env = deps.build_env()
+    assert "BOT_TOKEN" not in env
+    assert "DOCKER_HOST" not in env
+    assert env["PIP_INDEX_URL"] == "https://mirror.example/simple"
+    assert "PATH" in env
+
+
+def _wheel_entry(root, version, modules):
+    entry = root / f"demo-{version}"
+    dist_info = entry / f"demo-{version}.dist-info"
+    dist_info.mkdir(parents=True)
+    record = []
+    for module in modules:
+        path = entry / "demo" / module
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"VERSION = {version!r}\n")
+        record.append(f"demo/{module},,")
+    record.append(f"demo-{version}.dist-info/RECORD,,")
+    (dist_info / "RECORD").write_text("\n".join(record) + "\n")
+    return entry
+
+
+def test_python_upgrade_removes_previous_version(tmp_path):
+    bot_dir = tmp_path / "bot"
+    old = _wheel_entry(tmp_path / "store", "1.0", ["__init__.py", "legacy.py"])
+    new = _wheel_entry(tmp_path / "store", "2.0", ["__init__.py"])
+    DependencyCache.link(bot_dir, "python", [old])
+    DependencyCache.link(bot_dir, "python", [new])
+
+    site = bot_dir / deps.PYTHON_DEPS_DIR
+    assert sorted(p.name for p in site.glob("*.dist-info")) == ["demo-2.0.dist-info"]
+    assert not (site / "demo" / "legacy.py").exists()
+    assert "2.0" in (site / "demo" / "__init__.py").read_text()
+
+
+def test_node_upgrade_replaces_package_directory(tmp_path):
+    bot_dir = tmp_path / "bot"
+    old = tmp_path / "store" / "old" / "node_modules"
+    new = tmp_path / "store" / "new" / "node_modules"
+    for entry, files in ((old, ["index.js", "lib/legacy.js"]), (new, ["index.js"])):
+        for name in files:
+            path = entry / "left-pad" / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(str(entry))
+        (entry / "@scope" / "util").mkdir(parents=True)
+        (entry / "@scope" / "util" / "index.js").write_text(str(entry))
+    (old / "@scope" / "util" / "stale.js").write_text("")
+    (bot_dir / "node_modules" / "other").mkdir(parents=True)
+
+    DependencyCache.link(bot_dir, "javascript", [old])
+    DependencyCache.link(bot_dir, "javascript", [new])
+
+    modules = bot_dir / "node_modules"
+    assert not (modules / "left-pad" / "lib").exists()
+    assert (modules / "left-pad" / "index.js").read_text() == str(new)
+    assert not (modules / "@scope" / "util" / "stale.js").exists()
+    assert (modules / "other").is_dir()
+    assert not [p for p in modules.iterdir() if p.name.startswith(".")]
+
+
+@pytest.mark.parametrize("spec, offline_first", [
+    ("requests==2.31.0", True),
+    ("uvicorn[standard]==0.24.0", True),
+    ("requests", False),
+    ("requests>=2", False),
+    ("requests==2.*", False),
+    ("requests>=2,==2.31.0", False),
+])
+def test_only_exact_pins_resolve_offline_first(tmp_path, monkeypatch, spec, offline_first):
+    calls = []
+
+    async def fake_run(*cmd, **kwargs):
+        calls.append(cmd)
+        return 0, ""
+
+    monkeypatch.setattr(deps, "_run", fake_run)
+    cache = DependencyCache(tmp_path / "cache")
+    asyncio.run(cache._resolve_wheels(spec, tmp_path))
+    assert ("--no-index" in calls[0]) == offline_first
+    assert len(calls) == 1
+
+
+def test_linked_store_files_are_read_only(tmp_path):
+    entry = _wheel_entry(tmp_path / "store", "1.0", ["__init__.py"])
+    DependencyCache.link(tmp_path / "bot", "python", [entry])
+    linked = tmp_path / "bot" / deps.PYTHON_DEPS_DIR / "demo" / "__init__.py"
+    assert not linked.stat().st_mode & 0o222
+    assert linked.stat().st_ino == (entry / "demo" / "__init__.py").stat().st_ino
+
+
+# ----------------- INSTALL QUEUE -----------------
+class GatedCache:
+    """Stands in for DependencyCache: each prepare waits until its spec is released."""
+
+    validate_spec = staticmethod(DependencyCache.validate_spec)
+
+    def __init__(self):
+        self.prepared = []
+        self.linked = []
+        self.gates = {}
+        self.cancelled = []
+
+    def release(self, spec):
+        self.gates.setdefault(spec.lower(), asyncio.Event()).set()
+
+    async def prepare(self, bot_type, spec, progress=None):
+        self.prepared.append(spec)
+        try:
+            await self.gates.setdefault(spec.lower(), asyncio.Event()).wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(spec)
+            raise
+        return spec.lower(), "1.0", []
+
+    def link(self, bot_dir, bot_type, entries):
+        self.linked.append(bot_dir)
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def run_queue(scenario, workers=1):
+    async def main():
+        cache = GatedCache()
+        queue = InstallQueue(cache, workers=workers)
+        queue.start()
+        try:
+            return await scenario(queue, cache)
+        finally:
+            await queue.stop()
+
+    return asyncio.run(main())
+
+
+def submit(queue, bot_id, spec, premium=False):
+    return asyncio.create_task(queue.submit(bot_id, f"bot_{bot_id}", "python", spec, premium=premium))
+
+
+def test_premium_jobs_run_first():
+    async def scenario(queue, cache):
+        submits = [submit(queue, 1, "blocker")]
+        await settle()
+        submits += [submit(queue, 2, "free"), submit(queue, 3, "premium", premium=True)]
+        await settle()
+        for spec in ("blocker", "free", "premium"):
+            cache.release(spec)
+        await asyncio.gather(*submits)
+        return cache.prepared
+
+    assert run_queue(scenario) == ["blocker", "premium", "free"]
+
+
+def test_premium_request_bumps_a_queued_free_job():
+    async def scenario(queue, cache):
+        submits = [submit(queue, 1, "blocker")]
+        await settle()
+        submits += [submit(queue, 2, "first"), submit(queue, 3, "second"), submit(queue, 4, "second", premium=True)]
+        await settle()
+        for spec in ("blocker", "first", "second"):
+            cache.release(spec)
+        await asyncio.gather(*submits)
+        return cache.prepared
+
+    assert run_queue(scenario) == ["blocker", "second", "first"]
+
+
+def test_identical_requests_share_one_install():
+    async def scenario(queue, cache):
+        submits = [submit(queue, 1, "Requests==2.31.0"), submit(queue, 2, "requests==2.31.0")]
+        await settle()
+        cache.release("requests==2.31.0")
+        results = await asyncio.gather(*submits)
+        return results, cache
+
+    results, cache = run_queue(scenario)
+    assert results == [("requests==2.31.0", "1.0")] * 2
+    assert cache.prepared == ["Requests==2.31.0"]
+    assert sorted(cache.linked) == ["bot_1", "bot_2"]
+
+
+def test_finished_jobs_are_not_shared():
+    async def scenario(queue, cache):
+        cache.release("requests")
+        await submit(queue, 1, "requests")
+        await submit(queue, 2, "requests")
+        return cache.prepared, queue.jobs
+
+    prepared, jobs = run_queue(scenario)
+    assert prepared == ["requests", "requests"]
+    assert jobs == {}
+
+
+def test_cancel_one_waiter_keeps_the_job_for_the_others():
+    async def scenario(queue, cache):
+        first, second = submit(queue, 1, "requests"), submit(queue, 2, "requests")
+        await settle()
+        assert queue.cancel(1) == 1
+        cache.release("requests")
+        with pytest.raises(InstallError, match="cancelled"):
+            await first
+        return await second, cache
+
+    result, cache = run_queue(scenario)
+    assert result == ("requests", "1.0")
+    assert cache.linked == ["bot_2"]
+
+
+def test_cancel_last_waiter_drops_a_queued_job():
+    async def scenario(queue, cache):
+        blocker, queued = submit(queue, 1, "blocker"), submit(queue, 2, "requests")
+        await settle()
+        assert queue.cancel(2, "REQUESTS") == 1
+        assert queue.cancel(2) == 0
+        with pytest.raises(InstallError, match="cancelled"):
+            await queued
+        cache.release("blocker")
+        cache.release("requests")
+        await blocker
+        await settle()
+        return cache.prepared
+
+    assert run_queue(scenario) == ["blocker"]
+
+
+def test_cancel_last_waiter_stops_a_running_job():
+    async def scenario(queue, cache):
+        running = submit(queue, 1, "requests")
+        await settle()
+        queue.cancel(1)
+        with pytest.raises(InstallError, match="cancelled"):
+            await running
+        await settle()
+        return cache.cancelled, queue.jobs
+
+    assert run_queue(scenario) == (["requests"], {})
+
+
+def test_stop_fails_every_waiter():
+    async def main():
+        queue = InstallQueue(GatedCache(), workers=1)
+        queue.start()
+        waiters = [submit(queue, 1, "running"), submit(queue, 2, "queued")]
+        await settle()
+        await queue.stop()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert [str(e) for e in errors] == ["Platform shutting down"] * 2
@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from dispatch import OrderedUpdateProcessor, ordering_key
+
+_ids = iter(range(1, 10 ** 6))
+
+
+def update_from(user_id):
+    chat = Chat(user_id, Chat.PRIVATE)
+    return Update(next(_ids), message=Message(next(_ids), datetime.now(), chat, from_user=User(user_id, "u", False)))
+
+
+class Handlers:
+    """Records when each update's handler runs; a handler can be held until released."""
+
+    def __init__(self):
+        self.log = []
+        self.running = 0
+        self.peak = 0
+        self.gates = {}
+
+    def hold(self, name):
+        self.gates[name] = asyncio.Event()
+
+    async def handle(self, name, user_id):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        self.log.append(("start", name, user_id))
+        if name in self.gates:
+            await self.gates[name].wait()
+        await asyncio.sleep(0)
+        self.log.append(("end", name, user_id))
+        self.running -= 1
+
+
+def submit(processor, handlers, name, user_id):
+    return asyncio.create_task(processor.process_update(update_from(user_id), handlers.handle(name, user_id)))
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_ordering_key():
+    assert ordering_key(update_from(7)) == 7
+    channel_post = Update(1, channel_post=Message(1, datetime.now(), Chat(-100, Chat.CHANNEL)))
+    assert ordering_key(channel_post) == ("chat", -100)
+    assert ordering_key(Update(1)) is None
+    assert ordering_key("not an update") is None
+
+
+def test_one_users_updates_run_in_arrival_order():
+    async def scenario():
+        processor, handlers = OrderedUpdateProcessor(concurrency=8), Handlers()
+        handlers.hold("a")
+        tasks = [submit(processor, handlers, name, 1) for name in "abc"]
+        await settle()
+        assert handlers.log == [("start", "a", 1)]
+        handlers.gates["a"].set()
+        await asyncio.gather(*tasks)
+        return handlers, processor
+
+    handlers, processor = asyncio.run(scenario())
+    assert [(event, name) for event, name, _ in handlers.log] == [
+        ("start", "a"), ("end", "a"), ("start", "b"), ("end", "b"), ("start", "c"), ("end", "c")]
+    assert handlers.peak == 1
+    assert processor.stats()["processed"] == 3
+    assert processor._keys == {}
+
+
+def test_slow_user_does_not_hold_up_others():
+    async def scenario():
+        processor, handlers = OrderedUpdateProcessor(concurrency=8), Handlers()
+        handlers.hold("slow")
+        slow = submit(processor, handlers, "slow", 1)
+        await settle()
+        await submit(processor, handlers, "fast", 2)
+        finished = ("end", "fast", 2) in handlers.log and ("end", "slow", 1) not in handlers.log
+        handlers.gates["slow"].set()
+        await slow
+        return finished
+
+    assert asyncio.run(scenario())
+
+
+def test_global_cap_bounds_running_handlers():
+    async def scenario():
+        processor, handlers = OrderedUpdateProcessor(concurrency=2), Handlers()
+        for user_id in range(5):
+            handlers.hold(f"u{user_id}")
+        tasks = [submit(processor, handlers, f"u{user_id}", user_id) for user_id in range(5)]
+        await settle()
+        stats = processor.stats()
+        for gate in handlers.gates.values():
+            gate.set()
+        await asyncio.gather(*tasks)
+        return handlers, stats
+
+    handlers, stats = asyncio.run(scenario())
+    assert handlers.peak == 2
+    assert (stats["running"], stats["queued"], stats["users"]) == (2, 3, 5)
+
+
+def test_queued_updates_of_one_user_leave_slots_for_others():
+    async def scenario():
+        processor, handlers = OrderedUpdateProcessor(concurrency=2), Handlers()
+        handlers.hold("a1")
+        tasks = [submit(processor, handlers, f"a{i}", 1) for i in range(1, 5)]
+        await settle()
+        await submit(processor, handlers, "b", 2)
+        ran = ("end", "b", 2) in handlers.log
+        handlers.gates["a1"].set()
+        await asyncio.gather(*tasks)
+        return ran, handlers
+
+    ran, handlers = asyncio.run(scenario())
+    assert ran
+    assert [name for event, name, user in handlers.log if event == "start" and user == 1] == ["a1", "a2", "a3", "a4"]
+
+
+def test_cancelled_while_queued_closes_the_handler():
+    async def scenario():
+        processor, handlers = OrderedUpdateProcessor(concurrency=2), Handlers()
+        handlers.hold("first")
+        first = submit(processor, handlers, "first", 1)
+        queued = submit(processor, handlers, "queued", 1)
+        await settle()
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        stats = processor.stats()
+        handlers.gates["first"].set()
+        await first
+        return handlers, stats, processor
+
+    handlers, stats, processor = asyncio.run(scenario())
+    assert ("start", "queued", 1) not in handlers.log
+    assert (stats["queued"], stats["running"]) == (0, 1)
+    assert processor._keys == {}
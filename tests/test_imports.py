@@ -0,0 +1,131 @@
+import pytest
+
+from imports import distribution_for, extract_imports, javascript_imports, npm_package, python_imports, resolve_requirements
+
+
+def bot_tree(root, files, language):
+    for name, code in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(code)
+    return {root / name: extract_imports(code, language) for name, code in files.items()}
+
+
+def resolve(root, files, language="python", entry=None):
+    imports = bot_tree(root, files, language)
+    return resolve_requirements(root / (entry or next(iter(files))), root, imports, language)
+
+
+# ----------------- PYTHON -----------------
+def test_python_imports_keep_relative_dots_and_submodules():
+    code = "import os, a.b\nfrom . import util\nfrom ..pkg import mod\nfrom x import *\n"
+    assert python_imports(code) == [".", "..pkg", "..pkg.mod", ".util", "a.b", "os", "x"]
+
+
+def test_python_imports_of_broken_source():
+    assert python_imports("import (") == []
+
+
+def test_stdlib_is_dropped(tmp_path):
+    code = "import os, json, asyncio.subprocess\nfrom collections import OrderedDict\nimport requests\n"
+    assert resolve(tmp_path, {"main.py": code}) == ["requests"]
+
+
+@pytest.mark.parametrize("module, dist", [
+    ("telegram.ext", "python-telegram-bot"),
+    ("PIL.Image", "Pillow"),
+    ("google.cloud.storage.blob", "google-cloud-storage"),
+    ("google.protobuf", "protobuf"),
+    ("google.unknown", None),
+    ("aiogram.types", "aiogram"),
+])
+def test_import_names_map_to_distributions(module, dist):
+    assert distribution_for(module) == dist
+
+
+def test_requirements_are_mapped(tmp_path):
+    code = "from telegram.ext import Application\nimport yaml\nfrom bs4 import BeautifulSoup\n"
+    assert resolve(tmp_path, {"main.py": code}) == ["PyYAML", "beautifulsoup4", "python-telegram-bot"]
+
+
+def test_local_modules_are_followed_not_installed(tmp_path):
+    files = {
+        "main.py": "import handlers\nfrom utils.db import connect\n",
+        "handlers.py": "import aiohttp\n",
+        "utils/__init__.py": "",
+        "utils/db.py": "import motor\n",
+    }
+    assert resolve(tmp_path, files) == ["aiohttp", "motor"]
+
+
+def test_relative_imports_are_followed(tmp_path):
+    files = {
+        "main.py": "from pkg import run\n",
+        "pkg/__init__.py": "from .core import run\n",
+        "pkg/core.py": "from ..shared import helpers\nfrom . import missing\n",
+        "shared/helpers.py": "import redis\n",
+    }
+    assert resolve(tmp_path, files) == ["redis"]
+
+
+def test_unreachable_files_are_ignored(tmp_path):
+    files = {"main.py": "import os\n", "old.py": "import flask\n"}
+    assert resolve(tmp_path, files) == []
+
+
+def test_vendored_code_is_not_followed(tmp_path):
+    files = {"main.py": "import lib\n", "lib/__init__.py": "from .venv import x\n", "lib/venv/x.py": "import numpy\n"}
+    assert resolve(tmp_path, files) == []
+
+
+# ----------------- JAVASCRIPT -----------------
+def test_js_import_forms():
+    code = """
+        import def from "default-pkg";
+        import { a, b as c } from 'named-pkg';
+        import * as ns from "ns-pkg";
+        import "side-effect";
+        export * from "reexport-all";
+        export { x } from './local';
+        const lazy = await import("dynamic-pkg");
+        const req = require( 'required-pkg' );
+    """
+    assert javascript_imports(code) == [
+        "./local", "default-pkg", "dynamic-pkg", "named-pkg", "ns-pkg",
+        "reexport-all", "required-pkg", "side-effect",
+    ]
+
+
+def test_js_comments_and_strings_are_not_imports():
+    code = """
+        // const a = require("commented");
+        /* import b from "block-commented"; */
+        const s = "require('in-a-string')";
+        const t = `import c from "in-a-template"`;
+        const url = "http://example.com"; const real = require("real");
+    """
+    assert javascript_imports(code) == ["real"]
+
+
+@pytest.mark.parametrize("specifier, package", [
+    ("express", "express"),
+    ("lodash/fp", "lodash"),
+    ("@scope/pkg/sub", "@scope/pkg"),
+    ("fs", None),
+    ("node:fs", None),
+    ("./local", None),
+    ("/abs", None),
+    ("https://esm.sh/x", None),
+])
+def test_npm_package_names(specifier, package):
+    assert npm_package(specifier) == package
+
+
+def test_js_local_files_are_followed(tmp_path):
+    files = {
+        "index.js": "const h = require('./lib');\nconst cfg = require('./config.json');\nconst fs = require('fs');\n",
+        "lib/index.js": "import axios from 'axios';\nexport * from './util.mjs';\n",
+        "lib/util.mjs": "import { Telegraf } from 'telegraf';\n",
+        "config.json": "{}",
+    }
+    assert resolve(tmp_path, files, "javascript") == ["axios", "telegraf"]
@@ -0,0 +1,132 @@
+import stat
+import struct
+import asyncio
+import zipfile
+
+import httpx
+import pytest
+
+import ingest
+from ingest import UploadRejected, extract_archive, find_entry_point
+
+
+def make_zip(path, members, compression=zipfile.ZIP_STORED):
+    with zipfile.ZipFile(path, "w", compression) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return path
+
+
+def patch_headers(path, local_offset, central_offset, value):
+    # Rewrite a 16-bit field in both the local header and the central directory entry
+    raw = bytearray(path.read_bytes())
+    for signature, offset in ((b"PK\x03\x04", local_offset), (b"PK\x01\x02", central_offset)):
+        at = raw.index(signature) + offset
+        raw[at:at + 2] = struct.pack("<H", value)
+    path.write_bytes(bytes(raw))
+
+
+def test_extracts_and_finds_entry_point(tmp_path):
+    archive = make_zip(tmp_path / "bot.zip", {"project/main.py": "print('hi')\n", "project/util.py": ""})
+    dest = tmp_path / "out"
+    files = extract_archive(archive, dest)
+    assert {f.path.name for f in files} == {"main.py", "util.py"}
+    assert find_entry_point(dest, files) == dest / "project" / "main.py"
+
+
+def test_not_a_zip(tmp_path):
+    archive = tmp_path / "bot.zip"
+    archive.write_bytes(b"definitely not a zip")
+    with pytest.raises(UploadRejected):
+        extract_archive(archive, tmp_path / "out")
+
+
+@pytest.mark.parametrize("name", ["../escape.py", "/etc/passwd", "C:/evil.py", "a/../../b.py", "..\\evil.py"])
+def test_unsafe_paths(tmp_path, name):
+    archive = make_zip(tmp_path / "bot.zip", {name: "x"})
+    with pytest.raises(UploadRejected, match="Unsafe path"):
+        extract_archive(archive, tmp_path / "out")
+    assert not (tmp_path / "escape.py").exists()
+
+
+def test_symlink(tmp_path):
+    info = zipfile.ZipInfo("link")
+    info.external_attr = (stat.S_IFLNK | 0o777) << 16
+    archive = make_zip(tmp_path / "bot.zip", {info: "/etc/passwd"})
+    with pytest.raises(UploadRejected, match="Symlinks"):
+        extract_archive(archive, tmp_path / "out")
+
+
+def test_too_many_members(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_MEMBERS", 3)
+    archive = make_zip(tmp_path / "bot.zip", {f"{i}.py": "" for i in range(4)})
+    with pytest.raises(UploadRejected, match="entries"):
+        extract_archive(archive, tmp_path / "out")
+
+
+def test_member_too_large(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_MEMBER_BYTES", 100)
+    archive = make_zip(tmp_path / "bot.zip", {"big.py": "x" * 101})
+    with pytest.raises(UploadRejected, match="exceeds"):
+        extract_archive(archive, tmp_path / "out")
+
+
+def test_total_too_large(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_EXTRACTED_BYTES", 150)
+    archive = make_zip(tmp_path / "bot.zip", {"a.py": "x" * 100, "b.py": "y" * 100})
+    with pytest.raises(UploadRejected, match="expands"):
+        extract_archive(archive, tmp_path / "out")
+
+
+def test_compression_bomb(tmp_path):
+    archive = make_zip(tmp_path / "bot.zip", {"bomb.py": "0" * 1024 * 1024}, zipfile.ZIP_DEFLATED)
+    with pytest.raises(UploadRejected, match="compressed"):
+        extract_archive(archive, tmp_path / "out")
+
+
+def test_corrupt_member(tmp_path):
+    archive = make_zip(tmp_path / "bot.zip", {"main.py": "print('hello world')\n"})
+    raw = bytearray(archive.read_bytes())
+    at = raw.index(b"hello")
+    raw[at] ^= 0xFF
+    archive.write_bytes(bytes(raw))
+    with pytest.raises(UploadRejected, match="corrupt"):
+        extract_archive(archive, tmp_path / "out")
+
+
+def test_encrypted_member(tmp_path):
+    archive = make_zip(tmp_path / "bot.zip", {"main.py": "print('hi')\n"})
+    patch_headers(archive, 6, 8, 0x1)
+    with pytest.raises(UploadRejected, match="encrypted"):
+        extract_archive(archive, tmp_path / "out")
+
+
+def test_unsupported_compression(tmp_path):
+    archive = make_zip(tmp_path / "bot.zip", {"main.py": "print('hi')\n"})
+    patch_headers(archive, 8, 10, 99)
+    with pytest.raises(UploadRejected, match="compression"):
+        extract_archive(archive, tmp_path / "out")
+
+
+class RemoteFile:
+    file_path = "https://api.telegram.org/file/bot123:SECRET/documents/file_1.zip"
+
+
+def test_download_failure_does_not_leak_the_url(tmp_path, monkeypatch):
+    def refuse(request):
+        return httpx.Response(404, request=request)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(ingest.httpx, "AsyncClient",
+                        lambda **kwargs: real_client(transport=httpx.MockTransport(refuse), **kwargs))
+    with pytest.raises(UploadRejected) as rejected:
+        asyncio.run(ingest.download(RemoteFile(), tmp_path / "bot.zip"))
+    assert str(rejected.value) == "Download failed"
+
+
+@pytest.mark.parametrize("name", ["bot.log", "logs/index.json", "project/logs/segment-1.log",
+                                  ".deps/python/evil.py", "node_modules/left-pad/index.js"])
+def test_reserved_names(tmp_path, name):
+    archive = make_zip(tmp_path / "bot.zip", {"main.py": "", name: "x"})
+    with pytest.raises(UploadRejected, match="reserved"):
+        extract_archive(archive, tmp_path / "out")
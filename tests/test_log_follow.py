@@ -0,0 +1,50 @@
+import asyncio
+
+from telegram.error import Forbidden, NetworkError
+
+import log_follow
+from log_follow import LogFollower
+
+
+class FakeStore:
+    def __init__(self):
+        self.listeners = []
+
+    def tail(self, lines):
+        return ["hello"]
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+
+class FakeMessage:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.texts = []
+
+    async def edit_text(self, text, parse_mode=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.texts.append(text)
+
+
+def test_follow_ends_cleanly_when_telegram_refuses(monkeypatch):
+    monkeypatch.setattr(log_follow, "FOLLOW_EDIT_INTERVAL", 0.001)
+    store = FakeStore()
+    message = FakeMessage([Forbidden("bot was blocked by the user")] * 2)
+    asyncio.run(asyncio.wait_for(LogFollower(1, store, message).run(), 1))
+    assert not store.listeners
+
+
+def test_follow_retries_network_errors(monkeypatch):
+    monkeypatch.setattr(log_follow, "FOLLOW_EDIT_INTERVAL", 0.001)
+    monkeypatch.setattr(log_follow, "FOLLOW_IDLE_TIMEOUT", 0.05)
+    store = FakeStore()
+    message = FakeMessage([NetworkError("connection reset")] * 2)
+    asyncio.run(asyncio.wait_for(LogFollower(1, store, message).run(), 1))
+    assert "following" in message.texts[0]
+    assert "no new output" in message.texts[-1]
+    assert not store.listeners
@@ -0,0 +1,25 @@
+import time
+
+from log_reader import compile_filter, tail_lines
+
+
+def test_filter_is_a_literal_case_insensitive_substring():
+    regex = compile_filter("Error (a+)+$")
+    assert regex.search("2024-01-01 00:00:00 ERROR (A+)+$ in handler")
+    assert not regex.search("error aaaa")
+    assert compile_filter("") is None
+
+
+def test_backtracking_pattern_is_harmless(tmp_path):
+    log = tmp_path / "bot.log"
+    log.write_text(("a" * 5000 + "!\n") * 200)
+    started = time.monotonic()
+    assert tail_lines(log, 10, "(a+)+$") == []
+    assert time.monotonic() - started < 2
+
+
+def test_tail_lines_with_filter(tmp_path):
+    log = tmp_path / "bot.log"
+    log.write_text("".join(f"line {i} {'warn' if i % 2 else 'info'}\n" for i in range(100)))
+    assert tail_lines(log, 3) == ["line 97 warn", "line 98 info", "line 99 warn"]
+    assert tail_lines(log, 2, "WARN") == ["line 97 warn", "line 99 warn"]
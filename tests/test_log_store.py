@@ -0,0 +1,61 @@
+import json
+import time
+import logging
+import threading
+
+import log_store
+from log_store import BotLogStore
+
+
+def drain(store, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    # Each raw segment is unlinked just after its compressed copy is indexed
+    while ((store._compressing or list(store.segments_dir.glob("*.log")))
+           and time.monotonic() < deadline):
+        time.sleep(0.01)
+
+
+def test_retention_waits_for_pending_compression(tmp_path, monkeypatch, caplog):
+    monkeypatch.setitem(log_store.RETENTION, "free", (1, 3))
+    store = BotLogStore(tmp_path)
+    gate = threading.Event()
+    # Hold both compressor threads so every rotation below is still queued
+    blockers = [log_store._compressor.submit(gate.wait) for _ in range(2)]
+    for i in range(3):
+        store.append(f"line {i}".encode())
+        store.rotate()
+    with caplog.at_level(logging.ERROR, logger="log_store"):
+        gate.set()
+        for blocker in blockers:
+            blocker.result()
+        drain(store)
+
+    assert not caplog.records
+    assert len(store.index) == 1
+    assert "line 2" in store.tail(10)[-1]
+    on_disk = {p.name for p in (tmp_path / "logs").iterdir() if p.name != "index.json"}
+    assert on_disk == {store.index[0]["file"]}
+
+
+def test_planted_index_entries_are_ignored(tmp_path):
+    secret = tmp_path / "secret.txt"
+    secret.write_text("2024-01-01 00:00:00 host secret\n")
+    bot_dir = tmp_path / "bot"
+    logs = bot_dir / "logs"
+    logs.mkdir(parents=True)
+    (logs / "segment-2.log").symlink_to(secret)
+    (logs / "index.json").write_text(json.dumps([
+        {"file": str(secret), "start": 0, "end": 2e9, "bytes": 1},
+        {"file": "../../secret.txt", "start": 0, "end": 2e9, "bytes": 1},
+        {"file": "segment-2.log", "start": 0, "end": 2e9, "bytes": 1},
+        "garbage",
+    ]))
+    store = BotLogStore(bot_dir)
+    assert [e["file"] for e in store.index] == ["segment-2.log"]
+    assert store.tail(10) == []
+    assert store.read_range(0, 2e9, 10) == []
+
+    # Retention must not delete files outside logs/ either
+    store.index = [{"file": "../../secret.txt", "start": 0, "end": 0, "bytes": 1}]
+    store._apply_retention()
+    assert secret.exists()
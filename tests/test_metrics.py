@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+from metrics import ContainerSampler, MetricsCollector
+
+
+def reading(cpu_ns, system_ns, usage, inactive=0, cpus=2, tx=0):
+    return {
+        "cpu_stats": {"cpu_usage": {"total_usage": cpu_ns}, "system_cpu_usage": system_ns, "online_cpus": cpus},
+        "memory_stats": {"usage": usage, "stats": {"inactive_file": inactive}},
+        "networks": {"eth0": {"tx_bytes": tx, "rx_bytes": 0}},
+    }
+
+
+def test_container_cpu_is_delta_between_readings():
+    readings = {"c1": reading(0, 10**9, 50 * 2**20, 10 * 2**20)}
+    sampler = ContainerSampler(lambda container_id: readings.get(container_id, {}))
+    assert sampler.sample({1: "c1"}) == {1: (0.0, 40 * 2**20, None)}
+
+    # A quarter of all system CPU time on a two-core host is half a core
+    readings["c1"] = reading(250_000_000, 2 * 10**9, 50 * 2**20, tx=3000)
+    cpu, memory, sent = sampler.sample({1: "c1"})[1]
+    assert cpu == 50.0
+    assert memory == 50 * 2**20
+    assert sent == 3000
+
+
+def test_unreadable_container_is_skipped():
+    sampler = ContainerSampler(lambda container_id: {})
+    assert sampler.sample({1: "gone"}) == {}
+
+
+class FakeHandle:
+    pid = 4242
+    returncode = None
+
+
+class FakeProc:
+    def __init__(self, container_id):
+        self.container_id = container_id
+        self.process = FakeHandle()
+        self.started_at = time.monotonic()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+
+class FakeRuntime:
+    def __init__(self):
+        self.ticks = 0
+
+    def stats(self, container_id):
+        self.ticks += 1
+        return reading(self.ticks * 10**8, self.ticks * 10**9, 64 * 2**20, cpus=1)
+
+
+class FakeSupervisor:
+    def __init__(self):
+        self.runtime = FakeRuntime()
+        self.processes = {7: FakeProc("abc123")}
+
+
+def test_container_bots_are_sampled_without_their_pid():
+    collector = MetricsCollector(FakeSupervisor(), None)
+
+    async def scenario():
+        await collector.collect_once()
+        return await collector.collect_once()
+
+    sample = asyncio.run(scenario())[7]
+    assert sample.cpu_percent == 10.0
+    assert sample.memory_mb == 64.0
+    assert sample.net_sent == 0
+    assert collector.idle_for(7) is not None
+
+
+def test_idle_container_bot_becomes_idle():
+    supervisor = FakeSupervisor()
+    supervisor.runtime.stats = lambda container_id: reading(10**6, time.time_ns(), 2**20, cpus=1)
+    collector = MetricsCollector(supervisor, None)
+
+    async def scenario():
+        for _ in range(3):
+            await collector.collect_once()
+
+    asyncio.run(scenario())
+    assert collector.latest(7).cpu_percent < 1.0
+    # Only the first sample counted as activity
+    assert collector.active_at[7] == collector.history(7)[0].timestamp
@@ -0,0 +1,107 @@
+import pytest
+
+import scheduler
+from scheduler import Demand, Migration, NodeLoad, best_fit, estimate_demand, least_loaded, plan_migrations
+
+
+def node(node_id, bots=(), cpu=100.0, memory=1000.0):
+    load = NodeLoad(node_id, cpu, memory)
+    for bot_id, demand, premium in bots:
+        load.add(bot_id, demand, premium)
+    return load
+
+
+# ----------------- DEMAND -----------------
+def test_no_history_no_estimate():
+    assert estimate_demand([], []) is None
+
+
+def test_cpu_at_percentile_memory_at_peak():
+    cpu = list(range(1, 101))
+    demand = estimate_demand(cpu, [10.0, 80.0, 20.0])
+    assert demand.cpu == 96
+    assert demand.memory == 80.0
+
+
+def test_single_sample():
+    assert estimate_demand([7.0], [32.0]) == Demand(7.0, 32.0)
+
+
+# ----------------- NODE LOAD -----------------
+def test_utilization_follows_the_scarcer_resource():
+    load = node("a", [(1, Demand(10.0, 600.0), False)])
+    assert load.utilization() == pytest.approx(0.6)
+    assert load.utilization(50.0, 0.0) == pytest.approx(0.6)
+    assert load.utilization(60.0, 0.0) == pytest.approx(0.7)
+
+
+def test_add_replaces_and_remove_releases():
+    load = node("a")
+    load.add(1, Demand(10.0, 100.0), False)
+    load.add(1, Demand(20.0, 50.0), False)
+    assert (load.cpu, load.memory) == (20.0, 50.0)
+    load.remove(1)
+    load.remove(1)
+    assert (load.cpu, load.memory, load.bots) == (0.0, 0.0, {})
+
+
+def test_headroom_is_kept_for_premium(monkeypatch):
+    monkeypatch.setattr(scheduler, "PREMIUM_HEADROOM", 0.2)
+    load = node("a", [(1, Demand(70.0, 0.0), False)])
+    assert not load.fits(Demand(15.0, 0.0), premium=False)
+    assert load.fits(Demand(15.0, 0.0), premium=True)
+    assert not load.fits(Demand(31.0, 0.0), premium=True)
+    assert not load.fits(Demand(15.0, 0.0), premium=True, ceiling=0.75)
+
+
+# ----------------- PLACEMENT -----------------
+def test_best_fit_picks_the_fullest_node_that_fits():
+    empty = node("empty")
+    half = node("half", [(1, Demand(50.0, 0.0), False)])
+    full = node("full", [(2, Demand(75.0, 0.0), False)])
+    assert best_fit([empty, half, full], Demand(20.0, 0.0), False) is half
+    assert best_fit([empty, half, full], Demand(20.0, 0.0), True) is full
+
+
+def test_best_fit_none_when_nothing_fits():
+    assert best_fit([node("a", [(1, Demand(90.0, 0.0), True)])], Demand(20.0, 0.0), True) is None
+    assert best_fit([], Demand(1.0, 1.0), False) is None
+
+
+def test_least_loaded():
+    busy = node("busy", [(1, Demand(90.0, 0.0), True)])
+    quiet = node("quiet", [(2, Demand(10.0, 0.0), True)])
+    assert least_loaded([busy, quiet], Demand(50.0, 0.0)) is quiet
+    assert least_loaded([], Demand(1.0, 1.0)) is None
+
+
+# ----------------- MIGRATIONS -----------------
+def test_no_migrations_without_hot_nodes():
+    loads = {"a": node("a", [(1, Demand(50.0, 0.0), False)]), "b": node("b")}
+    assert plan_migrations(loads) == []
+
+
+def test_hot_node_sheds_free_bots_biggest_first():
+    hot = node("hot", [(1, Demand(30.0, 0.0), True), (2, Demand(40.0, 0.0), False),
+                       (3, Demand(25.0, 0.0), False)])
+    loads = {"hot": hot, "cold": node("cold")}
+    migrations = plan_migrations(loads, hot=0.9, target=0.75)
+    assert migrations == [Migration(2, "hot", "cold")]
+    assert hot.utilization() == pytest.approx(0.55)
+    assert 2 in loads["cold"].bots
+
+
+def test_migrations_do_not_make_another_node_hot():
+    hot = node("hot", [(1, Demand(60.0, 0.0), False), (2, Demand(35.0, 0.0), False)])
+    warm = node("warm", [(3, Demand(50.0, 0.0), False)])
+    loads = {"hot": hot, "warm": warm}
+    assert plan_migrations(loads, hot=0.9, target=0.75) == []
+    assert warm.utilization() == pytest.approx(0.5)
+
+
+def test_migrations_respect_the_limit():
+    hot = node("hot", [(i, Demand(10.0, 0.0), False) for i in range(10)], cpu=100.0)
+    loads = {"hot": hot, "cold": node("cold", cpu=1000.0)}
+    migrations = plan_migrations(loads, hot=0.9, target=0.1, limit=3)
+    assert len(migrations) == 3
+    assert all(m.source == "hot" and m.target == "cold" for m in migrations)
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from database import AsyncDatabase, Database
+from state_cache import BotRecord, RecordCache, UserRecord
+
+
+# ----------------- RECORD CACHE -----------------
+def test_records_index_like_tuples():
+    record = UserRecord((1, "ann", "Ann"))
+    assert record[0] == 1 and record[-1] is None
+    assert record[:3] == (1, "ann", "Ann")
+    assert record == (1, "ann", "Ann", None, None, None, None, None)
+    assert len(record) == len(UserRecord.__slots__)
+
+
+def test_least_recently_used_is_evicted():
+    cache = RecordCache(size=2)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    cache.get(1)
+    cache.put(3, "c")
+    assert [cache.get(k) for k in (1, 2, 3)] == ["a", None, "c"]
+
+
+def test_expired_entries_miss():
+    cache = RecordCache(ttl=-1)
+    cache.put(1, "a")
+    assert cache.get(1) is None
+    assert cache.entries == {}
+    assert cache.stats() == {"hits": 0, "misses": 1, "entries": 0, "hit_rate": 0}
+
+
+def test_update_patches_the_cached_record_in_place():
+    cache = RecordCache()
+    record = BotRecord((1, 10, "bot", "python", "main.py", None, "stopped"))
+    cache.put(1, record)
+    cache.update(1, status="running")
+    assert record.status == "running"
+    assert cache.get(1)[6] == "running"
+
+
+@pytest.mark.parametrize("write", [
+    lambda cache: cache.invalidate(1),
+    lambda cache: cache.update(1, status="running"),
+    lambda cache: cache.clear(),
+])
+def test_write_during_load_drops_the_stale_fill(write):
+    cache = RecordCache()
+    token = cache.begin_load(1)
+    write(cache)
+    cache.finish_load(1, token, "read before the write")
+    assert cache.get(1) is None
+    assert cache.loading == {}
+
+
+def test_load_after_write_is_kept():
+    cache = RecordCache()
+    cache.invalidate(1)
+    token = cache.begin_load(1)
+    cache.finish_load(1, token, "fresh")
+    assert cache.get(1) == "fresh"
+
+
+# ----------------- WRITE-THROUGH -----------------
+@pytest.fixture
+def db(tmp_path):
+    database = AsyncDatabase(Database(str(tmp_path / "test.db")))
+    yield database
+    database.close()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def stored_user(db, user_id):
+    return tuple(db.sync.get_user(user_id))
+
+
+def stored_bot(db, bot_id):
+    db.sync.writer.flush()
+    return tuple(db.sync.get_bot(bot_id))
+
+
+def test_ban_and_unban_update_the_cached_user(db):
+    async def scenario():
+        await db.add_user(1, "ann", "Ann")
+        await db.get_user(1)
+        await db.ban_user(1)
+        banned = (await db.get_user(1)).is_banned
+        await db.unban_user(1)
+        return banned, (await db.get_user(1)).is_banned
+
+    assert run(scenario()) == (1, 0)
+    assert tuple(run(db.get_user(1))) == stored_user(db, 1)
+    assert db.users.hits >= 2
+
+
+def test_premium_updates_the_cached_user(db):
+    async def scenario():
+        await db.add_user(1, "ann", "Ann")
+        before = (await db.get_user(1)).is_premium
+        await db.set_premium(1, True)
+        return before, (await db.get_user(1)).is_premium
+
+    assert run(scenario()) == (0, 1)
+    assert tuple(run(db.get_user(1))) == stored_user(db, 1)
+
+
+def test_status_reaches_single_and_listed_reads(db):
+    async def scenario():
+        await db.add_user(1, "ann", "Ann")
+        bot_id = await db.add_bot(1, "echo", "python", "main.py")
+        await db.get_user_bots(1)
+        await db.update_bot_status(bot_id, "running", "container-1")
+        return bot_id, await db.get_bot(bot_id), await db.get_user_bots(1)
+
+    bot_id, bot, listed = run(scenario())
+    assert (bot.status, bot.container_id) == ("running", "container-1")
+    assert listed == [bot]
+    # last_active is stamped separately by the cache and the write-behind queue
+    assert bot[:8] == stored_bot(db, bot_id)[:8]
+
+
+def test_new_bot_shows_up_in_cached_listing(db):
+    async def scenario():
+        await db.add_user(1, "ann", "Ann")
+        await db.get_user_bots(1)
+        first = (await db.get_user(1)).total_bots
+        await db.add_bot(1, "echo", "python", "main.py")
+        return first, (await db.get_user(1)).total_bots, await db.get_user_bots(1)
+
+    before, after, listed = run(scenario())
+    assert (before, after) == (0, 1)
+    assert [bot.bot_name for bot in listed] == ["echo"]
+
+
+def test_delete_drops_the_bot_and_refreshes_its_owner(db):
+    async def scenario():
+        await db.add_user(1, "ann", "Ann")
+        keep = await db.add_bot(1, "keep", "python", "keep.py")
+        gone = await db.add_bot(1, "gone", "python", "gone.py")
+        await db.get_bot(gone)
+        await db.get_user_bots(1)
+        await db.get_user(1)
+        await db.delete_bot(gone)
+        return keep, await db.get_bot(gone), await db.get_user_bots(1), await db.get_user(1)
+
+    keep, deleted, listed, user = run(scenario())
+    assert deleted is None
+    assert [bot.bot_id for bot in listed] == [keep]
+    assert tuple(user) == stored_user(db, 1)
@@ -0,0 +1,134 @@
+import asyncio
+
+import supervisor
+from supervisor import ProcessSupervisor
+
+
+class FakeProcess:
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.returncode = None
+        self._exited = asyncio.Event()
+
+    def exit(self, code: int = 1):
+        self.returncode = code
+        self._exited.set()
+
+    async def wait(self):
+        await self._exited.wait()
+        return self.returncode
+
+
+class FakeRuntime:
+    name = "fake"
+
+    def __init__(self):
+        self.spawned = []
+        self.released = 0
+
+    async def spawn(self, proc):
+        proc.process = FakeProcess(len(self.spawned) + 1)
+        proc.pump = asyncio.create_task(asyncio.sleep(0))
+        self.spawned.append(proc.process)
+
+    async def signal(self, proc, sig):
+        proc.process.exit(-sig)
+
+    async def release(self, proc):
+        self.released += 1
+
+
+class FakeLogStore:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_bot(tmp_path):
+    main = tmp_path / "main.py"
+    main.write_text("")
+    return str(main)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_start_refused_during_restart_backoff(tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, "RESTART_BACKOFF_BASE", 0.05)
+    main = make_bot(tmp_path)
+
+    async def scenario():
+        runtime = FakeRuntime()
+        sup = ProcessSupervisor(runtime=runtime)
+        assert (await sup.start(1, "python", main, FakeLogStore()))["success"]
+        runtime.spawned[0].exit()
+        await asyncio.sleep(0.01)
+        assert not sup.is_running(1)
+        assert sup.is_supervised(1)
+
+        result = await sup.start(1, "python", main, FakeLogStore())
+        assert not result["success"]
+
+        await asyncio.sleep(0.1)
+        assert len(runtime.spawned) == 2
+        await sup.stop(1)
+        assert all(p.returncode is not None for p in runtime.spawned)
+        assert not sup.processes
+
+    run(scenario())
+
+
+def test_superseded_watcher_does_not_respawn(tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, "RESTART_BACKOFF_BASE", 0.05)
+    main = make_bot(tmp_path)
+
+    async def scenario():
+        runtime = FakeRuntime()
+        sup = ProcessSupervisor(runtime=runtime)
+        await sup.start(1, "python", main, FakeLogStore())
+        old = sup.processes[1]
+        runtime.spawned[0].exit()
+        await asyncio.sleep(0.01)
+        # Replaced behind the supervisor's back while the old watcher sleeps
+        sup.processes.pop(1)
+        await sup.start(1, "python", main, FakeLogStore())
+
+        await asyncio.sleep(0.1)
+        assert old.watcher.done()
+        assert len(runtime.spawned) == 2
+        await sup.stop(1)
+        assert all(p.returncode is not None for p in runtime.spawned)
+
+    run(scenario())
+
+
+def test_give_up_releases_and_closes_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, "RESTART_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(supervisor, "MAX_RESTARTS", 2)
+    main = make_bot(tmp_path)
+    statuses = []
+
+    async def on_status(bot_id, status):
+        statuses.append(status)
+
+    async def scenario():
+        runtime = FakeRuntime()
+        sup = ProcessSupervisor(on_status=on_status, runtime=runtime)
+        store = FakeLogStore()
+        await sup.start(1, "python", main, store)
+        for _ in range(3):
+            runtime.spawned[-1].exit()
+            await asyncio.sleep(0.02)
+
+        assert statuses[-1] == "crashed"
+        assert len(runtime.spawned) == 3
+        assert not sup.is_supervised(1)
+        assert runtime.released == 1
+        assert store.closed
+        assert (await sup.start(1, "python", main, FakeLogStore()))["success"]
+        await sup.stop(1)
+
+    run(scenario())
@@ -0,0 +1,101 @@
+import sys
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import validator
+from validator import CheckerUnavailable, NodeSyntaxChecker, SyntaxValidator
+
+needs_node = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+@pytest.fixture
+def checker():
+    checker = NodeSyntaxChecker(timeout=10)
+    yield checker
+    checker.close()
+
+
+def test_validate_python():
+    assert SyntaxValidator.validate_python("x = 1\n")["valid"]
+    result = SyntaxValidator.validate_python("def f(:\n")
+    assert not result["valid"]
+    assert result["errors"][0]["line"] == 1
+
+
+@needs_node
+def test_valid_and_invalid_javascript(checker):
+    assert checker.check("const x = 1;\nmodule.exports = x;\n") == {"valid": True, "errors": []}
+    assert checker.check("import fs from 'fs';\nexport default fs;\n")["valid"]
+    result = checker.check("const x = ;\n")
+    assert not result["valid"]
+    assert result["errors"][0]["line"] == 1
+
+
+@needs_node
+def test_concurrent_large_sources_do_not_deadlock(checker):
+    # Requests and error replies (which quote the failing line) are each bigger than a pipe buffer
+    big = "let a = 0;\n" + "a += 1;\n" * 20000
+    broken = "let b = [" + "1, " * 40000 + ";\n"
+    sources = [big if i % 2 else broken for i in range(64)]
+    done = threading.Event()
+
+    def run():
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(checker.check, sources))
+        done.set()
+        return results
+
+    worker = ThreadPoolExecutor(1).submit(run)
+    assert done.wait(30), "syntax checker deadlocked"
+    results = worker.result()
+    assert [r["valid"] for r in results] == [bool(i % 2) for i in range(64)]
+
+
+@needs_node
+def test_worker_is_replaced_after_it_dies(checker):
+    assert checker.check("1;")["valid"]
+    checker._proc.kill()
+    checker._proc.wait()
+    try:
+        assert checker.check("2;")["valid"]
+    except CheckerUnavailable:
+        # The write raced the exit; the next request gets a fresh worker
+        assert checker.check("2;")["valid"]
+
+
+# Answers every request with a reply bigger than a pipe buffer and, unlike node,
+# writes it blocking: while its stdout is full it reads nothing from stdin
+SLOW_READER_WORKER = """
+import sys, json
+for line in sys.stdin:
+    request = json.loads(line)
+    sys.stdout.write(json.dumps({"id": request["id"], "valid": True, "pad": "x" * 200000}) + "\\n")
+    sys.stdout.flush()
+"""
+
+
+def test_blocking_worker_does_not_deadlock_writers(tmp_path, monkeypatch):
+    script = tmp_path / "worker.py"
+    script.write_text(SLOW_READER_WORKER)
+    real_popen = validator.subprocess.Popen
+    monkeypatch.setattr(validator.subprocess, "Popen",
+                        lambda cmd, **kwargs: real_popen([sys.executable, str(script)], **kwargs))
+    checker = NodeSyntaxChecker(timeout=20)
+    sources = ["x" * 100000] * 32
+    done = threading.Event()
+
+    def run():
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(checker.check, sources))
+        done.set()
+        return results
+
+    try:
+        worker = ThreadPoolExecutor(1).submit(run)
+        assert done.wait(30), "syntax checker deadlocked"
+        assert all(r["valid"] for r in worker.result())
+    finally:
+        checker.close()
@@ -0,0 +1,66 @@
+import json
+import asyncio
+
+from aiohttp.test_utils import make_mocked_request
+from telegram.ext import (Application, CallbackQueryHandler, CommandHandler, ConversationHandler,
+                          MessageHandler, filters)
+
+from webhook import SECRET_HEADER, WebhookServer, allowed_updates
+
+
+async def noop(update, context):
+    pass
+
+
+def make_application():
+    return Application.builder().token("123:TEST").build()
+
+
+def test_allowed_updates_follow_registered_handlers():
+    application = make_application()
+    application.add_handler(CommandHandler("start", noop))
+    application.add_handler(CallbackQueryHandler(noop))
+    assert allowed_updates(application) == ["callback_query", "edited_message", "message"]
+
+
+def test_allowed_updates_look_inside_conversations():
+    application = make_application()
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler("upload", noop)],
+        states={1: [MessageHandler(filters.Document.ALL, noop)]},
+        fallbacks=[],
+    ))
+    assert "channel_post" in allowed_updates(application)
+    assert "callback_query" not in allowed_updates(application)
+
+
+class FakeApplication:
+    bot = None
+
+    def __init__(self):
+        self.update_queue = asyncio.Queue()
+
+
+def post(body, secret):
+    payload = json.dumps(body).encode()
+    request = make_mocked_request("POST", "/", headers={SECRET_HEADER: secret, "Content-Type": "application/json"})
+
+    async def read_json():
+        return json.loads(payload)
+
+    request.json = read_json
+    return request
+
+
+def test_webhook_rejects_wrong_secret_and_queues_updates():
+    application = FakeApplication()
+    server = WebhookServer(application, secret="right")
+
+    async def scenario():
+        denied = await server.handle(post({"update_id": 1}, "wrong"))
+        accepted = await server.handle(post({"update_id": 2}, "right"))
+        return denied.status, accepted.status
+
+    assert asyncio.run(scenario()) == (403, 200)
+    assert application.update_queue.get_nowait().update_id == 2
+    assert application.update_queue.empty()
@@ -0,0 +1,177 @@
+import struct
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# ----------------- CONFIG -----------------
+MINUTE_SLOTS = 120   # 2 hours of 1-minute buckets
+HOUR_SLOTS = 168     # 7 days of 1-hour buckets
+# Values are stored as unsigned 16-bit fixed point to keep each bot's history at ~4.5 KB
+CPU_SCALE = 100      # 0.01 % steps, up to 655 %
+MEM_SCALE = 10       # 0.1 MB steps, up to 6.5 GB
+FIELDS = 6           # cpu min/avg/max, mem min/avg/max
+BLOB_VERSION = 1
+
+Bucket = Tuple[int, float, float, float, float, float, float]
+
+
+def _pack(value: float, scale: int) -> int:
+    return max(0, min(65535, int(round(value * scale))))
+
+
+# ----------------- RING OF BUCKETS -----------------
+class Series:
+    """Fixed-size ring of (min, avg, max) buckets at one resolution."""
+
+    __slots__ = ("width", "slots", "values", "stamps", "open_start", "count",
+                 "cpu_sum", "cpu_min", "cpu_max", "mem_sum", "mem_min", "mem_max")
+
+    def __init__(self, width: int, slots: int):
+        self.width = width
+        self.slots = slots
+        self.values = array("H", bytes(2 * slots * FIELDS))
+        self.stamps = array("I", bytes(4 * slots))
+        self.open_start = 0
+        self.count = 0
+
+    def add(self, ts: float, cpu: float, mem: float):
+        start = int(ts) - int(ts) % self.width
+        if start != self.open_start:
+            self.commit()
+            self.open_start = start
+            self.count = 0
+            self.cpu_sum = self.mem_sum = 0.0
+            self.cpu_min = self.mem_min = float("inf")
+            self.cpu_max = self.mem_max = 0.0
+        self.count += 1
+        self.cpu_sum += cpu
+        self.mem_sum += mem
+        self.cpu_min = min(self.cpu_min, cpu)
+        self.cpu_max = max(self.cpu_max, cpu)
+        self.mem_min = min(self.mem_min, mem)
+        self.mem_max = max(self.mem_max, mem)
+
+    def _open_bucket(self) -> Optional[Bucket]:
+        if not self.count:
+            return None
+        return (self.open_start, self.cpu_min, self.cpu_sum / self.count, self.cpu_max,
+                self.mem_min, self.mem_sum / self.count, self.mem_max)
+
+    def commit(self):
+        # Writes the open bucket into its ring slot; safe to repeat as the bucket fills
+        bucket = self._open_bucket()
+        if bucket is None:
+            return
+        slot = (bucket[0] // self.width) % self.slots
+        self.stamps[slot] = bucket[0]
+        base = slot * FIELDS
+        for i, scale in enumerate((CPU_SCALE,) * 3 + (MEM_SCALE,) * 3):
+            self.values[base + i] = _pack(bucket[1 + i], scale)
+
+    def range(self, since: float, until: float) -> List[Bucket]:
+        # Index arithmetic over the ring; no raw samples are scanned
+        out = []
+        for slot in range(self.slots):
+            start = self.stamps[slot]
+            if start and since <= start + self.width and start <= until:
+                base = slot * FIELDS
+                v = self.values[base:base + FIELDS]
+                out.append((start, v[0] / CPU_SCALE, v[1] / CPU_SCALE, v[2] / CPU_SCALE,
+                            v[3] / MEM_SCALE, v[4] / MEM_SCALE, v[5] / MEM_SCALE))
+        bucket = self._open_bucket()
+        if bucket and since <= bucket[0] + self.width and bucket[0] <= until:
+            out = [b for b in out if b[0] != bucket[0]] + [bucket]
+        out.sort()
+        return out
+
+
+class BotSeries:
+    __slots__ = ("minutes", "hours", "dirty")
+
+    def __init__(self):
+        self.minutes = Series(60, MINUTE_SLOTS)
+        self.hours = Series(3600, HOUR_SLOTS)
+        self.dirty = False
+
+    def add(self, ts: float, cpu: float, mem: float):
+        self.minutes.add(ts, cpu, mem)
+        self.hours.add(ts, cpu, mem)
+        self.dirty = True
+
+    def to_blob(self) -> bytes:
+        parts = [struct.pack("<BHH", BLOB_VERSION, MINUTE_SLOTS, HOUR_SLOTS)]
+        for series in (self.minutes, self.hours):
+            series.commit()
+            parts.append(series.stamps.tobytes())
+            parts.append(series.values.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_blob(cls, blob: bytes) -> Optional["BotSeries"]:
+        version, minute_slots, hour_slots = struct.unpack_from("<BHH", blob)
+        if (version, minute_slots, hour_slots) != (BLOB_VERSION, MINUTE_SLOTS, HOUR_SLOTS):
+            return None
+        series = cls()
+        offset = struct.calcsize("<BHH")
+        for ring in (series.minutes, series.hours):
+            stamps_len = ring.stamps.itemsize * ring.slots
+            values_len = ring.values.itemsize * ring.slots * FIELDS
+            ring.stamps = array("I", blob[offset:offset + stamps_len])
+            offset += stamps_len
+            ring.values = array("H", blob[offset:offset + values_len])
+            offset += values_len
+        return series
+
+
+# ----------------- STORE -----------------
+class TimeSeriesStore:
+    """Per-bot CPU/memory history rolled up into 1-minute and 1-hour buckets."""
+
+    def __init__(self):
+        self.series: Dict[int, BotSeries] = {}
+
+    def record(self, bot_id: int, ts: float, cpu: float, mem: float):
+        series = self.series.get(bot_id)
+        if series is None:
+            series = self.series[bot_id] = BotSeries()
+        series.add(ts, cpu, mem)
+
+    def query(self, bot_id: int, since: float, until: float = None) -> List[Bucket]:
+        series = self.series.get(bot_id)
+        if series is None:
+            return []
+        until = until or time.time()
+        # Minute buckets while they still cover the window, hour buckets beyond that
+        ring = series.minutes if since >= until - MINUTE_SLOTS * 60 else series.hours
+        return ring.range(since, until)
+
+    def forget(self, bot_id: int):
+        self.series.pop(bot_id, None)
+
+    def dirty_blobs(self) -> List[Tuple[int, bytes]]:
+        rows = []
+        for bot_id, series in self.series.items():
+            if series.dirty:
+                rows.append((bot_id, series.to_blob()))
+                series.dirty = False
+        return rows
+
+    def load(self, rows):
+        for bot_id, blob in rows:
+            series = BotSeries.from_blob(blob)
+            if series is not None:
+                self.series[bot_id] = series
+
+
+def sparkline(values: List[float], width: int = 24) -> str:
+    if not values:
+        return ""
+    if len(values) > width:
+        # Average neighbouring buckets down to the display width
+        step = len(values) / width
+        values = [sum(chunk) / len(chunk) for chunk in
+                  (values[int(i * step):int((i + 1) * step)] or values[int(i * step):int(i * step) + 1]
+                   for i in range(width))]
+    blocks = "▁▂▃▄▅▆▇█"
+    top = max(values) or 1
+    return "".join(blocks[min(len(blocks) - 1, int(v / top * (len(blocks) - 1)))] for v in values)
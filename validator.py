@@ -0,0 +1,273 @@
+import os
+import ast
+import json
+import asyncio
+import itertools
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, TimeoutError as FutureTimeout
+from typing import List, Dict, Optional, Tuple
+
+from imports import extract_imports
+
+# ----------------- CONFIG -----------------
+# Bump when validation or requirement extraction changes, so stale verdicts are ignored
+VALIDATOR_VERSION = 3
+VALIDATION_MEMORY_ENTRIES = 1024
+JS_WORKER_SCRIPT = Path(__file__).with_name("js_syntax_worker.js")
+JS_CHECK_TIMEOUT = 5
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", str(os.cpu_count() or 2)))
+SOURCE_SUFFIXES = {".py": "python", ".js": "javascript", ".mjs": "javascript", ".cjs": "javascript"}
+
+
+class CheckerUnavailable(Exception):
+    pass
+
+
+# ----------------- NODE SYNTAX WORKER -----------------
+class NodeSyntaxChecker:
+    """One long-lived node process that syntax-checks JavaScript sent over stdin.
+
+    Requests are pipelined, so any number of threads can check at once. A crashed
+    worker is replaced on the next request; a request that times out kills it, since
+    a stuck compile would hold up everything queued behind it.
+    """
+
+    def __init__(self, timeout: float = JS_CHECK_TIMEOUT):
+        self.timeout = timeout
+        self._proc: Optional[subprocess.Popen] = None
+        self._pending: Dict[int, Tuple[subprocess.Popen, Future]] = {}
+        self._ids = itertools.count()
+        # _lock guards the worker and the pending table and is never held across I/O, so
+        # the reader can always resolve replies; _write_lock keeps requests whole on stdin
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _ensure_worker(self) -> subprocess.Popen:
+        if self._proc and self._proc.poll() is None:
+            return self._proc
+        self._proc = subprocess.Popen(
+            ["node", "--experimental-vm-modules", "--no-warnings", str(JS_WORKER_SCRIPT)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", bufsize=1
+        )
+        threading.Thread(target=self._read, args=(self._proc,), name="js-syntax-reader", daemon=True).start()
+        return self._proc
+
+    def _read(self, proc: subprocess.Popen):
+        for line in proc.stdout:
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                continue
+            with self._lock:
+                entry = self._pending.pop(reply.get("id"), None)
+            if entry:
+                entry[1].set_result(reply)
+        # The worker is gone: fail whatever it still owed
+        with self._lock:
+            orphaned = [rid for rid, (owner, _) in self._pending.items() if owner is proc]
+            futures = [self._pending.pop(rid)[1] for rid in orphaned]
+        for future in futures:
+            future.set_exception(CheckerUnavailable("node syntax worker exited"))
+
+    def _kill(self, proc: subprocess.Popen):
+        with self._lock:
+            if self._proc is proc:
+                self._proc = None
+        proc.kill()
+
+    def check(self, code: str) -> Dict[str, any]:
+        future = Future()
+        with self._lock:
+            try:
+                proc = self._ensure_worker()
+            except OSError as e:
+                raise CheckerUnavailable(str(e))
+            rid = next(self._ids)
+            self._pending[rid] = (proc, future)
+        # A worker stuck compiling stops reading stdin; killing it unblocks the write
+        watchdog = threading.Timer(self.timeout, self._kill, (proc,))
+        watchdog.start()
+        try:
+            with self._write_lock:
+                proc.stdin.write(json.dumps({"id": rid, "code": code}) + "\n")
+                proc.stdin.flush()
+        except (OSError, ValueError) as e:
+            with self._lock:
+                self._pending.pop(rid, None)
+            raise CheckerUnavailable(str(e))
+        finally:
+            watchdog.cancel()
+        try:
+            reply = future.result(self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._pending.pop(rid, None)
+            self._kill(proc)
+            return {"valid": False, "errors": [{"message": f"Syntax check timed out after {self.timeout}s"}]}
+        if reply.get("valid"):
+            return {"valid": True, "errors": []}
+        return {"valid": False, "errors": [reply.get("error") or {"message": "Invalid JavaScript"}]}
+
+    def close(self):
+        with self._lock:
+            proc, self._proc = self._proc, None
+        if proc:
+            proc.stdin.close()
+            try:
+                proc.wait(1)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+# ----------------- SYNTAX VALIDATOR -----------------
+class SyntaxValidator:
+    def __init__(self, js_checker: Optional[NodeSyntaxChecker] = None):
+        self.js_checker = js_checker
+
+    @staticmethod
+    def validate_python(code: str) -> Dict[str, any]:
+        try:
+            ast.parse(code)
+            return {"valid": True, "errors": []}
+        except SyntaxError as e:
+            return {
+                "valid": False,
+                "errors": [{
+                    "line": e.lineno,
+                    "offset": e.offset,
+                    "message": e.msg,
+                    "text": e.text
+                }]
+            }
+
+    def validate_javascript(self, code: str) -> Dict[str, any]:
+        if self.js_checker:
+            try:
+                return self.js_checker.check(code)
+            except CheckerUnavailable:
+                # Worker died mid-request; a one-off node --check still gives an answer
+                pass
+        try:
+            # Unique name: validations now run concurrently in worker threads
+            with tempfile.NamedTemporaryFile('w', suffix='.js', delete=False) as f:
+                f.write(code)
+                temp_file = f.name
+            try:
+                result = subprocess.run(
+                    ['node', '--check', temp_file],
+                    capture_output=True, text=True, timeout=5
+                )
+            finally:
+                os.remove(temp_file)
+            if result.returncode == 0:
+                return {"valid": True, "errors": []}
+            else:
+                return {"valid": False, "errors": [{"message": result.stderr}]}
+        except Exception as e:
+            return {"valid": False, "errors": [{"message": str(e)}]}
+
+
+# ----------------- POOL WORKERS -----------------
+def _read_source(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except UnicodeDecodeError:
+        return None
+
+
+def analyse_python_file(path: str):
+    """Runs in a pool process: parse one file and list its imports."""
+    code = _read_source(path)
+    if code is None:
+        return {"valid": False, "errors": [{"message": "File is not valid UTF-8"}]}, []
+    return SyntaxValidator.validate_python(code), extract_imports(code, "python")
+
+
+# ----------------- VALIDATION CACHE -----------------
+class ValidationCache:
+    """LRU of validation verdicts keyed by (source sha256, language).
+
+    A small in-memory LRU sits in front of the validation_cache table, so a re-upload
+    of known source never parses it or starts node. Misses are parsed in `pool`
+    (a process pool) for Python and through the node worker for JavaScript, so a
+    large parse never holds the GIL the event loop needs.
+    """
+
+    def __init__(self, database, validator: SyntaxValidator, pool: Optional[Executor] = None,
+                 size: int = VALIDATION_MEMORY_ENTRIES):
+        self.db = database
+        self.validator = validator
+        self.pool = pool
+        self.size = size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(sha256: str, language: str) -> Tuple[str, str]:
+        return sha256, f"{language}:{VALIDATOR_VERSION}"
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def _analyse_javascript_file(self, path: str):
+        code = _read_source(path)
+        if code is None:
+            return {"valid": False, "errors": [{"message": "File is not valid UTF-8"}]}, []
+        return self.validator.validate_javascript(code), extract_imports(code, "javascript")
+
+    async def validate_file(self, path: Path, language: str,
+                            sha256: str) -> Tuple[Dict[str, any], List[str]]:
+        """Return (validation, imports) for one source file, from cache when possible."""
+        key = self._key(sha256, language)
+        cached = self.entries.get(key)
+        if cached is None:
+            row = await self.db.get_validation(*key)
+            if row:
+                cached = (json.loads(row[0]), json.loads(row[1]))
+        if cached is not None:
+            self.hits += 1
+            self._remember(key, cached)
+            return cached
+
+        self.misses += 1
+        if language == "python":
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.pool, analyse_python_file, str(path))
+        else:
+            result = await asyncio.to_thread(self._analyse_javascript_file, str(path))
+        self._remember(key, result)
+        await self.db.save_validation(*key, json.dumps(result[0]), json.dumps(result[1]))
+        return result
+
+    async def validate_archive(self, files, root: Path,
+                               language: str) -> Tuple[Dict[str, any], Dict[Path, List[str]]]:
+        """Validate every source file of an extracted archive in parallel and merge the verdicts.
+
+        `files` are the IngestedFile entries from extraction. Returns the merged
+        validation and the imports of each file in the bot's own `language`.
+        """
+        sources = [(f, SOURCE_SUFFIXES[f.path.suffix]) for f in files
+                   if f.path.suffix in SOURCE_SUFFIXES and "node_modules" not in f.path.parts]
+        results = await asyncio.gather(*(self.validate_file(f.path, lang, f.sha256) for f, lang in sources))
+        errors, imports = [], {}
+        for (f, lang), (validation, specs) in zip(sources, results):
+            for error in validation["errors"]:
+                errors.append({**error, "file": f.path.relative_to(root).as_posix()})
+            if lang == language:
+                imports[f.path] = specs
+        return {"valid": not errors, "errors": errors, "files": len(sources)}, imports
+
+    def stats(self) -> Dict[str, int]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                "hit_rate": round(100 * self.hits / total) if total else 0}
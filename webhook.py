@@ -0,0 +1,126 @@
+import os
+import hmac
+import signal
+import asyncio
+import logging
+import secrets
+from typing import List, Set
+from urllib.parse import urlsplit
+
+from aiohttp import web
+from telegram import Update
+from telegram.constants import UpdateType
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler
+
+logger = logging.getLogger(__name__)
+
+# ----------------- CONFIG -----------------
+# Public https URL Telegram posts to; TLS is terminated by the proxy in front of us.
+# Leave empty to long-poll instead.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Without a configured secret a fresh one is registered on every start
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+# Updates are small JSON documents; anything bigger is not from Telegram
+MAX_UPDATE_BYTES = 1024 * 1024
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Update types each handler class can match
+MESSAGE_UPDATES = {UpdateType.MESSAGE, UpdateType.EDITED_MESSAGE,
+                   UpdateType.CHANNEL_POST, UpdateType.EDITED_CHANNEL_POST}
+HANDLER_UPDATES = {
+    CommandHandler: {UpdateType.MESSAGE, UpdateType.EDITED_MESSAGE},
+    MessageHandler: MESSAGE_UPDATES,
+    CallbackQueryHandler: {UpdateType.CALLBACK_QUERY},
+}
+
+
+# ----------------- ALLOWED UPDATES -----------------
+def _handler_updates(handler) -> Set[str]:
+    if isinstance(handler, ConversationHandler):
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        return set().union(*(_handler_updates(h) for h in nested))
+    for handler_type, updates in HANDLER_UPDATES.items():
+        if isinstance(handler, handler_type):
+            return set(updates)
+    # A handler we can't reason about gets everything rather than silently nothing
+    return set(Update.ALL_TYPES)
+
+
+def allowed_updates(application: Application) -> List[str]:
+    """The update types some registered handler can actually use, for getUpdates/setWebhook."""
+    wanted: Set[str] = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            wanted |= _handler_updates(handler)
+    return sorted(str(update_type) for update_type in wanted)
+
+
+# ----------------- WEBHOOK SERVER -----------------
+class WebhookServer:
+    """aiohttp ingress that hands verified updates to the application's update queue."""
+
+    def __init__(self, application: Application, listen: str = WEBHOOK_LISTEN,
+                 port: int = WEBHOOK_PORT, path: str = "/", secret: str = WEBHOOK_SECRET):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            return web.Response(status=400)
+        # Answer straight away; handlers run off the queue like they do when polling
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def start(self):
+        app = web.Application(client_max_size=MAX_UPDATE_BYTES)
+        app.router.add_post(self.path, self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.listen, self.port).start()
+        logger.info(f"Webhook listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+async def serve_webhook(application: Application, url: str = WEBHOOK_URL, **kwargs):
+    """Run the application on a webhook until SIGINT/SIGTERM, like run_polling does for polling.
+
+    The webhook is left registered on exit so Telegram holds updates until the next start.
+    """
+    server = WebhookServer(application, path=urlsplit(url).path or "/", **kwargs)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+        await application.bot.set_webhook(url, secret_token=server.secret,
+                                          allowed_updates=allowed_updates(application))
+        await stop.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
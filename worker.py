@@ -0,0 +1,157 @@
+import os
+import signal
+import socket
+import asyncio
+import logging
+import secrets
+from pathlib import Path
+from typing import Dict
+
+import httpx
+import psutil
+from aiohttp import web
+
+from cluster import CLUSTER_SECRET, HEARTBEAT_INTERVAL, RPC_TIMEOUT, TOKEN_HEADER, authorized
+from log_store import BotLogStore
+from metrics import MetricsCollector
+from supervisor import ProcessSupervisor, make_runtime
+
+# ----------------- CONFIG -----------------
+NODE_ID = os.getenv("NODE_ID") or socket.gethostname()
+WORKER_LISTEN = os.getenv("WORKER_LISTEN", "127.0.0.1")
+WORKER_PORT = int(os.getenv("WORKER_PORT", "8090"))
+# Address the control plane uses to reach this worker
+WORKER_URL = os.getenv("WORKER_URL") or f"http://{WORKER_LISTEN}:{WORKER_PORT}"
+CONTROL_URL = os.getenv("CONTROL_URL", "http://127.0.0.1:8081").rstrip("/")
+BOT_RUNTIME = os.getenv("BOT_RUNTIME", "process")
+# What this node offers to bots, for load-aware placement; defaults to the whole machine
+NODE_CPU_CAPACITY = float(os.getenv("NODE_CPU_CAPACITY", str((psutil.cpu_count() or 1) * 100)))
+NODE_MEMORY_CAPACITY = float(os.getenv("NODE_MEMORY_CAPACITY", str(psutil.virtual_memory().total // (1024 * 1024))))
+
+# ----------------- LOGGING -----------------
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+# ----------------- WORKER AGENT -----------------
+class WorkerAgent:
+    """Runs the bots the control plane places on this node and reports on them."""
+
+    def __init__(self, node_id: str = NODE_ID, url: str = WORKER_URL, control_url: str = CONTROL_URL,
+                 secret: str = CLUSTER_SECRET):
+        self.node_id = node_id
+        self.url = url
+        self.control_url = control_url
+        self.secret = secret
+        # A fresh boot id tells the control plane this process starts with no bots
+        self.boot = secrets.token_hex(8)
+        self.supervisor = ProcessSupervisor(on_status=self._on_status, runtime=make_runtime(BOT_RUNTIME))
+        self.metrics = MetricsCollector(self.supervisor, None, interval=HEARTBEAT_INTERVAL)
+        self.statuses: Dict[int, str] = {}
+        self.client = httpx.AsyncClient(timeout=RPC_TIMEOUT, headers={TOKEN_HEADER: secret})
+        self._runner = None
+        self._heartbeats = None
+
+    async def _post(self, path: str, payload: dict):
+        try:
+            response = await self.client.post(self.control_url + path, json=payload)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning(f"Control plane unreachable ({path}): {e}")
+
+    async def _on_status(self, bot_id: int, status: str):
+        if status in ("running", "restarting"):
+            self.statuses[bot_id] = status
+        else:
+            self.statuses.pop(bot_id, None)
+        await self._post("/cluster/status", {"node_id": self.node_id, "bot_id": bot_id, "status": status})
+
+    def _report(self) -> dict:
+        bots = {}
+        for bot_id in self.supervisor.processes:
+            sample = self.metrics.latest(bot_id)
+            bots[bot_id] = {
+                "status": self.statuses.get(bot_id, "running"),
+                "cpu": sample.cpu_percent if sample else None,
+                "memory": sample.memory_mb if sample else None,
+                "uptime": sample.uptime if sample else None,
+                "net": sample.net_sent if sample else None,
+            }
+        return {"node_id": self.node_id, "url": self.url, "boot": self.boot, "bots": bots,
+                "capacity": {"cpu": NODE_CPU_CAPACITY, "memory": NODE_MEMORY_CAPACITY}}
+
+    async def _heartbeat_loop(self):
+        while True:
+            await self._post("/cluster/heartbeat", self._report())
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    # ----------------- HTTP HANDLERS -----------------
+    async def _start(self, request: web.Request) -> web.Response:
+        if not authorized(request, self.secret):
+            return web.Response(status=403)
+        bot_id = int(request.match_info["bot_id"])
+        data = await request.json()
+        if self.supervisor.is_supervised(bot_id):
+            # A heartbeat sent just before the bot started reported it missing, and the
+            # control plane is starting it again
+            return web.json_response({"success": True, "message": "Bot already running"})
+        premium = bool(data.get("premium"))
+        store = BotLogStore(Path(data["file_path"]).parent, premium=premium)
+        result = await self.supervisor.start(bot_id, data["bot_type"], data["file_path"],
+                                             log_store=store, premium=premium)
+        if result["success"]:
+            self.statuses[bot_id] = "running"
+        else:
+            store.close()
+        return web.json_response(result)
+
+    async def _stop(self, request: web.Request) -> web.Response:
+        if not authorized(request, self.secret):
+            return web.Response(status=403)
+        bot_id = int(request.match_info["bot_id"])
+        self.statuses.pop(bot_id, None)
+        return web.json_response(await self.supervisor.stop(bot_id))
+
+    # ----------------- LIFECYCLE -----------------
+    async def start(self):
+        await self.supervisor.startup()
+        self.metrics.start()
+        app = web.Application()
+        app.router.add_post("/bots/{bot_id:\\d+}/start", self._start)
+        app.router.add_post("/bots/{bot_id:\\d+}/stop", self._stop)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, WORKER_LISTEN, WORKER_PORT).start()
+        self._heartbeats = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"Worker {self.node_id} listening on {WORKER_LISTEN}:{WORKER_PORT}, control at {self.control_url}")
+
+    async def stop(self):
+        self._heartbeats.cancel()
+        await asyncio.gather(self._heartbeats, return_exceptions=True)
+        # Bots stop before we leave, so they never run on two nodes at once
+        await self.supervisor.shutdown()
+        await self._post("/cluster/leave", {"node_id": self.node_id})
+        await self.metrics.stop()
+        await self._runner.cleanup()
+        await self.client.aclose()
+
+
+async def main():
+    if not CLUSTER_SECRET:
+        raise SystemExit("CLUSTER_SECRET must be set")
+    agent = WorkerAgent()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await agent.start()
+    try:
+        await stop.wait()
+    finally:
+        await agent.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())